@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import click
+import rpt_dosi.db_catalog as rdbc
+
+CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('catalog_file', type=click.Path(), required=True)
+@click.option('--scan', "-s", multiple=True, type=click.Path(exists=True),
+              help='Folder to scan for db files (several allowed)')
+@click.option('--pattern', default="**/db.json", help='Pattern of the db files in the scanned folders')
+@click.option('--workers', "-j", default=None, type=int, help='Number of parallel workers for the scan')
+@click.option('--image_type', "-i", multiple=True, help='Timepoints with this image type (several allowed)')
+@click.option('--roi', "-r", multiple=True, help='Timepoints with this roi (several allowed)')
+@click.option('--cycle_id', "-c", default=None, help='Timepoints of this cycle')
+@click.option('--patient_id', "-p", default=None, help='Timepoints of this patient')
+def go(catalog_file, scan, pattern, workers, image_type, roi, cycle_id, patient_id):
+    """
+    Index many db files in a catalog (sqlite file) and query the timepoints.
+    Example: rpt_db_catalog catalog.sqlite -s patients -i SPECT -r liver -c cycle1
+    """
+    catalog = rdbc.CohortCatalog(catalog_file)
+    catalog.max_workers = workers
+    if scan:
+        n = catalog.scan(scan, pattern)
+        print(f'Catalog: {n} db files (re)indexed, {catalog.number_of_dbs()} db files')
+        for e in catalog.errors():
+            print(f'Cannot read {e.db_path}: {e.error}')
+    tps = catalog.query_timepoints(image_type, roi, cycle_id, patient_id)
+    for tp in tps:
+        print(f'{tp.patient_id} {tp.cycle_id} {tp.timepoint_id} '
+              f'{tp.acquisition_datetime} {tp.db_path}')
+    print(f'{len(tps)} timepoints')
+
+
+if __name__ == "__main__":
+    go()
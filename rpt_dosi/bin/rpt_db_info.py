@@ -3,6 +3,7 @@
 
 import click
 import rpt_dosi.db as rdb
+import rpt_dosi.db_check as rdbck
 import rpt_dosi.utils as rhe
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
@@ -11,12 +12,14 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.argument('db_files', type=click.Path(exists=True), required=True, nargs=-1)
 @click.option('--check', "-c", is_flag=True, help='Check folders, files etc')
+@click.option('--checksum', is_flag=True, help='With --check, also verify the recorded checksums of the files')
+@click.option('--workers', "-j", default=16, help='Number of threads to check the files')
 @click.option('--sync', "-s", default=None, help='sync policy : None, auto image_to_db db_to_image')
 @click.option('--verbose', "-v", is_flag=True, help='Print detailed info')
 @click.option('--large_verbose', "-vv", '--vv', is_flag=True, help='Print more detailed info')
 @click.option('--extra_large_verbose', "-vvv", '--vvv', is_flag=True, help='Print even more detailed info')
 @click.option('--no_roi', is_flag=True, help='Do not print ROI info with vvv')
-def go(db_files, verbose, large_verbose, sync, extra_large_verbose, check, no_roi):
+def go(db_files, verbose, large_verbose, sync, extra_large_verbose, check, checksum, workers, no_roi):
     for db_file in db_files:
         # open db
         db = rdb.PatientTreatmentDatabase(db_file)
@@ -53,8 +56,8 @@ def go(db_files, verbose, large_verbose, sync, extra_large_verbose, check, no_ro
                             print()
 
         if check:
-            b, m = db.check_files_exist()
-            print(f'Checking files : {b} {m}')
+            report = rdbck.db_check_files(db, verify_checksums=checksum, max_workers=workers)
+            print(rdbck.db_check_report_str(report))
 
         if sync:
             print(f'syncing (policy={sync}) ... ')
@@ -13,8 +13,9 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 @click.option("--cycle_id", "-c", required=True, help="Cycle to plot")
 @click.option("--spect_name", default='spect', help="Name of the spect image")
 @click.option("--roi", '-r', multiple=True, help="Names of the roi image (nothing if all)")
+@click.option("--workers", "-j", default=4, help="Number of timepoints processed in parallel (one spect in memory each)")
 # resample ?
-def go(db_file, cycle_id, spect_name, roi):
+def go(db_file, cycle_id, spect_name, roi, workers):
     db = rdb.PatientTreatmentDatabase(db_file)
     cycle = db.get_cycle(cycle_id)
 
@@ -28,7 +29,10 @@ def go(db_file, cycle_id, spect_name, roi):
         roi_names = set(roi)
 
     # go
-    times, activities = rdb.compute_time_activity_curve(cycle, roi_names, spect_name)
+    times, activities = rdb.compute_time_activity_curve(cycle, roi_names, spect_name, max_workers=workers)
+    # keep the computed activities in the db (tac_cache)
+    if any(tp.metadata_is_modified() for tp in cycle.timepoints.values()):
+        db.write()
 
     # plot
     for roi in roi_names:
@@ -18,10 +18,11 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 @click.option("--rad", default="Lu177", help="Radionuclide")
 @click.option("--no_plot", is_flag=True, help="Plot the fit")
 @click.option("--roi", '-r', multiple=True, help="Names of the roi image (nothing if all)")
+@click.option("--workers", "-j", default=4, help="Number of timepoints processed in parallel (one spect in memory each)")
 @click.option(
     "--output", "-o", default=None, help="Save the fit parameters in this json file"
 )
-def go(db_file, cycle_id, rad, no_plot, output, roi):
+def go(db_file, cycle_id, rad, no_plot, output, roi, workers):
     # open db as a dict
     db = rdb.PatientTreatmentDatabase(db_file)
 
@@ -45,7 +46,10 @@ def go(db_file, cycle_id, rad, no_plot, output, roi):
 
     # get tac and fit for all rois
     params = {}
-    times, activities = rdb.compute_time_activity_curve(cycle, roi_names)
+    times, activities = rdb.compute_time_activity_curve(cycle, roi_names, max_workers=workers)
+    # keep the computed activities in the db (tac_cache)
+    if any(tp.metadata_is_modified() for tp in cycle.timepoints.values()):
+        db.write()
     for roi_name in roi_names:
         t = np.array(times[roi_name])
         a = np.array(activities[roi_name])
@@ -19,7 +19,11 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
     is_flag=True,
     help="Loop in the folder and browse dicom in all sub-folders (first depth only)",
 )
-def go(dicom_folder, output, recursive):
+@click.option("--workers", "-j", default=None, type=int,
+              help="Number of processes to read the dicom files (default: number of cpus)")
+@click.option("--no_index", is_flag=True,
+              help="Do not use (nor update) the persistent index of the dicom folder")
+def go(dicom_folder, output, recursive, workers, no_index):
     if recursive:
         folders = he.get_subfolders(dicom_folder, depth=0)
         if os.path.dirname(output):
@@ -34,7 +38,10 @@ def go(dicom_folder, output, recursive):
         print(f"Processing {folder} ... ")
 
         # analyse the folder for dicom
-        studies = dicom.list_dicom_studies_and_series(folder)
+        if no_index:
+            studies = dicom.list_dicom_studies_and_series(folder, workers)
+        else:
+            studies = dicom.dicom_index_studies(folder, max_workers=workers)
 
         # store as a json file
         if recursive:
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import click
+import json
+import time
+import rpt_dosi.db as rdb
+
+CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option("--input_json", "-i", required=True, type=click.Path(exists=True),
+              help="Json file with the selected dicom (see rpt_dicom_select)")
+@click.option("--db_file", "--db", required=True,
+              help="Output db file (created if it does not exist)")
+@click.option("--unit", "-u", default=None,
+              help="Unit of the SPECT images (Bq, Bq/mL), if not given it is read in the dicom")
+@click.option("--workers", "-j", default=None, type=int,
+              help="Number of series converted in parallel")
+def go(input_json, db_file, unit, workers):
+    """
+    Convert all the selected dicom series (with a cycle_id, a tp_id and a name)
+    in parallel, add them in the db, and write the db
+    """
+    t = time.time()
+    with open(input_json, "r") as f:
+        series = json.load(f)
+    selected = [s for s in series if s.get("cycle_id") and s.get("tp_id") and s.get("name")]
+    print(f"{len(selected)} selected series (out of {len(series)})")
+
+    db = rdb.PatientTreatmentDatabase(db_file, create=True)
+    db.add_images_from_dicom(selected, unit=unit, max_workers=workers)
+    db.write()
+    print(db.info())
+    print(f"Done in {time.time() - t:.1f} s")
+
+
+# --------------------------------------------------------------------------
+if __name__ == "__main__":
+    go()
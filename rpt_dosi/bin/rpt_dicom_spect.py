@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import click
+import rpt_dosi.dicom_series as rds
+from rpt_dosi.utils import fatal
+
+CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option("--input_dicom", "-i", required=True, multiple=True, type=click.Path(exists=True),
+              help="Input NM dicom file (multi-frame) or folder with the files of one series "
+                   "(can be repeated)")
+@click.option("--output", "-o", required=True, multiple=True,
+              help="Output SPECT image, one per input")
+@click.option("--unit", "-u", default=None,
+              help="SPECT unit (Bq, Bq/mL), if not given it is read in the dicom")
+@click.option("--workers", "-j", default=None, type=int,
+              help="Number of series converted in parallel")
+@click.option("--verbose", "-v", is_flag=True, help="verbose")
+def go(input_dicom, output, unit, workers, verbose):
+    """
+    Convert reconstructed NM dicom to SPECT images with their metadata
+    (unit, acquisition datetime, injection activity and datetime)
+    """
+    if len(input_dicom) != len(output):
+        fatal(f"There are {len(input_dicom)} inputs and {len(output)} outputs, must be the same")
+    jobs = [(rds.dicom_input_files(i), o) for i, o in zip(input_dicom, output)]
+    for i, spect in rds.iter_convert_nm_dicoms_to_spects(jobs, unit, workers):
+        print(f"{input_dicom[i]} -> {spect.image_file_path}")
+        if verbose:
+            print(spect.info())
+
+
+# --------------------------------------------------------------------------
+if __name__ == "__main__":
+    go()
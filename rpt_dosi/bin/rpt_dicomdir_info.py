@@ -4,6 +4,7 @@
 import click
 import rpt_dosi.dicom_utils as dicom
 import json
+import os
 from box import Box
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
@@ -12,9 +13,16 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.argument('dicomdir_json', type=click.Path(exists=True), nargs=1)
 def go(dicomdir_json):
+    """
+    DICOMDIR_JSON is the json file given by rpt_dicom_browse, or a dicom folder
+    (its persistent index is updated)
+    """
     # load the dicom info
-    with open(dicomdir_json, "r") as f:
-        studies = json.load(f)
+    if os.path.isdir(dicomdir_json):
+        studies = dicom.dicom_index_studies(dicomdir_json)
+    else:
+        with open(dicomdir_json, "r") as f:
+            studies = json.load(f)
 
     # sort series by date
     series = dicom.sort_series_by_date(studies)
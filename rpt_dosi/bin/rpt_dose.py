@@ -46,15 +46,11 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 @click.option(
     "--method",
     "-m",
-    default="hanscheid2017",
-    type=click.Choice(["hanscheid2017",
-                       "hanscheid2018",
-                       "madsen2018",
-                       "madsen2018_dose_rate",
-                       "hanscheid2018_dose_rate",
-                       "hanscheid2017_dose_rate",  ## FIXME auto from dosimetry
-                       ]),
-    help="Which method to use",
+    multiple=True,
+    default=["hanscheid2017"],
+    type=click.Choice([m.name for m in rd.dose_computation_methods] + ["all"]),
+    help="Which method to use (several --method or 'all' to compute "
+         "all methods with the same resampling and write one combined json)",
 )
 @click.option("--resample_like", "-r",
               type=click.Choice(["spect", "ct"]),
@@ -67,6 +63,9 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
     "--phantom", "-p", default="ICRP 110 AM", help="Phantom ICRP 110 AF or AM (only used by some methods)"
 )
 @click.option("--scaling", default=1.0, help="Scaling factor (for dose rate)")
+@click.option("--resample_cache", default=None,
+              help="Folder of the on-disk cache of resampled images "
+                   "(default: $RPT_DOSI_RESAMPLE_CACHE, no cache if not set)")
 @click.option("--output", "-o", default=None, help="Output json filename")
 def go(spect,
        dose_rate,
@@ -81,7 +80,12 @@ def go(spect,
        sigma,
        output,
        method,
-       scaling):
+       scaling,
+       resample_cache):
+    # resample cache
+    if resample_cache is not None:
+        rim.resample_cache.folder = resample_cache
+
     # input is spect or dose_rate ?
     if spect is None and dose_rate is None:
         rim.fatal(f'Please provide either --spect or --dose_rate option')
@@ -121,9 +125,17 @@ def go(spect,
     # read ct image
     ct = rim.read_ct(ct)
 
-    # create the dose method
-    the_method = rd.get_dose_computation_class(method)
-    d = the_method(ct, im)
+    # only one method: results of this method
+    if len(method) == 1 and method[0] != "all":
+        the_method = rd.get_dose_computation_class(method[0])
+        d = the_method(ct, im)
+    else:
+        # several methods: the preprocessing is shared, results per method
+        d = rd.DoseSession(ct)
+        if spect is not None:
+            d.spect = im
+        else:
+            d.dose_rate = im
 
     # common options
     d.resample_like = resample_like
@@ -135,7 +147,10 @@ def go(spect,
     d.scaling = scaling
 
     # compute dose for all roi
-    doses = d.run(rois)
+    if isinstance(d, rd.DoseSession):
+        doses = d.run(rois, method)
+    else:
+        doses = d.run(rois)
 
     # save output to json
     if output is not None:
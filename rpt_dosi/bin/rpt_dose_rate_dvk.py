@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import click
+import rpt_dosi.dvk as dvk
+import rpt_dosi.images as rim
+
+CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
+
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option(
+    "--spect",
+    "-s",
+    required=True,
+    type=click.Path(exists=True),
+    help="Input SPECT image (use --unit to specify the image)",
+)
+@click.option("--input_unit", "-u",
+              type=click.Choice(rim.MetaImageSPECT.authorized_units),
+              default=None,
+              help=f"SPECT unit: {rim.MetaImageSPECT.authorized_units}")
+@click.option(
+    "--ct",
+    "-c",
+    default=None,
+    type=click.Path(exists=True),
+    help="Input CT image (only used for the density correction)",
+)
+@click.option("--output", "-o", required=True, help="Output dose rate image (Gy/s)")
+@click.option("--rad", default="lu177", help="Radionuclide")
+@click.option("--kernel_radius_mm", "-k", default=30.0, help="Radius of the dose voxel kernel in mm")
+@click.option("--density_correction", "-d", is_flag=True, default=False,
+              help="Divide the dose rate by the CT density (the kernel is in water)")
+@click.option("--sigma", default=None,
+              help="specify sigma for gauss filter of the resampled CT (None=no gauss, 0 = auto)",
+              )
+def go(spect, input_unit, ct, output, rad, kernel_radius_mm, density_correction, sigma):
+    # read images
+    spect = rim.read_spect(spect, input_unit)
+    if ct is not None:
+        ct = rim.read_ct(ct)
+
+    # dose voxel kernel convolution
+    d = dvk.DoseRateKernelConvolution(spect, ct)
+    d.radionuclide = rad
+    d.kernel_radius_mm = kernel_radius_mm
+    d.density_correction = density_correction
+    d.gaussian_sigma = sigma
+    dose_rate = d.run(output)
+    print(dose_rate)
+
+
+# --------------------------------------------------------------------------
+if __name__ == "__main__":
+    go()
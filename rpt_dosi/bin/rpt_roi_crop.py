@@ -3,8 +3,7 @@
 import copy
 
 import click
-import itk
-import gatetools as gt
+import SimpleITK as sitk
 from pathlib import Path
 import os
 import rpt_dosi.utils as ru
@@ -36,11 +35,11 @@ def go(input_images, output_folder):
     for filename in all_filenames:
         print(f"Cropping {filename} ...")
         img = rim.read_roi(filename, "header_only")
-        itk_img = itk.imread(img.image_file_path)
-        o = gt.image_auto_crop(itk_img, bg=0)
+        itk_img = sitk.ReadImage(img.image_file_path)
+        o = rim.crop_to_non_background(itk_img, bg=0)
         fn, ext = ru.get_basename_and_extension(filename)
         fn = f"{fn}_crop{ext}"
-        itk.imwrite(o, output_folder / fn)
+        sitk.WriteImage(o, output_folder / fn)
         mi = copy.copy(img)
         mi.filename = output_folder / fn
         mi.write_metadata()
@@ -3,6 +3,7 @@
 
 import click
 import rpt_dosi.images as rim
+import rpt_dosi.utils as rhe
 import json
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
@@ -27,11 +28,12 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
     "--roi",
     "-r",
     required=True,
+    multiple=True,
     type=click.Path(exists=True),
-    help="Input ROI mask",
+    help="Input ROI mask (several ROIs can be given)",
 )
 @click.option("--like", "-l", default="spect", type=str,
-              help="Resample like: spect, roi or ct",
+              help="Resample like: spect, roi (only with one roi) or ct",
               )
 @click.option("--unit", "-u",
               default="Bq/mL",
@@ -42,15 +44,26 @@ def go(input_image, ct, roi, like, unit, output):
     # read spect
     spect = rim.read_spect(input_image, unit)
 
-    # read roi
-    roi = rim.read_roi(roi, "unnamed_roi")
-
     # read ct
     if ct is not None:
         ct = rim.read_ct(ct)
 
     # get stats
-    res = rim.image_roi_stats(roi, spect, ct, like)
+    if len(roi) == 1:
+        roi = rim.read_roi(roi[0], "unnamed_roi")
+        res = rim.image_roi_stats(roi, spect, ct, like)
+    else:
+        # several rois: all stats computed in one single pass
+        if like == "roi":
+            rhe.fatal("Cannot resample like the roi with several rois, use --like spect or ct")
+        # the rois are named (and stored in the output) with their file basename
+        rois = []
+        for r in roi:
+            name, _ = rhe.get_basename_and_extension(r)
+            if name in [x.name for x in rois]:
+                rhe.fatal(f"Several rois have the same name '{name}' (file basename): {r}")
+            rois.append(rim.read_roi(r, name))
+        res = rim.image_multi_roi_stats(rois, spect, ct, like)
 
     # print and save
     print(res)
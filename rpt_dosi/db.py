@@ -1,11 +1,18 @@
 from . import images as rim
 from . import metadata as rmd
 from . import utils as rhe
+from . import db_storage as rdbs
+from . import db_check as rdbck
+from . import dicom_series as rds
 from .utils import fatal
 from datetime import datetime
 import numpy as np
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import shutil
+import tempfile
 
 
 def db_get_time_interval(cycle, acquisition):
@@ -22,6 +29,8 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
     - consider a hierarchy folders patient/cycle_id/timepoint_id/images
     - from / to json files
     - when store to a json file, the database folder MUST be the one of the json file
+    - stored in a json file, or in a sqlite file (.sqlite, .sqlite3, .db) that
+      allows concurrent partial updates (see db_storage)
 
     patient/
             db.json
@@ -46,6 +55,8 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
         self._db_file_path = None
         # db_folder is the base folder where the data should be
         self._db_data_path = None
+        # json or sqlite storage, according to the file extension
+        self._storage = None
         # read or create json file
         if os.path.exists(filename):
             self.read(filename, sync_metadata_image=sync_metadata_image)
@@ -99,14 +110,14 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
         n = 0
         for cycle in self.cycles.values():
             for tp in cycle.timepoints.values():
-                n += len(tp.rois)
+                n += tp.number_of_rois()
         return n
 
     def number_of_images(self):
         n = 0
         for cycle in self.cycles.values():
             for tp in cycle.timepoints.values():
-                n += len(tp.images)
+                n += tp.number_of_images()
         return n
 
     def get_cycle(self, cycle_id):
@@ -138,30 +149,124 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
         tp = cycle.get_timepoint(tp_id)
         tp.add_dicom_ct(folder_path)
 
+    def add_images_from_dicom(self, selected_series, unit=None, max_workers=None):
+        """
+        Convert the selected dicom series (see rpt_dicom_select) and add them in
+        the db: each series is a dict with cycle_id, tp_id, name, modality (CT
+        or NM) and filepath (one file of the series, the other files of the
+        series in the same folder are found). The cycles and timepoints are
+        created if needed.
+        The series are converted in parallel in a temporary folder of the db,
+        and each image is moved in its timepoint as soon as it is converted.
+        If a conversion fails, the images already moved are removed.
+        The db is not written.
+        """
+        # check the destinations before converting
+        targets = set()
+        for s in selected_series:
+            key = (s["cycle_id"], s["tp_id"], s["name"])
+            if key in targets:
+                fatal(f'The image {key} is selected several times')
+            targets.add(key)
+            cycle = self.cycles.get(s["cycle_id"])
+            if cycle is not None and s["tp_id"] in cycle.timepoints:
+                if s["name"] in cycle.timepoints[s["tp_id"]].images:
+                    fatal(f'The image {key} already exists in the db')
+            dest_path = self.db_data_path / s["cycle_id"] / s["tp_id"] / f"{s['name']}.mhd"
+            for f in [dest_path, dest_path.with_suffix(".raw")]:
+                if os.path.exists(f):
+                    fatal(f'The image {key} is not in the db but its file {f} already exists')
+        # cycles and timepoints (in the order of the selection)
+        for s in selected_series:
+            if s["cycle_id"] not in self.cycles:
+                self.add_new_cycle(s["cycle_id"])
+            cycle = self.cycles[s["cycle_id"]]
+            if s["tp_id"] not in cycle.timepoints:
+                cycle.add_new_timepoint(s["tp_id"])
+        # all the files of each series (the folders are read once)
+        folders = {}
+        jobs = []
+        tmp_folder = tempfile.mkdtemp(prefix=".dicom_import_", dir=self.db_data_path)
+        for i, s in enumerate(selected_series):
+            folder = os.path.dirname(s["filepath"])
+            if folder not in folders:
+                folders[folder] = rds.dicom_files_by_series(folder)
+            uid = rds.read_series_uid(s["filepath"])
+            output = os.path.join(tmp_folder, f"{i}_{s['name']}.mhd")
+            jobs.append((folders[folder][uid], output, s["modality"], unit))
+        # convert in parallel, and move in the timepoints
+        added = []
+        try:
+            for i, im in rds.iter_convert_dicoms_to_metaimages(jobs, max_workers):
+                s = selected_series[i]
+                tp = self.cycles[s["cycle_id"]].timepoints[s["tp_id"]]
+                tp.add_image_from_file(s["name"], im.image_file_path,
+                                       filename=f"{s['name']}.mhd", mode="move")
+                added.append((tp, s["name"]))
+                print(f'{s["cycle_id"]} {s["tp_id"]} {s["name"]}: {s["filepath"]}')
+        except BaseException:
+            # (also the exit of fatal) the import can be run again
+            for tp, name in added:
+                im = tp.images.pop(name)
+                for f in rim.image_data_file_paths(im.image_file_path):
+                    if f is not None and os.path.exists(f):
+                        os.remove(f)
+                rim.delete_image_metadata(im.image_file_path)
+            raise
+        finally:
+            shutil.rmtree(tmp_folder)
+
     def write(self, filename=None, sync_metadata_image=True, sync_policy="auto"):
+        """
+        Write the db file (atomically). Only the images that may have changed
+        are synced, and only the modified metadata sidecars are written.
+        With sqlite, only the modified cycles and timepoints are updated.
+        A filename with another extension converts the db (json <-> sqlite).
+        """
         if filename is None:
             filename = self.db_file_path
         self.db_file_path = filename
         if sync_metadata_image:
-            self.sync_metadata_images(sync_policy)
-        self.save_to_json(self.db_file_path)
+            self.sync_metadata_images(sync_policy, only_modified=True)
+        # a new file (or another format) is a new storage
+        if self._storage is None or self._storage.filename != self.db_file_path:
+            self._storage = rdbs.get_db_storage(self.db_file_path)
+        self._storage.write(self)
         if sync_metadata_image:
             self.write_metadata_images()
+        self.set_metadata_saved_all()
 
     def write_metadata_images(self):
         for cycle in self.cycles.values():
             cycle.write_metadata_images()
 
-    def sync_metadata_images(self, sync_policy="auto"):
+    def sync_metadata_images(self, sync_policy="auto", only_modified=False):
+        for cycle in self.cycles.values():
+            cycle.sync_metadata_images(sync_policy, only_modified)
+        if not only_modified:
+            return
+        # the db or a cycle may be modified (also by the synced images):
+        # all their timepoints are then synced
+        for cycle in self.cycles.values():
+            if self.metadata_is_modified() or cycle.metadata_is_modified():
+                cycle.sync_metadata_images(sync_policy)
+
+    def set_metadata_saved_all(self):
+        # the metadata of the db, cycles and timepoints are considered as saved
+        self.set_metadata_saved()
         for cycle in self.cycles.values():
-            cycle.sync_metadata_images(sync_policy)
+            cycle.set_metadata_saved()
+            for tp in cycle.timepoints.values():
+                tp.set_metadata_saved()
 
     def read(self, filename, sync_metadata_image):
         if not os.path.exists(filename):
             fatal(f'Database file {filename} does not exist')
         self._db_data_path = Path(os.path.abspath(os.path.dirname(filename)))
         self.db_file_path = filename
-        self.load_from_json(filename)
+        self._storage = rdbs.get_db_storage(self.db_file_path)
+        self._storage.read(self)
+        self.set_metadata_saved_all()
         if sync_metadata_image:
             for cycle in self.cycles.values():
                 cycle.sync_metadata_images()
@@ -174,10 +279,9 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
         return data
 
     def from_dict(self, data):
-        df = self._db_data_path
-        super().from_dict(data)
+        super().from_dict({k: v for k, v in data.items() if k != "cycles"})
         for cid, cycle in data["cycles"].items():
-            tc = CycleTreatmentDatabase(self, cid).from_dict(cycle)
+            tc = CycleTreatmentDatabase(self, cid, create_folders=False).from_dict(cycle)
             self.cycles[cid] = tc
 
     def check_folders_exist(self):
@@ -188,14 +292,12 @@ class PatientTreatmentDatabase(rmd.ClassWithMetaData):
             ok = b and ok
         return ok, msg
 
-    def check_files_exist(self):
-        ok = True
-        msg = ''
-        for cycle in self.cycles.values():
-            b, m = cycle.check_files_exist()
-            ok = b and ok
-            msg += m
-        return ok, msg
+    def check_files_exist(self, max_workers=16):
+        # in parallel, see db_check for the complete check with sidecars and checksums
+        report = rdbck.db_check_files(self, check_sidecars=False, max_workers=max_workers)
+        if report.ok:
+            return True, ''
+        return False, rdbck.db_check_report_str(report)
 
     def check_files_metadata(self):
         ok = True
@@ -214,7 +316,7 @@ class CycleTreatmentDatabase(rmd.ClassWithMetaData):
         'injection_radionuclide': str
     }
 
-    def __init__(self, db, cycle_id):
+    def __init__(self, db, cycle_id, create_folders=True):
         # this cycle belong to this db
         super().__init__()
         self.db = db
@@ -224,8 +326,9 @@ class CycleTreatmentDatabase(rmd.ClassWithMetaData):
         self._injection_datetime = None
         self.injection_radionuclide = None
         self.timepoints = {}
-        # create folder
-        os.makedirs(self.cycle_path, exist_ok=True)
+        # create folder (not when read from the db file)
+        if create_folders:
+            os.makedirs(self.cycle_path, exist_ok=True)
 
     def info(self):
         s = (f'Cycle id = {self.cycle_id}\n'
@@ -286,15 +389,18 @@ class CycleTreatmentDatabase(rmd.ClassWithMetaData):
         return data
 
     def from_dict(self, data):
-        super().from_dict(data)
+        super().from_dict({k: v for k, v in data.items() if k != "timepoints"})
         for tid, tp in data["timepoints"].items():
-            timepoint = TimepointTreatmentDatabase(self, tid).from_dict(tp)
+            timepoint = TimepointTreatmentDatabase(self, tid, create_folders=False).from_dict(tp)
             self.timepoints[tid] = timepoint
         return self
 
-    def sync_metadata_images(self, sync_policy="auto"):
+    def sync_metadata_images(self, sync_policy="auto", only_modified=False):
+        # with only_modified, the timepoints that are not modified and with
+        # images not read are not synced (their images cannot be modified)
         for tp in self.timepoints.values():
-            tp.sync_metadata_images(sync_policy)
+            if not only_modified or tp.metadata_is_modified() or tp.some_images_are_read():
+                tp.sync_metadata_images(sync_policy)
 
     def write_metadata_images(self):
         for tp in self.timepoints.values():
@@ -336,12 +442,14 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
     """
         Store filenames, not paths, paths are computed on the fly.
         The folders are build from db/cycle/timepoint
+        When read from the db file, the images and rois are only created
+        (and their metadata read) when they are accessed.
     """
     _metadata_fields = {
         'acquisition_datetime': str
     }
 
-    def __init__(self, cycle, tp_id):
+    def __init__(self, cycle, tp_id, create_folders=True):
         # this timepoint belong to this cycle
         super().__init__()
         self.cycle = cycle
@@ -349,46 +457,126 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
         self.timepoint_id = tp_id
         self._acquisition_datetime = None
         # several images
-        self.images = {}
+        self._images = {}
         # several rois (in the rois folder)
-        self.rois = {}
-        # create folder
-        os.makedirs(self.timepoint_path, exist_ok=True)
-        os.makedirs(self.rois_path, exist_ok=True)
+        self._rois = {}
+        # db data of the images and rois, not read yet (lazy)
+        self._images_data = None
+        self._rois_data = None
+        # create folder (not when read from the db file)
+        if create_folders:
+            os.makedirs(self.timepoint_path, exist_ok=True)
+            os.makedirs(self.rois_path, exist_ok=True)
+
+    @property
+    def images(self):
+        if self._images_data is not None:
+            self.read_images()
+        return self._images
+
+    @property
+    def rois(self):
+        if self._rois_data is not None:
+            self.read_rois()
+        return self._rois
+
+    def images_are_read(self):
+        return self._images_data is None and self._rois_data is None
+
+    def some_images_are_read(self):
+        return self._images_data is None or self._rois_data is None
+
+    def number_of_images(self):
+        if self._images_data is not None:
+            return len(self._images_data)
+        return len(self._images)
+
+    def number_of_rois(self):
+        if self._rois_data is not None:
+            return len(self._rois_data)
+        return len(self._rois)
+
+    def image_names(self):
+        if self._images_data is not None:
+            return list(self._images_data.keys())
+        return list(self._images.keys())
+
+    def roi_names(self):
+        if self._rois_data is not None:
+            return list(self._rois_data.keys())
+        return list(self._rois.keys())
+
+    def image_file_paths(self):
+        # path of all images, without reading them
+        if self._images_data is not None:
+            return {k: self.timepoint_path / v['filename'] for k, v in self._images_data.items()}
+        return {k: Path(im.image_file_path) for k, im in self._images.items()}
+
+    def image_checksums(self):
+        # recorded checksum of all images (None if not recorded), without reading them
+        if self._images_data is not None:
+            return {k: v.get('checksum') for k, v in self._images_data.items()}
+        return {k: getattr(im, 'checksum', None) for k, im in self._images.items()}
+
+    def roi_checksums(self):
+        if self._rois_data is not None:
+            return {k: v.get('checksum') for k, v in self._rois_data.items()}
+        return {k: getattr(roi, 'checksum', None) for k, roi in self._rois.items()}
+
+    def roi_file_paths(self):
+        # path of all rois, without reading them
+        if self._rois_data is not None:
+            return {k: self.rois_path / v['filename'] for k, v in self._rois_data.items()}
+        return {k: self.rois_path / roi.filename for k, roi in self._rois.items()}
 
     def info(self):
         s = (f'Timepoint id = {self.timepoint_id}\n'
              f'Folder = {self.timepoint_path}\n'
              f'Acquisition date = {self.acquisition_datetime}\n'
-             f'Images = {len(self.images)} {" ".join(self.images.keys())}\n'
-             f'ROIs = {len(self.rois)} {" ".join(self.rois.keys())}')
+             f'Images = {self.number_of_images()} {" ".join(self.image_names())}\n'
+             f'ROIs = {self.number_of_rois()} {" ".join(self.roi_names())}')
         return s
 
     def __str__(self):
         sr = ''
-        if len(self.rois) > 1:
+        if self.number_of_rois() > 1:
             sr = 's'
         si = ''
-        if len(self.images) > 1:
+        if self.number_of_images() > 1:
             si = 's'
         return (f'{self.timepoint_id} '
                 f'date={self.acquisition_datetime} '
-                f'-- {len(self.images)} image{si} '
-                f'-- {len(self.rois)} roi{sr}')
+                f'-- {self.number_of_images()} image{si} '
+                f'-- {self.number_of_rois()} roi{sr}')
 
     def to_dict(self):
         data = super().to_dict()
         data["rois"] = {}
         data["images"] = {}
-        for key, roi in self.rois.items():
+        # not read images and rois are kept as is
+        if self._rois_data is not None:
+            data["rois"] = copy.deepcopy(self._rois_data)
+        if self._images_data is not None:
+            data["images"] = copy.deepcopy(self._images_data)
+        for key, roi in self._rois.items():
             data["rois"][key] = roi.to_dict()
-        for key, image in self.images.items():
+        for key, image in self._images.items():
             data["images"][key] = image.to_dict()
         return data
 
     def from_dict(self, data):
-        super().from_dict(data)
-        for key, value in data['rois'].items():
+        # the images and rois are read when accessed (see read_images and read_rois)
+        super().from_dict({k: v for k, v in data.items() if k not in ['rois', 'images']})
+        self._rois_data = data['rois']
+        self._images_data = data['images']
+        self._rois = {}
+        self._images = {}
+        return self
+
+    def read_rois(self):
+        rois_data = self._rois_data
+        self._rois_data = None
+        for key, value in rois_data.items():
             file_path = self.rois_path / value['filename']
             roi = rim.MetaImageROI(image_path=file_path,
                                    name=value['name'],
@@ -397,15 +585,18 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
             roi.from_dict(value)
             # we set the roi path to the current data folder
             roi.image_file_path = file_path
-            self.rois[key] = roi
-        for key, value in data['images'].items():
+            self._rois[key] = roi
+
+    def read_images(self):
+        images_data = self._images_data
+        self._images_data = None
+        for key, value in images_data.items():
             file_path = self.timepoint_path / value['filename']
             im = rim.read_metaimage(file_path, reading_mode='metadata_only')
             im.from_dict(value)
             # we set the image path to the current data folder
             im.image_file_path = file_path
-            self.images[key] = im
-        return self
+            self._images[key] = im
 
     @property
     def acquisition_datetime(self):
@@ -455,8 +646,10 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
         pass
 
     def write_metadata_images(self):
-        for image in self.images.values():
-            image.write_metadata()
+        # only the modified images (not read images are not modified)
+        for image in self._images.values():
+            if image.metadata_is_modified(image.metadata_file_path):
+                image.write_metadata()
 
     @property
     def timepoint_path(self):
@@ -498,7 +691,12 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
                             filename=None,
                             mode='copy',
                             unit=None,
-                            file_exist_ok=False):
+                            file_exist_ok=False,
+                            checksum=False):
+        """
+        The mode can be copy, move, link, reflink, symlink or dry_run
+        (see rim.transfer_file)
+        """
         if image_name in self.images:
             fatal(f'Cannot add image {image_name} since it already exists')
         # get the filename
@@ -506,26 +704,37 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
             filename = os.path.basename(input_path)
         # copy or move the initial image
         dest_path = self.timepoint_path / filename
+        os.makedirs(self.timepoint_path, exist_ok=True)
         if not file_exist_ok and os.path.exists(dest_path):
             fatal(f'File image {dest_path} already exists')
-        if input_path != dest_path:
-            rim.copy_or_move_image(input_path, dest_path, mode)
-        # with initial metadata?
+        # with initial metadata? (read before the file is moved)
+        im = None
         if rim.metadata_exists(input_path):
             im = rim.read_metaimage(input_path, reading_mode='metadata_only')
-            im.image_file_path = dest_path
             if image_type is not None and image_type != im.image_type:
                 fatal(f'Cannot add the read image, the image type is {im.image_type}'
                       f' while {image_type} is expected')
+        if input_path != dest_path:
+            rim.copy_or_move_image(input_path, dest_path, mode)
+        if im is not None:
+            im.image_file_path = dest_path
         else:
             im = rim.new_metaimage(image_type,
                                    file_path=dest_path,
                                    unit=unit,
                                    reading_mode='metadata_only')
             print(im)
+        # record the checksum of the file content (see db_check)
+        if checksum and mode != "dry_run":
+            self.record_checksum(im)
         # add it
         return self.add_image(image_name, im)
 
+    @staticmethod
+    def record_checksum(meta_image):
+        meta_image.add_metadata_field('checksum', str)
+        meta_image.checksum = rim.image_file_checksum(meta_image.image_file_path)
+
     def add_image(self, image_name, meta_image):
         if image_name in self.images:
             fatal(f'Cannot add image {image_name} since it already exists')
@@ -547,9 +756,13 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
             raise
         return meta_image
 
-    def add_rois(self, roi_list, mode='copy', exist_ok=False):
-        for roi in roi_list:
-            self.add_roi_from_file(roi['roi_id'], roi['filename'], mode, exist_ok)
+    def add_rois(self, roi_list, mode='copy', exist_ok=False, checksum=False, max_workers=8):
+        # the files are copied (or linked) in parallel, then the rois are added
+        dest_paths = [self.roi_dest_path(roi['roi_id'], roi['filename'], exist_ok) for roi in roi_list]
+        input_rois = [self.read_input_roi(roi['filename']) for roi in roi_list]
+        rim.copy_or_move_images([roi['filename'] for roi in roi_list], dest_paths, mode, max_workers)
+        for roi, input_roi, dest_path in zip(roi_list, input_rois, dest_paths):
+            self.add_copied_roi(roi['roi_id'], input_roi, dest_path, checksum and mode != "dry_run")
 
     def add_roi(self, roi):
         if roi.name in self.rois:
@@ -572,19 +785,38 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
             raise
         return roi
 
-    def add_roi_from_file(self, roi_id, input_path, mode="copy", exist_ok=False):
+    def add_roi_from_file(self, roi_id, input_path, mode="copy", exist_ok=False, checksum=False):
+        """
+        The mode can be copy, move, link, reflink, symlink or dry_run
+        (see rim.transfer_file)
+        """
+        # copy or move the initial image
+        dest_path = self.roi_dest_path(roi_id, input_path, exist_ok)
+        input_roi = self.read_input_roi(input_path)
+        rim.copy_or_move_image(input_path, dest_path, mode)
+        return self.add_copied_roi(roi_id, input_roi, dest_path, checksum and mode != "dry_run")
+
+    def roi_dest_path(self, roi_id, input_path, exist_ok=False):
         # compute the new filename as roi_id.extension
         _, extension = rhe.get_basename_and_extension(input_path)
         filename = f'{roi_id}{extension}'
         filename = filename.replace(' ', '_')
-        # copy or move the initial image
         dest_path = self.rois_path / filename
+        os.makedirs(self.rois_path, exist_ok=True)
         if not exist_ok and os.path.exists(dest_path):
             fatal(f'File image {dest_path} already exists')
-        rim.copy_or_move_image(input_path, dest_path, mode)
-        # with initial metadata?
+        return dest_path
+
+    @staticmethod
+    def read_input_roi(input_path):
+        # with initial metadata? (read before the file is moved)
         if rim.metadata_exists(input_path):
-            roi = rim.read_roi(input_path)
+            return rim.read_roi(input_path)
+        return None
+
+    def add_copied_roi(self, roi_id, input_roi, dest_path, checksum=False):
+        if input_roi is not None:
+            roi = input_roi
             roi.image_file_path = dest_path
             roi.name = roi_id
         else:
@@ -592,9 +824,46 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
                                     file_path=dest_path,
                                     name=roi_id,
                                     reading_mode='metadata_only')
+        if checksum:
+            self.record_checksum(roi)
         # add it
         return self.add_roi(roi)
 
+    def compute_rois_activity_mbq(self, roi_names, spect_name='spect', use_cache=True):
+        """
+        Activity (MBq) of the spect in the rois. The spect is read (and
+        converted to Bq) once for all rois. The values are stored in the
+        metadata of the timepoint ('tac_cache') with the fingerprints of the
+        spect and roi files, and only computed again when a file changes.
+        """
+        spect = self.images[spect_name]
+        if getattr(self, 'tac_cache', None) is None:
+            self.add_metadata_field('tac_cache', dict)
+            self.tac_cache = {}
+        cache = self.tac_cache.setdefault(spect_name, {})
+        spect_fp = rim.image_fingerprint(spect)
+        activities = {}
+        missing = []
+        for roi_name in roi_names:
+            fp = f'{spect_fp}:{rim.image_fingerprint(self.get_roi(roi_name))}'
+            c = cache.get(roi_name)
+            if use_cache and c is not None and c['fingerprint'] == fp:
+                activities[roi_name] = c['activity_mbq']
+            else:
+                missing.append((roi_name, fp))
+        if len(missing) == 0:
+            return activities
+        # the spect of the db is not modified (unit)
+        spect = copy.copy(spect)
+        spect.read()
+        spect.convert_to_bq()
+        rois = [self.get_roi(roi_name) for roi_name, _ in missing]
+        for (roi_name, fp), s in zip(missing, rim.image_rois_sums(rois, spect)):
+            # convert to MBq
+            activities[roi_name] = s / 1e6
+            cache[roi_name] = {'fingerprint': fp, 'activity_mbq': s / 1e6}
+        return activities
+
     def check_folders_exist(self):
         msg = ''
         ok = True
@@ -611,17 +880,18 @@ class TimepointTreatmentDatabase(rmd.ClassWithMetaData):
     def check_files_exist(self):
         msg = ''
         ok = True
-        for image in self.images.values():
-            if not os.path.exists(image.image_file_path):
-                msg += f'{self.cycle.cycle_id} {self.timepoint_id} The image {image.image_name} does not exist: {self.get_image_file_path(image.image_name)}'
-                ok = False
-        for roi in self.rois:
-            if not os.path.exists(self.get_roi_path(roi)):
-                msg += (f'{self.cycle.cycle_id} {self.timepoint_id} The roi '
-                        f'{self.get_roi_path(roi)} does not exist')
-                ok = False
+        for image_name, path in self.image_file_paths().items():
+            for p in rim.image_data_file_paths(path):
+                if p is None or not os.path.exists(p):
+                    msg += f'{self.cycle.cycle_id} {self.timepoint_id} The image {image_name} does not exist: {p or path}'
+                    ok = False
+        for roi_name, path in self.roi_file_paths().items():
+            for p in rim.image_data_file_paths(path):
+                if p is None or not os.path.exists(p):
+                    msg += (f'{self.cycle.cycle_id} {self.timepoint_id} The roi '
+                            f'{p or path} does not exist')
+                    ok = False
         return ok, msg
-        # TODO check mhd raw files !!
 
     def check_files_metadata(self):
         msg = ''
@@ -663,18 +933,18 @@ def create_test_db(data_folder, db_file_path):
     cycle.add_new_timepoint("tp2")
     cycle.add_new_timepoint("tp3")
 
-    # add images
+    # add images (copy-on-write copies when the file system allows it)
     tp.add_image_from_file("ct",
                            data_folder / "ct_8mm.nii.gz",
                            image_type="CT",
                            filename="ct1.nii.gz",
-                           mode="copy",
+                           mode="reflink",
                            file_exist_ok=True)
     tp.add_image_from_file("spect",
                            data_folder / "spect_8.321mm.nii.gz",
                            image_type="SPECT",
                            filename="spect.nii.gz",
-                           mode="copy",
+                           mode="reflink",
                            unit='Bq',
                            file_exist_ok=True)
 
@@ -682,7 +952,7 @@ def create_test_db(data_folder, db_file_path):
                            data_folder / "spect_10mm_with_json.nii.gz",
                            image_type="SPECT",
                            filename="spect2.nii.gz",
-                           mode="copy",
+                           mode="reflink",
                            file_exist_ok=True)
 
     tp.add_image_from_file("pet",
@@ -690,23 +960,29 @@ def create_test_db(data_folder, db_file_path):
                            image_type="PET",
                            filename="pet.nii.gz",
                            unit='Bq/mL',
-                           mode="copy",
+                           mode="reflink",
                            file_exist_ok=True)
 
     tp.add_roi_from_file("liver",
                          data_folder / "rois" / "liver.nii.gz",
-                         mode="copy",
+                         mode="reflink",
                          exist_ok=True)
     tp.add_roi_from_file("left kidney",
                          data_folder / "rois" / "kidney_left.nii.gz",
-                         mode="copy",
+                         mode="reflink",
                          exist_ok=True)
 
     db.write()
     return db
 
 
-def compute_time_activity_curve(cycle, roi_names, spect_name='spect'):
+def compute_time_activity_curve(cycle, roi_names, spect_name='spect', use_cache=True, max_workers=4):
+    """
+    Times (h) and activities (MBq) of the rois for all timepoints of the cycle.
+    The timepoints are processed in parallel, each thread reads a spect
+    (max_workers spects in memory at once). The activities are stored in
+    the timepoints (see compute_rois_activity_mbq): write the db to keep them.
+    """
     # init the TAC
     times = {}
     activities = {}
@@ -715,16 +991,17 @@ def compute_time_activity_curve(cycle, roi_names, spect_name='spect'):
         activities[roi_name] = []
 
     # Get all activities and group per ROI
-    for tp in cycle.timepoints.values():
+    def tp_activities(tp):
+        return tp.compute_rois_activity_mbq(roi_names, spect_name, use_cache)
+
+    tps = list(cycle.timepoints.values())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tps_activities = list(executor.map(tp_activities, tps))
+    for tp, tp_activities in zip(tps, tps_activities):
         spect = tp.images[spect_name]
-        spect.read()
-        spect.convert_to_bq()
         time_h = rim.get_time_from_injection_h(cycle.injection_datetime,
                                                spect.acquisition_datetime)
         for roi_name in roi_names:
-            roi = tp.get_roi(roi_name)
-            res = rim.image_roi_stats(roi, spect, resample_like='spect')
-            times[roi.name].append(time_h)
-            # convert to MBq
-            activities[roi.name].append(res['sum'] / 1e6)
+            times[roi_name].append(time_h)
+            activities[roi_name].append(tp_activities[roi_name])
     return times, activities
@@ -0,0 +1,203 @@
+import os
+import glob
+import sqlite3
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from box import Box
+from . import db_storage as rdbs
+from .utils import fatal
+
+
+def read_db_catalog_rows(db_path):
+    """
+    Read a patient db file (json or sqlite), without the images, and return
+    the rows of the catalog tables for this db.
+    """
+    data = rdbs.get_db_storage(db_path).read_dict()
+    rows = Box(timepoints=[], images=[], rois=[])
+    rows.patient = (data.get("patient_id"), data.get("body_weight_kg"))
+    for cid, cycle in data["cycles"].items():
+        for tid, tp in cycle["timepoints"].items():
+            rows.timepoints.append((cid, tid,
+                                    cycle.get("injection_datetime"),
+                                    cycle.get("injection_activity_mbq"),
+                                    cycle.get("injection_radionuclide"),
+                                    tp.get("acquisition_datetime")))
+            for name, im in tp["images"].items():
+                rows.images.append((cid, tid, name, im.get("image_type"),
+                                    im.get("unit"), im.get("filename")))
+            for name in tp["rois"]:
+                rows.rois.append((cid, tid, name))
+    return rows
+
+
+def _read_db_catalog_rows_or_error(db_path):
+    # a db that cannot be read does not stop the scan (fatal exits)
+    try:
+        return read_db_catalog_rows(db_path)
+    except (Exception, SystemExit) as e:
+        return Box(error=f"{type(e).__name__}: {e}")
+
+
+class CohortCatalog:
+    """
+    Index (in a sqlite file) of many patient db files, to query the
+    cohort without opening all dbs. The index contains the cycles,
+    timepoints, images (CT, SPECT, Dose etc with their unit) and the roi names.
+    The dose results are the Dose images: the db files do not store other
+    dose values (e.g. per roi), so they are not indexed.
+
+    The db files are scanned in parallel, only the ones with a modified
+    mtime (or size) since the last scan are read again. The db files that
+    cannot be read are kept in the index with their error (see errors).
+    """
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.max_workers = None
+
+    def connect(self, create=True):
+        if not create and not os.path.exists(self.filename):
+            fatal(f"The catalog file {self.filename} does not exist")
+        con = sqlite3.connect(self.filename, timeout=60)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA foreign_keys=ON")
+        con.executescript("""
+        CREATE TABLE IF NOT EXISTS dbs (
+            db_path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER,
+            patient_id TEXT, body_weight_kg REAL, error TEXT);
+        CREATE TABLE IF NOT EXISTS timepoints (
+            db_path TEXT REFERENCES dbs(db_path) ON DELETE CASCADE,
+            cycle_id TEXT, timepoint_id TEXT,
+            injection_datetime TEXT, injection_activity_mbq REAL,
+            injection_radionuclide TEXT, acquisition_datetime TEXT,
+            PRIMARY KEY (db_path, cycle_id, timepoint_id));
+        CREATE TABLE IF NOT EXISTS images (
+            db_path TEXT REFERENCES dbs(db_path) ON DELETE CASCADE,
+            cycle_id TEXT, timepoint_id TEXT,
+            image_name TEXT, image_type TEXT, unit TEXT, filename TEXT);
+        CREATE TABLE IF NOT EXISTS rois (
+            db_path TEXT REFERENCES dbs(db_path) ON DELETE CASCADE,
+            cycle_id TEXT, timepoint_id TEXT, roi_name TEXT);
+        CREATE INDEX IF NOT EXISTS images_tp ON images (db_path, cycle_id, timepoint_id);
+        CREATE INDEX IF NOT EXISTS images_type ON images (image_type);
+        CREATE INDEX IF NOT EXISTS rois_tp ON rois (db_path, cycle_id, timepoint_id);
+        CREATE INDEX IF NOT EXISTS rois_name ON rois (roi_name);
+        """)
+        # catalog created before the error column
+        if "error" not in [r[1] for r in con.execute("PRAGMA table_info(dbs)")]:
+            con.execute("ALTER TABLE dbs ADD COLUMN error TEXT")
+        return con
+
+    def scan(self, folders, pattern="**/db.json"):
+        """
+        Index all the db files matching the pattern in the folders.
+        Unmodified db files are not read, db files that do not exist anymore
+        are removed from the index. Return the number of (re)indexed dbs
+        (also the ones that cannot be read, see errors).
+        """
+        files = set()
+        for folder in folders:
+            files.update(os.path.abspath(f) for f in
+                         glob.glob(os.path.join(folder, pattern), recursive=True))
+        with closing(self.connect()) as con:
+            indexed = {r[0]: (r[1], r[2]) for r in
+                       con.execute("SELECT db_path, mtime_ns, size FROM dbs")}
+        # only the new or modified files are read
+        to_read = {}
+        for f in sorted(files):
+            st = os.stat(f)
+            if indexed.get(f) != (st.st_mtime_ns, st.st_size):
+                to_read[f] = (st.st_mtime_ns, st.st_size)
+        folders = [os.path.join(os.path.abspath(f), "") for f in folders]
+        removed = [f for f in indexed if f not in files and f.startswith(tuple(folders))]
+        all_rows = []
+        if len(to_read) > 0:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                all_rows = list(executor.map(_read_db_catalog_rows_or_error, to_read.keys(), chunksize=8))
+        with closing(self.connect()) as con:
+            with con:
+                for f in removed + list(to_read.keys()):
+                    con.execute("DELETE FROM dbs WHERE db_path=?", (f,))
+                for (f, stat), rows in zip(to_read.items(), all_rows):
+                    self.insert_db(con, f, stat, rows)
+        return len(to_read)
+
+    @staticmethod
+    def insert_db(con, db_path, stat, rows):
+        if "error" in rows:
+            con.execute("INSERT INTO dbs (db_path, mtime_ns, size, error) VALUES (?, ?, ?, ?)",
+                        (db_path, *stat, rows.error))
+            return
+        con.execute("INSERT INTO dbs (db_path, mtime_ns, size, patient_id, body_weight_kg) "
+                    "VALUES (?, ?, ?, ?, ?)", (db_path, *stat, *rows.patient))
+        con.executemany("INSERT INTO timepoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(db_path, *r) for r in rows.timepoints])
+        con.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(db_path, *r) for r in rows.images])
+        con.executemany("INSERT INTO rois VALUES (?, ?, ?, ?)",
+                        [(db_path, *r) for r in rows.rois])
+
+    def number_of_dbs(self):
+        # the db files that cannot be read are not counted
+        with closing(self.connect()) as con:
+            return con.execute("SELECT COUNT(*) FROM dbs WHERE error IS NULL").fetchone()[0]
+
+    def errors(self):
+        """
+        Return the db files (list of Box) that cannot be read, with the error
+        """
+        with closing(self.connect()) as con:
+            return [Box(db_path=r[0], error=r[1]) for r in
+                    con.execute("SELECT db_path, error FROM dbs WHERE error IS NOT NULL ORDER BY db_path")]
+
+    def query_timepoints(self, image_types=None, rois=None, cycle_id=None, patient_id=None):
+        """
+        Return the timepoints (list of Box) that have all the image types
+        (e.g. ["SPECT", "CT"]) and all the rois (e.g. ["liver"]), optionally
+        for one cycle id and/or one patient id.
+        """
+        sql = ("SELECT t.db_path, d.patient_id, t.cycle_id, t.timepoint_id, "
+               "t.injection_datetime, t.acquisition_datetime "
+               "FROM timepoints t JOIN dbs d ON d.db_path = t.db_path WHERE 1")
+        tp_cond = ("db_path = t.db_path AND cycle_id = t.cycle_id "
+                   "AND timepoint_id = t.timepoint_id")
+        params = []
+        for image_type in image_types or []:
+            sql += f" AND EXISTS (SELECT 1 FROM images WHERE {tp_cond} AND image_type = ?)"
+            params.append(image_type)
+        for roi in rois or []:
+            sql += f" AND EXISTS (SELECT 1 FROM rois WHERE {tp_cond} AND roi_name = ?)"
+            params.append(roi)
+        if cycle_id is not None:
+            sql += " AND t.cycle_id = ?"
+            params.append(cycle_id)
+        if patient_id is not None:
+            sql += " AND d.patient_id = ?"
+            params.append(patient_id)
+        sql += " ORDER BY t.db_path, t.cycle_id, t.acquisition_datetime"
+        keys = ["db_path", "patient_id", "cycle_id", "timepoint_id",
+                "injection_datetime", "acquisition_datetime"]
+        with closing(self.connect(create=False)) as con:
+            return [Box(zip(keys, r)) for r in con.execute(sql, params)]
+
+    def query_images(self, image_type=None, unit=None, cycle_id=None):
+        """
+        Return the images (list of Box) of this type and unit, with their path
+        """
+        sql = ("SELECT i.db_path, d.patient_id, i.cycle_id, i.timepoint_id, "
+               "i.image_name, i.image_type, i.unit, i.filename "
+               "FROM images i JOIN dbs d ON d.db_path = i.db_path WHERE 1")
+        params = []
+        for key, value in [("image_type", image_type), ("unit", unit), ("cycle_id", cycle_id)]:
+            if value is not None:
+                sql += f" AND i.{key} = ?"
+                params.append(value)
+        keys = ["db_path", "patient_id", "cycle_id", "timepoint_id",
+                "image_name", "image_type", "unit", "filename"]
+        with closing(self.connect(create=False)) as con:
+            images = [Box(zip(keys, r)) for r in con.execute(sql, params)]
+        for im in images:
+            im.image_file_path = os.path.join(os.path.dirname(im.db_path), im.cycle_id,
+                                              im.timepoint_id, im.filename)
+        return images
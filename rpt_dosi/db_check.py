@@ -0,0 +1,93 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from box import Box
+from . import images as rim
+
+
+def check_image_files(path, checksum=None, check_sidecar=True, verify_checksum=False):
+    """
+    Check the files of an image (or roi) of a db: the file, the raw file of a
+    mhd, the json sidecar and the checksum (if recorded).
+    Return the list of errors (empty if ok).
+    """
+    if not os.path.exists(path):
+        return [f"the file does not exist"]
+    errors = []
+    for raw_path in rim.image_data_file_paths(path)[1:]:
+        if raw_path is None:
+            errors.append(f"no raw file in the mhd header")
+        elif not os.path.exists(raw_path):
+            errors.append(f"the raw file {raw_path} does not exist")
+    if check_sidecar:
+        try:
+            with open(f"{path}.json") as f:
+                data = json.load(f)
+            if data.get("filename") != os.path.basename(path):
+                errors.append(f'the sidecar filename is {data.get("filename")}')
+        except FileNotFoundError:
+            errors.append(f"the json sidecar does not exist")
+        except ValueError as e:
+            errors.append(f"invalid json sidecar: {e}")
+    if verify_checksum and checksum is not None and len(errors) == 0:
+        if rim.image_file_checksum(path) != checksum:
+            errors.append(f"the content is different from the recorded checksum")
+    return errors
+
+
+def db_files_to_check(db):
+    # all the images and rois of the db, without reading them
+    files = []
+    for cycle in db.cycles.values():
+        for tp in cycle.timepoints.values():
+            checksums = tp.image_checksums()
+            for name, path in tp.image_file_paths().items():
+                files.append(Box(cycle_id=cycle.cycle_id, timepoint_id=tp.timepoint_id,
+                                 kind="image", name=name, path=str(path),
+                                 checksum=checksums[name]))
+            checksums = tp.roi_checksums()
+            for name, path in tp.roi_file_paths().items():
+                files.append(Box(cycle_id=cycle.cycle_id, timepoint_id=tp.timepoint_id,
+                                 kind="roi", name=name, path=str(path),
+                                 checksum=checksums[name]))
+    return files
+
+
+def db_check_files(db, check_sidecars=True, verify_checksums=False, max_workers=16):
+    """
+    Check all the files of the db with a pool of threads (the checks are
+    mostly stat and small reads, faster in parallel on network storage).
+    Return a report (Box) with ok, the number of checked files and checksums,
+    and the list of files with errors.
+    """
+    t = time.time()
+    files = db_files_to_check(db)
+
+    def check(f):
+        return check_image_files(f.path, f.checksum, check_sidecars, verify_checksums)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_errors = list(executor.map(check, files))
+    report = Box()
+    report.db_file_path = db.db_file_path
+    report.number_of_files = len(files)
+    report.number_of_checksums = 0
+    if verify_checksums:
+        report.number_of_checksums = sum(f.checksum is not None for f in files)
+    report.errors = []
+    for f, errors in zip(files, all_errors):
+        if len(errors) > 0:
+            f.errors = errors
+            report.errors.append(f)
+    report.ok = len(report.errors) == 0
+    report.duration_s = time.time() - t
+    return report
+
+
+def db_check_report_str(report):
+    s = (f'Checking files : {report.ok} -- {report.number_of_files} files '
+         f'({report.number_of_checksums} checksums) in {report.duration_s:.2f} s')
+    for f in report.errors:
+        s += f'\n{f.cycle_id} {f.timepoint_id} {f.kind} {f.name} {f.path}: {", ".join(f.errors)}'
+    return s
@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from .utils import fatal
+
+# file extensions of the databases stored with sqlite (else json)
+sqlite_extensions = [".sqlite", ".sqlite3", ".db"]
+
+
+def get_db_storage(filename):
+    """
+    Storage of a PatientTreatmentDatabase, according to the file extension
+    """
+    ext = os.path.splitext(str(filename))[1].lower()
+    if ext in sqlite_extensions:
+        return SqliteDatabaseStorage(filename)
+    return JsonDatabaseStorage(filename)
+
+
+def db_to_nodes(data):
+    """
+    Split the dict of a db (json layout) into one node per patient, cycle and
+    timepoint. Nodes are stored as json strings, with keys:
+    () for the patient, (cycle_id,) for a cycle, (cycle_id, tp_id) for a timepoint.
+    """
+    nodes = {(): json.dumps({k: v for k, v in data.items() if k != "cycles"})}
+    for cid, cycle in data["cycles"].items():
+        nodes[(cid,)] = json.dumps({k: v for k, v in cycle.items() if k != "timepoints"})
+        for tid, tp in cycle["timepoints"].items():
+            nodes[(cid, tid)] = json.dumps(tp)
+    return nodes
+
+
+def nodes_to_db(nodes):
+    # nodes are ordered (cycles and timepoints are in the order of the dict)
+    data = json.loads(nodes[()])
+    data["cycles"] = {}
+    for key, value in nodes.items():
+        if len(key) == 1:
+            data["cycles"][key[0]] = json.loads(value)
+            data["cycles"][key[0]]["timepoints"] = {}
+    for key, value in nodes.items():
+        if len(key) == 2:
+            data["cycles"][key[0]]["timepoints"][key[1]] = json.loads(value)
+    return data
+
+
+class JsonDatabaseStorage:
+    """
+    The whole db in a single json file: any write rewrites the whole file
+    (atomically). This is the default and the import/export format.
+    """
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+
+    def read_dict(self):
+        with open(self.filename) as f:
+            return json.load(f)
+
+    def read(self, db):
+        db.load_from_json(self.filename)
+
+    def write(self, db):
+        db.save_to_json(self.filename)
+
+
+class SqliteDatabaseStorage:
+    """
+    The db in a sqlite file, one row per patient, cycle and timepoint.
+    - a write only updates the rows of the modified cycles and timepoints, in
+      a single transaction. Rows added by another process (since the read)
+      are kept, so parallel workers can update different timepoints.
+    - the WAL journal allows readers while writing (the file must be on a
+      local file system).
+    """
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        # nodes of the last read or write (None: nothing read yet)
+        self._stored_nodes = None
+
+    def connect(self):
+        con = sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS patient "
+                    "(id INTEGER PRIMARY KEY CHECK (id = 0), data TEXT NOT NULL)")
+        con.execute("CREATE TABLE IF NOT EXISTS cycles "
+                    "(cycle_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        con.execute("CREATE TABLE IF NOT EXISTS timepoints "
+                    "(cycle_id TEXT NOT NULL, timepoint_id TEXT NOT NULL, data TEXT NOT NULL, "
+                    "PRIMARY KEY (cycle_id, timepoint_id))")
+        return con
+
+    def read_nodes(self):
+        with closing(self.connect()) as con:
+            # a single read transaction (consistent with concurrent writes)
+            con.execute("BEGIN")
+            row = con.execute("SELECT data FROM patient").fetchone()
+            if row is None:
+                fatal(f"The database file {self.filename} has no patient")
+            nodes = {(): row[0]}
+            for cid, data in con.execute("SELECT cycle_id, data FROM cycles ORDER BY rowid"):
+                nodes[(cid,)] = data
+            for cid, tid, data in con.execute(
+                    "SELECT cycle_id, timepoint_id, data FROM timepoints ORDER BY rowid"):
+                nodes[(cid, tid)] = data
+            con.execute("COMMIT")
+        return nodes
+
+    def read_dict(self):
+        self._stored_nodes = self.read_nodes()
+        return nodes_to_db(self._stored_nodes)
+
+    def read(self, db):
+        try:
+            data = self.read_dict()
+        except sqlite3.Error as e:
+            fatal(f"Unexpected Error while reading {self.filename}: {e}")
+        db.from_dict(data)
+
+    def write_dict(self, data):
+        """
+        Write the modified nodes (since the last read or write) and remove the
+        removed ones. If nothing was read, the whole content is replaced.
+        """
+        nodes = db_to_nodes(data)
+        stored = self._stored_nodes
+        with closing(self.connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if stored is None:
+                    for table in ["patient", "cycles", "timepoints"]:
+                        con.execute(f"DELETE FROM {table}")
+                    stored = {}
+                for key, value in nodes.items():
+                    if stored.get(key) != value:
+                        self.upsert_node(con, key, value)
+                for key in stored:
+                    if key not in nodes:
+                        self.delete_node(con, key)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+        self._stored_nodes = nodes
+
+    @staticmethod
+    def upsert_node(con, key, value):
+        # 'on conflict do update' keeps the rowid, so the order is kept
+        if len(key) == 0:
+            con.execute("INSERT INTO patient VALUES (0, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET data=excluded.data", (value,))
+        if len(key) == 1:
+            con.execute("INSERT INTO cycles VALUES (?, ?) "
+                        "ON CONFLICT(cycle_id) DO UPDATE SET data=excluded.data", (*key, value))
+        if len(key) == 2:
+            con.execute("INSERT INTO timepoints VALUES (?, ?, ?) "
+                        "ON CONFLICT(cycle_id, timepoint_id) DO UPDATE SET data=excluded.data",
+                        (*key, value))
+
+    @staticmethod
+    def delete_node(con, key):
+        if len(key) == 1:
+            con.execute("DELETE FROM cycles WHERE cycle_id=?", key)
+            con.execute("DELETE FROM timepoints WHERE cycle_id=?", key)
+        if len(key) == 2:
+            con.execute("DELETE FROM timepoints WHERE cycle_id=? AND timepoint_id=?", key)
+
+    def write(self, db):
+        try:
+            self.write_dict(db.to_dict())
+        except sqlite3.Error as e:
+            fatal(f"Unexpected Error while writing {self.filename}: {e}")
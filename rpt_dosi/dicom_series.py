@@ -0,0 +1,341 @@
+import numpy as np
+import pydicom
+import SimpleITK as sitk
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from . import utils as rhe
+from . import images as rim
+from .utils import fatal
+
+
+def dicom_read_acquisition_datetime(ds):
+    try:
+        # extract the date and time
+        date = ds.AcquisitionDate  # DICOM date tag (0008,0022)
+        time = ds.AcquisitionTime  # DICOM time tag (0008,0032)
+
+        # convert to datetime object
+        dt = dicom_date_to_str(date, time)
+        return dt
+    except:
+        fatal(f"Cannot read dicom tag Acquisition Date/Time")
+
+
+def dicom_date_to_str(date, time):
+    s = str(datetime.strptime(date + time.split(".")[0], "%Y%m%d%H%M%S"))
+    return s
+
+
+def dicom_read_injection(ds):
+    """
+    (0054, 0016)  Radiopharmaceutical Information Sequence  1 item(s) ----
+       (0018, 0031) Radiopharmaceutical                 LO: 'LU177'
+       (0018, 1071) Radiopharmaceutical Volume          DS: '9.5'
+       (0018, 1072) Radiopharmaceutical Start Time      TM: '100400.000'
+       (0018, 1073) Radiopharmaceutical Stop Time       TM: '100400.000'
+       (0018, 1074) Radionuclide Total Dose             DS: '7257.568359375'
+       (0018, 1075) Radionuclide Half Life              DS: '574380.0'
+       (0018, 1078) Radiopharmaceutical Start DateTime  DT: '20231012100400'
+       (0018, 1079) Radiopharmaceutical Stop DateTime   DT: '20231012100400'
+       (0054, 0300)  Radionuclide Code Sequence  1 item(s) ----
+    """
+
+    try:
+        # Read the Radiopharmaceutical Information Sequence tag
+        rad_info = ds[(0x0054, 0x0016)].value
+
+        if len(rad_info) != 1:
+            fatal(f"The dicom tag Radiopharmaceutical sequence is not equal to 1")
+
+        item = rad_info[0]
+
+        # Read the Radiopharmaceutical tag
+        radiopharmaceutical = item[(0x0018, 0x0031)].value
+
+        # Read the Radionuclide Total Dose tag
+        total_dose = item[(0x0018, 0x1074)].value
+
+        # Read the Radiopharmaceutical Start DateTime tag
+        start_datetime = item[(0x0018, 0x1078)].value
+        dt = str(datetime.strptime(start_datetime, "%Y%m%d%H%M%S"))
+
+        return {
+            "radionuclide": radiopharmaceutical,
+            "datetime": dt,
+            "activity_MBq": total_dose,
+        }
+    except:
+        s = f"Cannot read dicom tag Radiopharmaceutical"
+        raise Exception(s)
+
+
+def list_dicom_files(directory):
+    # Recursively walk through directory (once)
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(".dcm"):
+                filepaths.append(os.path.join(dirpath, filename))
+    return filepaths
+
+
+def dicom_input_files(path):
+    # a dicom file, or all the dicom files of a folder
+    if os.path.isdir(path):
+        return sorted(list_dicom_files(path))
+    return [str(path)]
+
+
+def read_series_uid(filepath):
+    ds = pydicom.dcmread(filepath, stop_before_pixels=True, specific_tags=["SeriesInstanceUID"])
+    return ds.get("SeriesInstanceUID")
+
+
+def dicom_files_by_series(folder, max_workers=None):
+    # the dicom files of a folder (not recursive), by series uid
+    filepaths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".dcm"))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        uids = list(executor.map(read_series_uid, filepaths))
+    series = {}
+    for uid, filepath in zip(uids, filepaths):
+        series.setdefault(uid, []).append(filepath)
+    return series
+
+
+def read_dicom_slice(filepath):
+    # read the dataset and decode the pixels (the decoders mostly release the GIL)
+    ds = pydicom.dcmread(filepath)
+    return ds, ds.pixel_array
+
+
+def dicom_orientation(ds):
+    """
+    Row and column direction cosines and the slice normal, from the
+    ImageOrientationPatient (or the first detector for NM images)
+    """
+    orientation = ds.get("ImageOrientationPatient")
+    if orientation is None and "DetectorInformationSequence" in ds:
+        orientation = ds.DetectorInformationSequence[0].get("ImageOrientationPatient")
+    if orientation is None:
+        orientation = [1, 0, 0, 0, 1, 0]
+    orientation = np.array(orientation, dtype=np.float64)
+    row, col = orientation[:3], orientation[3:]
+    return row, col, np.cross(row, col)
+
+
+def dicom_position(ds):
+    position = ds.get("ImagePositionPatient")
+    if position is None and "DetectorInformationSequence" in ds:
+        position = ds.DetectorInformationSequence[0].get("ImagePositionPatient")
+    if position is None:
+        position = [0, 0, 0]
+    return np.array(position, dtype=np.float64)
+
+
+def dicom_rescale(ds):
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    intercept = float(ds.get("RescaleIntercept", 0) or 0)
+    return slope, intercept
+
+
+def sort_dicom_slices(datasets):
+    """
+    Return the indices of the slices sorted by their position along the slice
+    normal (or by InstanceNumber if there is no position), and the positions.
+    """
+    _, _, normal = dicom_orientation(datasets[0])
+    positions = np.array([dicom_position(ds) for ds in datasets])
+    distances = positions @ normal
+    if len(datasets) > 1 and np.ptp(distances) == 0:
+        numbers = [int(ds.get("InstanceNumber", 0) or 0) for ds in datasets]
+        order = np.argsort(numbers, kind="stable")
+    else:
+        order = np.argsort(distances, kind="stable")
+    return order, distances[order]
+
+
+def read_dicom_slices(filepaths, max_workers=None):
+    # list of (dataset, pixels), the files are decoded in a pool of threads
+    if len(filepaths) == 0:
+        fatal(f"No dicom files to read")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(read_dicom_slice, filepaths))
+
+
+def read_dicom_series(filepaths, pixel_type="float", max_workers=None):
+    """
+    Read the dicom files of a single series (2D slices, or one multi-frame
+    file) and return a SimpleITK image, with the rescale slope/intercept
+    applied (e.g. HU for CT) and the geometry of the dicom.
+
+    The slices are decoded in a pool of threads and sorted by position.
+    pixel_type: 'float' (float32 or float64 according to the pixel
+    precision) or 'auto' (the stored type if there is no rescale).
+    """
+    slices = read_dicom_slices(filepaths, max_workers)
+    return dicom_slices_to_image(slices, pixel_type)
+
+
+def dicom_slices_to_image(slices, pixel_type="float"):
+    # see read_dicom_series
+    datasets = [s[0] for s in slices]
+    series_uids = set(ds.get("SeriesInstanceUID") for ds in datasets)
+    if len(series_uids) > 1:
+        fatal(f"Several DICOM series found ({len(series_uids)}) in {datasets[0].filename}")
+    ds0 = datasets[0]
+    row, col, normal = dicom_orientation(ds0)
+    pixel_spacing = [float(s) for s in ds0.get("PixelSpacing", [1, 1])]
+
+    if len(datasets) == 1:
+        # a single (multi-frame) file
+        a = slices[0][1]
+        if a.ndim == 2:
+            a = a[np.newaxis]
+        slope, intercept = dicom_rescale(ds0)
+        slopes = np.full(len(a), slope)
+        intercepts = np.full(len(a), intercept)
+        z_spacing = ds0.get("SpacingBetweenSlices") or ds0.get("SliceThickness") or 1
+        z_spacing = float(z_spacing)
+        if z_spacing < 0:
+            # the frames are in the opposite direction of the normal
+            normal, z_spacing = -normal, -z_spacing
+        origin = dicom_position(ds0)
+    else:
+        order, distances = sort_dicom_slices(datasets)
+        shapes = set(slices[i][1].shape for i in order)
+        if len(shapes) > 1 or slices[order[0]][1].ndim != 2:
+            fatal(f"The DICOM slices have different sizes {shapes} in {datasets[0].filename}")
+        a = np.stack([slices[i][1] for i in order])
+        rescales = np.array([dicom_rescale(datasets[i]) for i in order])
+        slopes, intercepts = rescales[:, 0], rescales[:, 1]
+        steps = np.diff(distances)
+        z_spacing = float(np.mean(steps))
+        if z_spacing == 0:
+            z_spacing = float(ds0.get("SliceThickness") or 1)
+        elif np.ptp(steps) > 1e-3 * abs(z_spacing):
+            rhe.warning(f"The DICOM slices are not equally spaced "
+                        f"({steps.min()} to {steps.max()} mm), {z_spacing} mm is used")
+        origin = dicom_position(datasets[order[0]])
+
+    # rescale (vectorised, one slope/intercept per slice)
+    rescaled = np.any(slopes != 1) or np.any(intercepts != 0)
+    if pixel_type == "float" or rescaled:
+        dtype = rim.float_array_dtype(a)
+        a = a.astype(dtype)
+        if np.any(slopes != 1):
+            a *= slopes.astype(dtype)[:, np.newaxis, np.newaxis]
+        if np.any(intercepts != 0):
+            a += intercepts.astype(dtype)[:, np.newaxis, np.newaxis]
+    elif pixel_type != "auto":
+        fatal(f"Unknown pixel type '{pixel_type}', must be 'float' or 'auto'")
+
+    img = sitk.GetImageFromArray(np.ascontiguousarray(a))
+    img.SetSpacing([pixel_spacing[1], pixel_spacing[0], z_spacing])
+    img.SetOrigin(origin.tolist())
+    # the columns of the direction matrix are the directions of the x,y,z axes
+    img.SetDirection(np.stack([row, col, normal], axis=1).flatten().tolist())
+    return img
+
+
+def convert_dicom_series_to_image(filepaths, output_filename, pixel_type="float", max_workers=None):
+    img = read_dicom_series(filepaths, pixel_type, max_workers)
+    sitk.WriteImage(img, str(output_filename))
+    return img
+
+
+def convert_dicom_series_to_metaimage(filepaths, output_filename, image_type="CT",
+                                      max_workers=None, **kwargs):
+    """
+    Convert the dicom series and create the metaimage (json sidecar), with
+    the acquisition datetime of the dicom if any. kwargs are the required
+    parameters of the image type (e.g. unit for SPECT).
+    """
+    convert_dicom_series_to_image(filepaths, output_filename, "float", max_workers)
+    im = rim.new_metaimage(image_type, output_filename, overwrite=True, **kwargs)
+    ds = pydicom.dcmread(filepaths[0], stop_before_pixels=True)
+    if "AcquisitionDate" in ds and "AcquisitionTime" in ds:
+        im.acquisition_datetime = dicom_read_acquisition_datetime(ds)
+    im.write_metadata()
+    return im
+
+
+# DICOM Units (0054,1001) of NM/PET images and the corresponding SPECT units
+dicom_spect_units = {"BQML": "Bq/mL", "BQ": "Bq"}
+
+
+def dicom_spect_unit(ds, unit=None):
+    # the given unit, or the one of the dicom
+    if unit is not None:
+        return unit
+    dicom_unit = str(ds.get("Units", "")).upper()
+    if dicom_unit not in dicom_spect_units:
+        fatal(f"The SPECT unit cannot be found from the dicom Units '{dicom_unit}' "
+              f"({ds.filename}), please provide the unit")
+    return dicom_spect_units[dicom_unit]
+
+
+def convert_nm_dicom_to_spect(filepaths, output_filename, unit=None, max_workers=None):
+    """
+    Convert a reconstructed NM dicom (a multi-frame file, or a list of slices)
+    into a MetaImageSPECT: the files are read only once, the json sidecar
+    contains the unit, the acquisition datetime, and the injection activity
+    and datetime (from the Radiopharmaceutical Information Sequence).
+    """
+    if isinstance(filepaths, (str, os.PathLike)):
+        filepaths = [filepaths]
+    slices = read_dicom_slices(filepaths, max_workers)
+    ds = slices[0][0]
+    unit = dicom_spect_unit(ds, unit)
+    img = dicom_slices_to_image(slices, "float")
+    sitk.WriteImage(img, str(output_filename))
+    spect = rim.new_metaimage("SPECT", output_filename, overwrite=True, unit=unit)
+    if "AcquisitionDate" in ds and "AcquisitionTime" in ds:
+        spect.acquisition_datetime = dicom_read_acquisition_datetime(ds)
+    try:
+        injection = dicom_read_injection(ds)
+        spect.injection_datetime = injection["datetime"]
+        spect.injection_activity_mbq = float(injection["activity_MBq"])
+    except Exception:
+        rhe.warning(f"No injection information in {ds.filename}")
+    spect.write_metadata()
+    return spect
+
+
+def convert_dicom_to_metaimage(filepaths, output_filename, modality, unit=None, max_workers=None):
+    # CT dicom to a CT metaimage, NM dicom to a SPECT metaimage
+    if modality == "CT":
+        return convert_dicom_series_to_metaimage(filepaths, output_filename, "CT", max_workers)
+    if modality == "NM":
+        return convert_nm_dicom_to_spect(filepaths, output_filename, unit, max_workers)
+    fatal(f"Cannot convert the dicom modality '{modality}', only CT and NM are supported")
+
+
+def _convert_dicom_to_metaimage(filepaths, output_filename, modality, unit):
+    # in a worker process: only the filename is returned
+    convert_dicom_to_metaimage(filepaths, output_filename, modality, unit, max_workers=1)
+    return str(output_filename)
+
+
+def iter_convert_dicoms_to_metaimages(jobs, max_workers=None):
+    """
+    Convert several dicom series in parallel (one process per series).
+    jobs is a list of (filepaths, output_filename, modality, unit). The index
+    of the job and the metaimage (metadata only) are yielded as soon as each
+    conversion is done.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_convert_dicom_to_metaimage, *job): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            output = future.result()
+            yield futures[future], rim.read_metaimage(output, reading_mode="metadata_only")
+
+
+def iter_convert_nm_dicoms_to_spects(jobs, unit=None, max_workers=None):
+    """
+    Convert several NM dicom series in parallel, jobs is a list of
+    (filepaths, output_filename), see iter_convert_dicoms_to_metaimages
+    """
+    jobs = [(filepaths, output, "NM", unit) for filepaths, output in jobs]
+    return iter_convert_dicoms_to_metaimages(jobs, max_workers)
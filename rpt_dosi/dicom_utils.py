@@ -2,107 +2,185 @@ from datetime import datetime
 import os
 import pydicom
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from box import Box
 import questionary
-from rpt_dosi.utils import fatal
+from rpt_dosi.utils import fatal, warning
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font as tkFont
 import json
-import gatetools as gt
-import itk
+import sqlite3
+import hashlib
+from contextlib import closing
 import subprocess
+from rpt_dosi import dicom_series as rds
+from rpt_dosi.dicom_series import dicom_read_acquisition_datetime, dicom_date_to_str
+from rpt_dosi.dicom_series import dicom_read_injection, list_dicom_files
 
 
-def dicom_read_acquisition_datetime(ds):
-    try:
-        # extract the date and time
-        date = ds.AcquisitionDate  # DICOM date tag (0008,0022)
-        time = ds.AcquisitionTime  # DICOM time tag (0008,0032)
-
-        # convert to datetime object
-        dt = dicom_date_to_str(date, time)
-        return dt
-    except:
-        fatal(f"Cannot read dicom tag Acquisition Date/Time")
-
+# tags read by list_dicom_studies_and_series (see store_dicom_information)
+dicom_header_tags = ["StudyInstanceUID", "SeriesInstanceUID", "Modality",
+                     "StudyDescription", "SeriesDescription",
+                     "AcquisitionDate", "AcquisitionTime",
+                     "ContentDate", "ContentTime",
+                     "InstanceCreationDate", "InstanceCreationTime",
+                     (0x0054, 0x0016)]
 
-def dicom_date_to_str(date, time):
-    s = str(datetime.strptime(date + time.split(".")[0], "%Y%m%d%H%M%S"))
-    return s
 
-
-def dicom_read_injection(ds):
+def read_dicom_header(filepath, tags=None):
     """
-    (0054, 0016)  Radiopharmaceutical Information Sequence  1 item(s) ----
-       (0018, 0031) Radiopharmaceutical                 LO: 'LU177'
-       (0018, 1071) Radiopharmaceutical Volume          DS: '9.5'
-       (0018, 1072) Radiopharmaceutical Start Time      TM: '100400.000'
-       (0018, 1073) Radiopharmaceutical Stop Time       TM: '100400.000'
-       (0018, 1074) Radionuclide Total Dose             DS: '7257.568359375'
-       (0018, 1075) Radionuclide Half Life              DS: '574380.0'
-       (0018, 1078) Radiopharmaceutical Start DateTime  DT: '20231012100400'
-       (0018, 1079) Radiopharmaceutical Stop DateTime   DT: '20231012100400'
-       (0054, 0300)  Radionuclide Code Sequence  1 item(s) ----
+    Read only some tags of the dicom header (all tags if None), the file
+    reading stops before the pixel data.
     """
+    return pydicom.dcmread(filepath, stop_before_pixels=True, specific_tags=tags)
 
-    try:
-        # Read the Radiopharmaceutical Information Sequence tag
-        rad_info = ds[(0x0054, 0x0016)].value
-
-        if len(rad_info) != 1:
-            fatal(f"The dicom tag Radiopharmaceutical sequence is not equal to 1")
 
-        item = rad_info[0]
+def read_dicom_file_information(filepath):
+    # return (study_uid, series_uid, info), or (None, None, error message)
+    try:
+        ds = read_dicom_header(filepath, dicom_header_tags)
+        study_uid = ds.StudyInstanceUID
+        series_uid = ds.SeriesInstanceUID
+        info = store_dicom_information(ds)
+        info["filepath"] = filepath
+        return study_uid, series_uid, info
+    except Exception as e:
+        return None, None, f"Could not read {filepath}: {str(e)}"
 
-        # Read the Radiopharmaceutical tag
-        radiopharmaceutical = item[(0x0018, 0x0031)].value
 
-        # Read the Radionuclide Total Dose tag
-        total_dose = item[(0x0018, 0x1074)].value
+def list_dicom_studies_and_series(directory, max_workers=None):
+    """
+    Read the header of all dicom files (.dcm) in the directory, in parallel
+    (process pool, max_workers=1 to read in this process), and group them
+    per study and series. The files are in the order of the directory walk.
+    """
+    studies = defaultdict(lambda: defaultdict(list))
+    filepaths = list_dicom_files(directory)
+    results = []
+    if len(filepaths) > 0 and max_workers == 1:
+        results = [read_dicom_file_information(f) for f in
+                   tqdm(filepaths, desc="Reading DICOM files")]
+    elif len(filepaths) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(tqdm(executor.map(read_dicom_file_information, filepaths, chunksize=64),
+                                total=len(filepaths), desc="Reading DICOM files"))
+    for study_uid, series_uid, info in results:
+        if study_uid is None:
+            warning(info)
+        else:
+            studies[study_uid][series_uid].append(info)
+    return studies
 
-        # Read the Radiopharmaceutical Start DateTime tag
-        start_datetime = item[(0x0018, 0x1078)].value
-        dt = str(datetime.strptime(start_datetime, "%Y%m%d%H%M%S"))
-
-        return {
-            "radionuclide": radiopharmaceutical,
-            "datetime": dt,
-            "activity_MBq": total_dose,
-        }
-    except:
-        s = f"Cannot read dicom tag Radiopharmaceutical"
-        raise Exception(s)
 
+class DicomIndex:
+    """
+    Persistent index of the dicom files of a folder (sqlite file, by default
+    in the folder, or in the user cache if the folder is read only), with the
+    information of list_dicom_studies_and_series.
+    The files are identified by their path, size and modification time: an
+    update only reads the new or modified files, and removes the deleted ones.
+    """
 
-def count_files(directory):
-    return sum([len(files) for r, d, files in os.walk(directory)])
+    def __init__(self, directory, index_filename=None, max_workers=None):
+        self.directory = directory
+        if index_filename is None:
+            index_filename = default_dicom_index_filename(directory)
+        self.index_filename = index_filename
+        # number of processes to read the files (see list_dicom_studies_and_series)
+        self.max_workers = max_workers
+
+    def connect(self):
+        con = sqlite3.connect(self.index_filename, timeout=60)
+        con.execute("CREATE TABLE IF NOT EXISTS files ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                    "study_uid TEXT, series_uid TEXT, info TEXT)")
+        return con
+
+    def update(self):
+        """
+        Read the new or modified files. Return the number of read and removed files.
+        """
+        files = {}
+        for filepath in list_dicom_files(self.directory):
+            st = os.stat(filepath)
+            files[os.path.relpath(filepath, self.directory)] = (st.st_size, st.st_mtime_ns)
+        with closing(self.connect()) as con:
+            indexed = {r[0]: (r[1], r[2]) for r in
+                       con.execute("SELECT path, size, mtime_ns FROM files")}
+        to_read = [p for p, stat in files.items() if indexed.get(p) != stat]
+        removed = [p for p in indexed if p not in files]
+        # read the files in parallel
+        filepaths = [os.path.join(self.directory, p) for p in to_read]
+        results = []
+        if len(filepaths) > 0 and self.max_workers == 1:
+            results = [read_dicom_file_information(f) for f in
+                       tqdm(filepaths, desc="Reading DICOM files")]
+        elif len(filepaths) > 0:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(tqdm(executor.map(read_dicom_file_information, filepaths, chunksize=64),
+                                    total=len(filepaths), desc="Reading DICOM files"))
+        rows = []
+        for p, (study_uid, series_uid, info) in zip(to_read, results):
+            if study_uid is None:
+                # the error is kept, the file is not read again if not modified
+                warning(info)
+                info = {"error": info}
+            else:
+                info.pop("filepath")
+            rows.append((p, *files[p], study_uid, series_uid, json.dumps(info)))
+        with closing(self.connect()) as con:
+            with con:
+                con.executemany("DELETE FROM files WHERE path=?", [(p,) for p in removed])
+                con.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(to_read), len(removed)
+
+    def studies(self):
+        """
+        Same studies/series structure as list_dicom_studies_and_series
+        (the files of a series are sorted by path)
+        """
+        studies = defaultdict(lambda: defaultdict(list))
+        with closing(self.connect()) as con:
+            for path, study_uid, series_uid, info in con.execute(
+                    "SELECT path, study_uid, series_uid, info FROM files "
+                    "WHERE study_uid IS NOT NULL ORDER BY path"):
+                info = json.loads(info)
+                info["filepath"] = os.path.join(self.directory, path)
+                studies[study_uid][series_uid].append(info)
+        return studies
+
+
+def dicom_index_studies(directory, index_filename=None, max_workers=None):
+    """
+    Update the persistent index of the directory and return its studies
+    (see DicomIndex and list_dicom_studies_and_series)
+    """
+    try:
+        index = DicomIndex(directory, index_filename, max_workers)
+        n_read, n_removed = index.update()
+        studies = index.studies()
+    except (sqlite3.Error, OSError) as e:
+        warning(f"Cannot use the DICOM index of {directory} ({e}), "
+                f"the folder is scanned without index")
+        return list_dicom_studies_and_series(directory, max_workers)
+    print(f"DICOM index {index.index_filename}: {n_read} files read, {n_removed} removed")
+    return studies
 
 
-def list_dicom_studies_and_series(directory):
-    studies = defaultdict(lambda: defaultdict(list))
-    total_files = count_files(directory)
-
-    with tqdm(total=total_files, desc="Reading DICOM files") as pbar:
-        # Recursively walk through directory
-        for dirpath, dirnames, filenames in os.walk(directory):
-            for filename in filenames:
-                if filename.endswith(".dcm"):
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        # read dataset
-                        ds = pydicom.dcmread(filepath)
-                        # read uid
-                        study_uid = ds.StudyInstanceUID
-                        series_uid = ds.SeriesInstanceUID
-                        info = store_dicom_information(ds)
-                        info["filepath"] = filepath
-                        studies[study_uid][series_uid].append(info)
-                    except Exception as e:
-                        print(f"Could not read {filepath}: {str(e)}")
-                pbar.update(1)
-    return studies
+def default_dicom_index_filename(directory):
+    """
+    The index is in the dicom folder, or in the user cache folder
+    (one file per folder) when the dicom folder is not writable (CD, archive)
+    """
+    if os.access(directory, os.W_OK):
+        return os.path.join(directory, ".rpt_dicom_index.sqlite")
+    cache = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    cache = os.path.join(cache, "rpt_dosi", "dicom_index")
+    os.makedirs(cache, exist_ok=True)
+    h = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()
+    return os.path.join(cache, f"{h}.sqlite")
 
 
 def store_dicom_information(ds):
@@ -320,15 +398,8 @@ def update_selected(cycle, series, tp_id, selected_ids):
 
 
 def convert_ct_dicom_to_image(dicom_folder, output_filename):
-    print(dicom_folder, output_filename)
-    series = gt.separate_series(dicom_folder)
-    series = gt.separate_sequenceName_series(series)
-    print(series)
-    if len(series) >= 1:
-        fatal(f'Cannot read DICOM folder, it contains several series')
-    files = series[0]
-    print(files)
-    itk_image = gt.read_dicom(files)
+    files = list_dicom_files(dicom_folder)
+    return rds.convert_dicom_series_to_metaimage(files, output_filename, "CT")
 
 
 class DicomSelectionGUI(tk.Tk):
@@ -499,20 +570,4 @@ def get_files_in_folder(directory):
 
 
 def convert_dicom_to_image(input_dicom_files, dest_file, pixel_type='float'):
-    series = gt.separate_series(input_dicom_files)
-    # series = gt.separate_sequenceName_series(series)
-
-    input_images = []
-    for serie in series.keys():
-        if len(series[serie]) > 1:
-            input_images.append(gt.read_dicom(series[serie]))
-        elif (len(series[serie]) == 1 and
-              (series[serie][0].endswith(".dcm") or series[serie][0].endswith(".IMA"))):
-            input_images.append(gt.read_3d_dicom(series[serie], flip=True))
-        else:
-            fatal(f'Cannot read DICOM from {input_dicom_files[0]}')
-    if len(input_images) > 1:
-        fatal(f'Several DICOM images found {input_dicom_files[0]}')
-
-    outputImage = gt.image_convert(input_images[0], pixeltype=pixel_type)
-    itk.imwrite(outputImage, dest_file)
+    rds.convert_dicom_series_to_image(input_dicom_files, dest_file, pixel_type)
@@ -4,9 +4,13 @@ from .images import (
     resample_ct_like,
     resample_spect_like,
     resample_roi_like,
-    resample_dose_like
+    resample_dose_like,
+    rois_sums,
+    metaimages_have_same_domain,
+    float_array_dtype,
 )
 from .opendose import (
+    get_svalue_table,
     get_svalue_and_mass_scaling,
     guess_phantom_and_isotope,
 )
@@ -26,7 +30,7 @@ def dose_hanscheid2017(spect_bq_a, roi_a, time_from_injection_h, volume_voxel_m_
 
     # compute mean activity concentration in the ROI
     v = spect_bq_a[roi_a == 1] / volume_voxel_m_l
-    concentration = np.mean(v) / 1e6
+    concentration = np.mean(v, dtype=np.float64) / 1e6
 
     # compute dose
     dose = 0.125 * concentration * np.power(2, time_from_injection_h / effective_time_h) * effective_time_h
@@ -43,7 +47,7 @@ def dose_hanscheid2018(spect_bq_a, roi_a, time_from_injection_h, s_value, mass_s
     """
     # compute mean activity in the ROI, in MBq
     v = spect_bq_a[roi_a == 1]
-    At = np.sum(v) / 1e6
+    At = np.sum(v, dtype=np.float64) / 1e6
 
     # S is in (mGy/MBq/s), so we get dose in mGy
     dose = At * (2 * time_from_injection_h * 3600.0) / np.log(2) * s_value / mass_scaling / 1000.0
@@ -55,7 +59,7 @@ def dose_madsen2018_dose_rate(dose_rate_a, roi_a, time_from_injection_h, effecti
     # compute mean dose rate in the ROI in Gy/s
     # convert to hours
     v = dose_rate_a[roi_a == 1]
-    dr = np.mean(v) * 3600
+    dr = np.mean(v, dtype=np.float64) * 3600
     # print(f'dr = {dr:.3f} Gy/h')
 
     # effective clearance rate
@@ -70,7 +74,7 @@ def dose_hanscheid2018_dose_rate(dose_rate_a, roi_a, time_from_injection_h):
     # compute mean dose rate in the ROI in Gy/s
     v = dose_rate_a[roi_a == 1]
     # convert to hours
-    dr = np.mean(v) * 3600
+    dr = np.mean(v, dtype=np.float64) * 3600
 
     # dose rate in Gy/h
     dose = dr * (2 * time_from_injection_h) / np.log(2)
@@ -82,7 +86,7 @@ def dose_hanscheid2017_dose_rate(dose_rate_a, roi_a, time_from_injection_h, roi_
     # compute mean dose rate in the ROI in Gy/s
     # convert to hours
     v = dose_rate_a[roi_a == 1]
-    dr = np.mean(v) * 3600
+    dr = np.mean(v, dtype=np.float64) * 3600
     # print(f'dr = {dr:.3f} Gy/h')
 
     dose = dr * np.power(2, time_from_injection_h / roi_time_eff_h) * roi_time_eff_h
@@ -100,7 +104,7 @@ def dose_madsen2018(spect_Bq, roi, acq_time_h, svalue, mass_scaling, roi_time_ef
     """
     # compute mean activity in the ROI, in MBq
     v = spect_Bq[roi == 1]
-    At = np.sum(v) / 1e6
+    At = np.sum(v, dtype=np.float64) / 1e6
 
     # effective clearance rate
     k = np.log(2) / (roi_time_eff_h * 3600)
@@ -112,6 +116,61 @@ def dose_madsen2018(spect_Bq, roi, acq_time_h, svalue, mass_scaling, roi_time_ef
     return dose
 
 
+def dose_hanscheid2017_rois(activities_bq, volumes_ml, time_from_injection_h, effective_times_h):
+    """
+    Same as dose_hanscheid2017 for all ROIs at once, the inputs are numpy
+    vectors (one value per ROI): total activity (Bq), volume (mL) and
+    effective time (h).
+    """
+    concentrations = activities_bq / volumes_ml / 1e6
+    doses = 0.125 * concentrations * np.power(2, time_from_injection_h / effective_times_h) * effective_times_h
+    return doses
+
+
+def dose_hanscheid2018_rois(activities_bq, time_from_injection_h, s_values, mass_scalings):
+    """
+    Same as dose_hanscheid2018 for all ROIs at once (numpy vectors, one value
+    per ROI). Output is in Gray
+    """
+    At = activities_bq / 1e6
+    doses = At * (2 * time_from_injection_h * 3600.0) / np.log(2) * s_values / mass_scalings / 1000.0
+    return doses
+
+
+def dose_madsen2018_rois(activities_bq, acq_time_h, svalues, mass_scalings, effective_times_h):
+    """
+    Same as dose_madsen2018 for all ROIs at once (numpy vectors, one value per
+    ROI). Output is in Gray
+    """
+    At = activities_bq / 1e6
+    k = np.log(2) / (effective_times_h * 3600)
+    integrated_activities = At * np.exp(k * acq_time_h * 3600) / k
+    doses = integrated_activities * svalues / mass_scalings / 1000
+    return doses
+
+
+def dose_madsen2018_dose_rate_rois(mean_dose_rates, time_from_injection_h, effective_times_h):
+    # same as dose_madsen2018_dose_rate, mean dose rate (Gy/s) of each ROI
+    dr = mean_dose_rates * 3600
+    k = np.log(2) / effective_times_h
+    doses = dr * np.exp(k * time_from_injection_h) / k
+    return doses
+
+
+def dose_hanscheid2018_dose_rate_rois(mean_dose_rates, time_from_injection_h):
+    # same as dose_hanscheid2018_dose_rate, mean dose rate (Gy/s) of each ROI
+    dr = mean_dose_rates * 3600
+    doses = dr * (2 * time_from_injection_h) / np.log(2)
+    return doses
+
+
+def dose_hanscheid2017_dose_rate_rois(mean_dose_rates, time_from_injection_h, effective_times_h):
+    # same as dose_hanscheid2017_dose_rate, mean dose rate (Gy/s) of each ROI
+    dr = mean_dose_rates * 3600
+    doses = dr * np.power(2, time_from_injection_h / effective_times_h) * effective_times_h
+    return doses
+
+
 def fit_exp_linear(x, y):
     denegative = 1
     if y[0] < 0:
@@ -220,6 +279,343 @@ def triexpo_apply(x, decay_constant_hours, A1, k1, A2, k2, A3, k3):
     )
 
 
+def fit_exp_linear_arrays(x0, x1, y0, y1):
+    # same as fit_exp_linear for arrays of two points curves (x0,y0) (x1,y1)
+    denegative = np.where(y0 < 0, -1.0, 1.0)
+    ly0 = np.log(np.fabs(y0))
+    k = (np.log(y1) - ly0) / (x1 - x0)
+    A = np.exp(ly0 - k * x0) * denegative
+    k = np.where(k > 0, 0.0, k)
+    return A, k
+
+
+def triexpo_fit_arrays(times, activities, as_dict=True):
+    """
+    Same as triexpo_fit for many curves at once (no python loop).
+    activities is an array (..., n_timepoints), like triexpo_fit only the
+    three first timepoints are used. The parameters are arrays of shape (...).
+    """
+    t0 = float(times[0])
+    t1 = float(times[1])
+    t3 = float(times[2])
+    activities = np.asarray(activities, dtype=np.float64)
+    d0 = activities[..., 0].copy()
+    d1 = activities[..., 1].copy()
+    d3 = activities[..., 2].copy()
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        same = (d3 == d1) | (d1 == d0) | (d0 == d3)
+        d0[same] += 0.0001
+        d1[same] += 0.0002
+        d3[same] += 0.0003
+        d1lin = ((d3 - d0) / (t3 - t0)) * t1 + (d0 - ((d3 - d0) / ((t3 - t0)) * t0))
+        A3 = d3 / (np.exp(-0.001 * t3))
+        d1_lowslope = A3 * np.exp(-0.001 * t1)
+        low = d1 < d1_lowslope
+        m_lin = low & (d0 < d3) & (d1 < d1lin)
+        m_low = low & ~(d0 < d3)
+        d1 = np.where(m_lin, d1lin, d1)
+        d1 = np.where(m_low, d1_lowslope, d1)
+        d3 = np.where(d3 < 0.1 * d1, 0.1 * d1, d3)
+        d0 = np.where(d0 < 0.2 * d1, 0.2 * d1, d0)
+
+        # increasing curves (d3 > d1)
+        k3_inc = -0.001
+        A3_inc = d3 / (np.exp(k3_inc * t3))
+        A2_inc, k2_inc = fit_exp_linear_arrays(t1, t3, d1 - (A3_inc * np.exp(k3_inc * t1)), 0.01 * d3)
+
+        # decreasing curves
+        A3_dec, k3_dec = fit_exp_linear_arrays(t1, t3, d1, d3)
+        slow = k3_dec > -0.001
+        k3_dec = np.where(slow, -0.001, k3_dec)
+        A3_dec = np.where(slow, d3 / (np.exp(-0.001 * t3)), A3_dec)
+        A2_dec, k2_dec = fit_exp_linear_arrays(t0, t1, d0 - (A3_dec * np.exp(k3_dec * t0)), 0.01 * d1)
+
+        increasing = d3 > d1
+        A3 = np.where(increasing, A3_inc, A3_dec)
+        k3 = np.where(increasing, k3_inc, k3_dec)
+        A2 = np.where(increasing, A2_inc, A2_dec)
+        k2 = np.where(increasing, k2_inc, k2_dec)
+        negative = (A2 + A3) < 0
+        A1 = np.where(negative, 0.0, -(A2 + A3))
+        k1 = np.where(negative, 0.0, -1.3)
+        A2 = np.where(negative, -A3, A2)
+
+    if as_dict:
+        params = {"A1": A1, "k1": k1, "A2": A2, "k2": k2, "A3": A3, "k3": k3}
+    else:
+        params = np.stack([A1, k1, A2, k2, A3, k3])
+    return params
+
+
+def triexpo_rmse_arrays(times, activities, decay_constant, A1, k1, A2, k2, A3, k3):
+    # same as triexpo_rmse for many curves (..., n_timepoints) at once
+    p = [a[..., np.newaxis] for a in (A1, k1, A2, k2, A3, k3)]
+    values = triexpo_apply(np.asarray(times, dtype=np.float64), decay_constant, *p)
+    activities = np.asarray(activities, dtype=np.float64)
+    err = np.sqrt(np.sum(np.power(activities - values, 2), axis=-1) / activities.shape[-1])
+    return err
+
+
+def triexpo_integrate(decay_constant_hours, A1, k1, A2, k2, A3, k3):
+    """
+    Analytic integral from 0 to infinity of triexpo_apply: time integrated
+    activity (activity x h). Works with arrays of parameters.
+    """
+    return (
+            A1 / (-k1 + decay_constant_hours)
+            + A2 / (-k2 + decay_constant_hours)
+            + A3 / (-k3 + decay_constant_hours)
+    )
+
+
+def monoexpo_apply(x, decay_constant_hours, A1, k1):
+    return A1 * np.exp(-(-k1 + decay_constant_hours) * x)
+
+
+def biexpo_apply(x, decay_constant_hours, A1, k1, k2):
+    # uptake (k2) and washout (k1) model, k2 < k1 <= 0
+    return A1 * (
+            np.exp(-(-k1 + decay_constant_hours) * x)
+            - np.exp(-(-k2 + decay_constant_hours) * x)
+    )
+
+
+def monoexpo_integrate(decay_constant_hours, A1, k1):
+    return A1 / (-k1 + decay_constant_hours)
+
+
+def biexpo_integrate(decay_constant_hours, A1, k1, k2):
+    return A1 * (1 / (-k1 + decay_constant_hours) - 1 / (-k2 + decay_constant_hours))
+
+
+def batched_least_squares(model, jacobian, constrain, x, y, p0, n_iterations=100, tolerance=1e-10):
+    """
+    Levenberg-Marquardt least squares fit of model(x, p) to all the curves y
+    (n_curves, n_points) at once, from the initial parameters p0
+    (n_curves, n_params). Only the curves not converged yet are iterated.
+    Return the parameters and the residual sum of squares.
+    """
+    p = constrain(p0.copy())
+    rss = np.sum((y - model(x, p)) ** 2, axis=1)
+    rss[~np.isfinite(rss)] = np.inf
+    damping = np.full(len(p), 1e-3)
+    active = np.arange(len(p))
+    eye = np.eye(p.shape[1])
+    for i in range(n_iterations):
+        pa, ya = p[active], y[active]
+        r = ya - model(x, pa)
+        J = jacobian(x, pa)
+        JtJ = np.einsum("nmi,nmj->nij", J, J)
+        g = np.einsum("nmi,nm->ni", J, r)
+        diag = np.einsum("nii->ni", JtJ)
+        A = JtJ + (damping[active, np.newaxis] * diag + 1e-12)[:, :, np.newaxis] * eye
+        A[~np.isfinite(A)] = 0
+        g[~np.isfinite(g)] = 0
+        try:
+            dp = np.linalg.solve(A, g[:, :, np.newaxis])[:, :, 0]
+        except np.linalg.LinAlgError:
+            dp = np.einsum("nij,nj->ni", np.linalg.pinv(A), g)
+        p_new = constrain(pa + dp)
+        rss_new = np.sum((ya - model(x, p_new)) ** 2, axis=1)
+        better = np.isfinite(rss_new) & (rss_new < rss[active])
+        improvement = rss[active] - np.where(better, rss_new, rss[active])
+        p[active[better]] = p_new[better]
+        rss[active[better]] = rss_new[better]
+        damping[active] = np.where(better, np.maximum(damping[active] / 10, 1e-12),
+                                   damping[active] * 10)
+        # converged: small improvement or no more possible step
+        converged = (better & (improvement <= tolerance * rss[active])) | (damping[active] > 1e10)
+        active = active[~converged]
+        if len(active) == 0:
+            break
+    return p, rss
+
+
+def monoexpo_fit_arrays(times, activities):
+    """
+    Mono-exponential fit (A1 exp(k1 t), k1 <= 0) of the curves
+    (n_curves, n_timepoints) of decay corrected activities, all at once.
+    Initialised by a linear fit of the log of the positive activities.
+    """
+    t = np.asarray(times, dtype=np.float64)
+    y = np.asarray(activities, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # normalize each curve (conditioning)
+        s = np.max(np.fabs(y), axis=1)
+        s[s == 0] = 1
+        y = y / s[:, np.newaxis]
+        # log linear initialisation (positive activities only)
+        w = (y > 0).astype(np.float64)
+        ly = np.log(np.where(y > 0, y, 1))
+        n = np.sum(w, axis=1)
+        st, sy = np.sum(w * t, axis=1), np.sum(w * ly, axis=1)
+        stt, sty = np.sum(w * t * t, axis=1), np.sum(w * t * ly, axis=1)
+        k = (n * sty - st * sy) / (n * stt - st * st)
+        k = np.where(np.isfinite(k), k, 0)
+        A = np.exp((sy - k * st) / n)
+        A = np.where(np.isfinite(A), A, 1)
+
+        def model(x, p):
+            return p[:, 0:1] * np.exp(p[:, 1:2] * x)
+
+        def jacobian(x, p):
+            e = np.exp(p[:, 1:2] * x)
+            return np.stack([e, p[:, 0:1] * x * e], axis=-1)
+
+        def constrain(p):
+            p[:, 1] = np.minimum(p[:, 1], 0)
+            return p
+
+        p, rss = batched_least_squares(model, jacobian, constrain, t, y, np.stack([A, k], axis=1))
+    return {"A1": p[:, 0] * s, "k1": p[:, 1]}, rss * s * s
+
+
+def biexpo_fit_arrays(times, activities):
+    """
+    Bi-exponential fit, uptake and washout A1 (exp(k1 t) - exp(k2 t)) with
+    k2 < k1 <= 0, of the curves (n_curves, n_timepoints) of decay corrected
+    activities, all at once. Initialised with the mono-exponential fit of the
+    curves and a fast uptake (like triexpo_fit).
+    """
+    t = np.asarray(times, dtype=np.float64)
+    y = np.asarray(activities, dtype=np.float64)
+    mono, _ = monoexpo_fit_arrays(t, y)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        s = np.max(np.fabs(y), axis=1)
+        s[s == 0] = 1
+        y = y / s[:, np.newaxis]
+        k1 = np.minimum(mono["k1"], -0.001)
+        k2 = np.full(len(y), -1.3)
+        A = mono["A1"] / s
+
+        def model(x, p):
+            return p[:, 0:1] * (np.exp(p[:, 1:2] * x) - np.exp(p[:, 2:3] * x))
+
+        def jacobian(x, p):
+            e1 = np.exp(p[:, 1:2] * x)
+            e2 = np.exp(p[:, 2:3] * x)
+            return np.stack([e1 - e2, p[:, 0:1] * x * e1, -p[:, 0:1] * x * e2], axis=-1)
+
+        def constrain(p):
+            p[:, 1] = np.minimum(p[:, 1], 0)
+            p[:, 2] = np.minimum(p[:, 2], p[:, 1] - 0.001)
+            return p
+
+        p, rss = batched_least_squares(model, jacobian, constrain, t, y, np.stack([A, k1, k2], axis=1))
+    return {"A1": p[:, 0] * s, "k1": p[:, 1], "k2": p[:, 2]}, rss * s * s
+
+
+# models for tac_fit_arrays: apply, integrate, number of free parameters
+tac_models = {
+    "monoexpo": (monoexpo_apply, monoexpo_integrate, 2),
+    "biexpo": (biexpo_apply, biexpo_integrate, 3),
+    # triexpo_fit sets k1 and A1 = -(A2+A3): 4 free parameters
+    "triexpo": (triexpo_apply, triexpo_integrate, 4),
+}
+
+
+def tac_fit_arrays(times, activities, decay_constant_hours,
+                   models=("monoexpo", "biexpo", "triexpo"), criterion="aic"):
+    """
+    Fit many time activity curves at once. activities is (n_curves,
+    n_timepoints), not decay corrected. All models are fitted on the decay
+    corrected activities and the best one of each curve is selected with
+    the lowest rmse or aic (n ln(rss/n) + 2 k).
+    The triexpo model is not a least squares fit: like triexpo_fit, it goes
+    through the three first timepoints. Its aic is only an indication, and it
+    is not selected with the aic criterion unless n > k + 1 (6 timepoints).
+    Return a Box with, for each curve, the name of the selected model,
+    its rmse, aic and time integrated activity (activity x h), and the
+    parameters, rmse and aic of all models ('fits').
+    """
+    if criterion not in ["rmse", "aic"]:
+        fatal(f"The model selection criterion must be 'rmse' or 'aic', while it is '{criterion}'")
+    for m in models:
+        if m not in tac_models:
+            fatal(f"Unknown tac model '{m}', available models are {list(tac_models.keys())}")
+    times = np.asarray(times, dtype=np.float64)
+    activities = np.atleast_2d(np.asarray(activities, dtype=np.float64))
+    n = activities.shape[1]
+    if n < 3 and ("biexpo" in models or "triexpo" in models):
+        fatal(f"At least 3 timepoints are needed for the bi and tri exponential fits, while there are {n}")
+    corrected = decay_corrected_tac(times, activities, decay_constant_hours)
+
+    fits = {}
+    for m in models:
+        if m == "monoexpo":
+            params, _ = monoexpo_fit_arrays(times, corrected)
+        elif m == "biexpo":
+            params, _ = biexpo_fit_arrays(times, corrected)
+        else:
+            params = triexpo_fit_arrays(times, corrected)
+        apply, integrate, k = tac_models[m]
+        p = [v[:, np.newaxis] for v in params.values()]
+        with np.errstate(invalid="ignore", over="ignore"):
+            values = apply(times, decay_constant_hours, *p)
+            rss = np.sum((activities - values) ** 2, axis=1)
+            aic = n * np.log(np.maximum(rss / n, np.finfo(np.float64).tiny)) + 2 * k
+            tia = integrate(decay_constant_hours, *params.values())
+        fits[m] = {"params": params,
+                   "rmse": np.sqrt(rss / n),
+                   "aic": aic,
+                   "tia": tia}
+
+    # select the best model of each curve
+    c = np.stack([fits[m][criterion] for m in models])
+    c[~np.isfinite(c)] = np.inf
+    if criterion == "aic" and "triexpo" in models and n <= tac_models["triexpo"][2] + 1:
+        c[list(models).index("triexpo")] = np.inf
+    best = np.argmin(c, axis=0)
+    idx = np.arange(len(best))
+    results = {"model": np.array(models)[best]}
+    for key in ["rmse", "aic", "tia"]:
+        results[key] = np.stack([fits[m][key] for m in models])[best, idx]
+    results["fits"] = fits
+    return Box(results)
+
+
+def triexpo_fit_images(spects: list[MetaImageSPECT], decay_constant_hours):
+    """
+    Voxel-wise tri-exponential fit of a series of registered SPECT images
+    (same domain, with time_from_injection_h). All voxels are fitted at once.
+    Return the time integrated activity (Bq.h) and the fit rmse (Bq) images.
+    """
+    if len(spects) < 3:
+        fatal(f"At least 3 SPECT images are needed for the tri-exponential fit, while {len(spects)} are given")
+    spects = sorted(spects, key=lambda sp: sp.time_from_injection_h)
+    for spect in spects[1:]:
+        if not metaimages_have_same_domain(spects[0], spect):
+            fatal(f"All SPECT images must have the same domain (registered) for the voxel fit: {spect}")
+    times = np.array([sp.time_from_injection_h for sp in spects], dtype=np.float64)
+
+    # activities of all voxels (z,y,x,n_timepoints), decay corrected, in Bq
+    arrays = []
+    for spect in spects:
+        if spect.unit != "Bq":
+            spect = copy.copy(spect)
+            spect.convert_to_unit("Bq")
+        arrays.append(spect.array_view())
+    dtype = float_array_dtype(arrays[0])
+    activities = np.stack(arrays, axis=-1).astype(np.float64)
+    activities = decay_corrected_tac(times, activities, decay_constant_hours)
+
+    # fit, integrate and rmse
+    p = triexpo_fit_arrays(times, activities, as_dict=False)
+    tia = triexpo_integrate(decay_constant_hours, *p)
+    rmse = triexpo_rmse_arrays(times, activities, decay_constant_hours, *p)
+
+    # output images
+    _, spacing, origin, direction = spects[0].get_geometry()
+    images = []
+    for a in (tia, rmse):
+        img = sitk.GetImageFromArray(a.astype(dtype))
+        img.SetSpacing(spacing)
+        img.SetOrigin(origin)
+        img.SetDirection(direction)
+        images.append(img)
+    return images[0], images[1]
+
+
 def test_compare_json_doses(json_ref, json_test, tol=0.001):
     print('Compare dose in the following files: ')
     print('\t test      = ', json_test)
@@ -269,9 +665,27 @@ class DoseComputation:
             fatal(f"SPECT image must have time_from_injection_h while it is None. {self.spect}")
 
     def run(self, rois: list[MetaImageROI]):
-        fatal(f'RoiDoseComputation: run must be overwritten')
+        self.check_options()
+        ct, image, like = self.init_resampling()
+        density_ct = ct.compute_densities()
+
+        # sums, counts, masses and volumes of all rois at once
+        sums, counts, masses, volumes = self.compute_rois_sums(rois, like, image, density_ct)
+
+        # compute dose for each roi
+        return self.compute_doses(rois, image, sums, counts, masses, volumes)
+
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
+        """
+        Compute the doses of all ROIs from the ROI sums of the (resampled)
+        image, and return the results. Must be overwritten.
+        """
+        fatal(f'RoiDoseComputation: compute_doses must be overwritten')
 
     def init_resampling(self):
+        # the spect is converted to Bq before resampling
+        self.spect.convert_to_bq()
+
         # resampling (according to the option)
         like = self.spect
         if self.resample_like == "ct":
@@ -284,7 +698,7 @@ class DoseComputation:
             spect = copy.copy(spect)
             spect.convert_to_unit('Bq')
         if spect.unit != "Bq":
-            fatal(f'The SPECT unit must be Bq while it is {spect.unit}, cannot compute dose with Madsen2018')
+            fatal(f'The SPECT unit must be Bq while it is {spect.unit}, cannot compute dose with {self.name}')
 
         return ct, spect, like
 
@@ -295,6 +709,36 @@ class DoseComputation:
                    "date": str(datetime.now())}
         return Box(results)
 
+    @staticmethod
+    def get_rois_effective_times_h(rois):
+        for roi in rois:
+            if roi.effective_time_h is None:
+                fatal(f'Effective time must be provided for ROI {roi}.')
+        return np.array([roi.effective_time_h for roi in rois], dtype=np.float64)
+
+    @staticmethod
+    def compute_rois_sums(rois, like, image, density_ct):
+        """
+        For all ROIs at once: sum of the image, number of voxels, mass and
+        volume of each ROI (the image and the density must be resampled like
+        'like'). The mass and volume of the ROIs are updated.
+        """
+        counts, (sums, densities) = rois_sums(rois, like, [image, density_ct])
+        masses = densities * image.voxel_volume_cc
+        volumes = counts * image.voxel_volume_cc
+        for roi, mass, volume in zip(rois, masses, volumes):
+            roi.mass_g = float(mass)
+            roi.volume_cc = float(volume)
+        return sums, counts, masses, volumes
+
+    @staticmethod
+    def add_rois_results(results, rois, doses, masses, volumes):
+        for roi, dose, mass, volume in zip(rois, doses, masses, volumes):
+            results[roi.name] = {"dose_Gy": float(dose),
+                                 "mass_g": float(mass),
+                                 "volume_ml": float(volume)}
+        return results
+
 
 class DoseComputationWithPhantom:
     def __init__(self, method_name):
@@ -308,6 +752,11 @@ class DoseComputationWithPhantom:
             fatal(f'For {self.method_name}, you need to provide a MIRD phantom')
         self.icrp_phantom_name, self.icrp_radionuclide = guess_phantom_and_isotope(self.phantom, radionuclide)
 
+    def get_rois_svalues_and_masses(self, rois):
+        # S-value (mGy/MBq/s) and phantom mass (g) of each ROI
+        table = get_svalue_table(self.icrp_phantom_name, self.icrp_radionuclide)
+        return table.get_svalues_and_masses([roi.name for roi in rois])
+
 
 class DoseComputationWithDoseRate(DoseComputation):
 
@@ -324,8 +773,14 @@ class DoseComputationWithDoseRate(DoseComputation):
             like = self.ct
         ct = resample_ct_like(self.ct, like, self.gaussian_sigma)
         dose_rate = resample_dose_like(self.dose_rate, like, self.gaussian_sigma)
+        if dose_rate.unit != "Gy/s":
+            fatal(f"The dose rate unit must be Gy/s, while is {dose_rate.unit}, cannot compute dose.")
         return ct, dose_rate, like
 
+    def get_rois_mean_dose_rates(self, sums, counts):
+        # mean dose rate (Gy/s) in each roi
+        return sums / counts
+
 
 class DoseMadsen2018(DoseComputation, DoseComputationWithPhantom):
     name = "madsen2018"
@@ -334,44 +789,22 @@ class DoseMadsen2018(DoseComputation, DoseComputationWithPhantom):
         DoseComputation.__init__(self, ct, spect)
         DoseComputationWithPhantom.__init__(self, self.name)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        self.spect.convert_to_bq()
-        ct, spect, like = self.init_resampling()
-        density_ct = ct.compute_densities()
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
         # MIRD phantom
         self.get_phantom(self.radionuclide)
 
-        # loop on roi
-        for roi in rois:
-            if roi.effective_time_h is None:
-                fatal(f'Effective time must be provided for: {roi}')
-            roi = resample_roi_like(roi, like)
-            roi_arr = sitk.GetArrayViewFromImage(roi.image)
-            svalue, mass_scaling, roi.mass_g, roi.volume_cc = get_svalue_and_mass_scaling(
-                self.icrp_phantom_name,
-                roi_arr,
-                roi.name,
-                self.icrp_radionuclide,
-                spect.voxel_volume_cc,
-                sitk.GetArrayViewFromImage(density_ct.image),
-                verbose=False,
-            )
-            dose = dose_madsen2018(sitk.GetArrayViewFromImage(spect.image),
-                                   sitk.GetArrayViewFromImage(roi.image),
-                                   spect.time_from_injection_h,
-                                   svalue,
-                                   mass_scaling,
-                                   roi.effective_time_h)
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        effective_times_h = self.get_rois_effective_times_h(rois)
+        svalues, s_masses = self.get_rois_svalues_and_masses(rois)
+        doses = dose_madsen2018_rois(sums,
+                                     image.time_from_injection_h,
+                                     svalues,
+                                     masses / s_masses,
+                                     effective_times_h)
 
-        return results
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
 
 class DoseHanscheid2017(DoseComputation):
@@ -380,31 +813,17 @@ class DoseHanscheid2017(DoseComputation):
     def __init__(self, ct, spect):
         super().__init__(ct, spect)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        self.spect.convert_to_bq()
-        ct, spect, like = self.init_resampling()
-        density_ct = ct.compute_densities()
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
-        for roi in rois:
-            if roi.effective_time_h is None:
-                fatal(f'Effective time must be provided for ROI {roi}.')
-            roi = resample_roi_like(roi, like)
-            roi.update_mass_and_volume(density_ct)
-            dose = dose_hanscheid2017(sitk.GetArrayViewFromImage(spect.image),
-                                      sitk.GetArrayViewFromImage(roi.image),
-                                      spect.time_from_injection_h,
-                                      spect.voxel_volume_cc,
-                                      roi.effective_time_h)
-
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        effective_times_h = self.get_rois_effective_times_h(rois)
+        doses = dose_hanscheid2017_rois(sums,
+                                        volumes,
+                                        image.time_from_injection_h,
+                                        effective_times_h)
 
-        return results
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
 
 class DoseHanscheid2018(DoseComputation, DoseComputationWithPhantom):
@@ -414,43 +833,20 @@ class DoseHanscheid2018(DoseComputation, DoseComputationWithPhantom):
         DoseComputation.__init__(self, ct, spect)
         DoseComputationWithPhantom.__init__(self, self.name)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        self.spect.convert_to_bq()
-        ct, spect, like = self.init_resampling()
-        density_ct = ct.compute_densities()
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
         # MIRD phantom
         self.get_phantom(self.radionuclide)
 
-        # loop on roi
-        spect_arr = sitk.GetArrayViewFromImage(spect.image)
-        for roi in rois:
-            roi = resample_roi_like(roi, like)
-            roi_arr = sitk.GetArrayViewFromImage(roi.image)
-            svalue, mass_scaling, roi.mass_g, roi.volume_cc = get_svalue_and_mass_scaling(
-                self.icrp_phantom_name,
-                roi_arr,
-                roi.name,
-                self.icrp_radionuclide,
-                spect.voxel_volume_cc,
-                sitk.GetArrayViewFromImage(density_ct.image),
-                verbose=False
-            )
-            dose = dose_hanscheid2018(spect_arr,
-                                      roi_arr,
-                                      spect.time_from_injection_h,
-                                      svalue,
-                                      mass_scaling)
-
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        svalues, s_masses = self.get_rois_svalues_and_masses(rois)
+        doses = dose_hanscheid2018_rois(sums,
+                                        image.time_from_injection_h,
+                                        svalues,
+                                        masses / s_masses)
 
-        return results
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
 
 class DoseMadsen2018DoseRate(DoseComputationWithDoseRate):
@@ -459,32 +855,18 @@ class DoseMadsen2018DoseRate(DoseComputationWithDoseRate):
     def __init__(self, ct, dose_rate):
         super().__init__(ct, dose_rate)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        ct, dose_rate, like = self.init_resampling()
-        if dose_rate.unit != "Gy/s":
-            fatal(f"The dose rate unit must be Gy/s, while is {dose_rate.unit}, cannot compute dose.")
-        density_ct = ct.compute_densities()
-        dose_rate_arr = sitk.GetArrayViewFromImage(dose_rate.image)
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
-        for roi in rois:
-            if roi.effective_time_h is None:
-                fatal(f'Effective time must be provided for ROI {roi}.')
-            roi = resample_roi_like(roi, like)
-            roi.update_mass_and_volume(density_ct)
-            dose = dose_madsen2018_dose_rate(dose_rate_arr,
-                                             sitk.GetArrayViewFromImage(roi.image),
-                                             dose_rate.time_from_injection_h,
-                                             roi.effective_time_h)
-            dose = dose * self.scaling
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        effective_times_h = self.get_rois_effective_times_h(rois)
+        mean_dose_rates = self.get_rois_mean_dose_rates(sums, counts)
+        doses = dose_madsen2018_dose_rate_rois(mean_dose_rates,
+                                               image.time_from_injection_h,
+                                               effective_times_h)
+        doses = doses * self.scaling
 
-        return results
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
 
 class DoseHanscheid2018DoseRate(DoseComputationWithDoseRate):
@@ -493,29 +875,16 @@ class DoseHanscheid2018DoseRate(DoseComputationWithDoseRate):
     def __init__(self, ct, dose_rate):
         super().__init__(ct, dose_rate)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        ct, dose_rate, like = self.init_resampling()
-        if dose_rate.unit != "Gy/s":
-            fatal(f"The dose rate unit must be Gy/s, while is {dose_rate.unit}, cannot compute dose.")
-        density_ct = ct.compute_densities()
-        dose_rate_arr = sitk.GetArrayViewFromImage(dose_rate.image)
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
-        for roi in rois:
-            roi = resample_roi_like(roi, like)
-            roi.update_mass_and_volume(density_ct)
-            dose = dose_hanscheid2018_dose_rate(dose_rate_arr,
-                                                sitk.GetArrayViewFromImage(roi.image),
-                                                dose_rate.time_from_injection_h)
-            dose = dose * self.scaling
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        mean_dose_rates = self.get_rois_mean_dose_rates(sums, counts)
+        doses = dose_hanscheid2018_dose_rate_rois(mean_dose_rates,
+                                                  image.time_from_injection_h)
+        doses = doses * self.scaling
 
-        return results
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
 
 class DoseHanscheid2017DoseRate(DoseComputationWithDoseRate):
@@ -524,39 +893,107 @@ class DoseHanscheid2017DoseRate(DoseComputationWithDoseRate):
     def __init__(self, ct, dose_rate):
         super().__init__(ct, dose_rate)
 
-    def run(self, rois: list[MetaImageROI]):
-        self.check_options()
-        ct, dose_rate, like = self.init_resampling()
-        if dose_rate.unit != "Gy/s":
-            fatal(f"The dose rate unit must be Gy/s, while is {dose_rate.unit}, cannot compute dose.")
-        density_ct = ct.compute_densities()
-        dose_rate_arr = sitk.GetArrayViewFromImage(dose_rate.image)
-
-        # compute dose for each roi
+    def compute_doses(self, rois, image, sums, counts, masses, volumes):
         results = self.init_results()
 
-        for roi in rois:
-            if roi.effective_time_h is None:
-                fatal(f'Effective time must be provided for ROI {roi}.')
-            roi = resample_roi_like(roi, like)
-            roi.update_mass_and_volume(density_ct)
-            dose = dose_hanscheid2017_dose_rate(dose_rate_arr,
-                                                sitk.GetArrayViewFromImage(roi.image),
-                                                dose_rate.time_from_injection_h,
-                                                roi.effective_time_h)
-            dose = dose * self.scaling
-            results[roi.name] = {"dose_Gy": dose,
-                                 "mass_g": roi.mass_g,
-                                 "volume_ml": roi.volume_cc}
+        # all rois at once
+        effective_times_h = self.get_rois_effective_times_h(rois)
+        mean_dose_rates = self.get_rois_mean_dose_rates(sums, counts)
+        doses = dose_hanscheid2017_dose_rate_rois(mean_dose_rates,
+                                                  image.time_from_injection_h,
+                                                  effective_times_h)
+        doses = doses * self.scaling
+
+        return self.add_rois_results(results, rois, doses, masses, volumes)
 
-        return results
+
+dose_computation_methods = [DoseMadsen2018, DoseHanscheid2017, DoseHanscheid2018,
+                            DoseMadsen2018DoseRate, DoseHanscheid2018DoseRate, DoseHanscheid2017DoseRate]
 
 
 def get_dose_computation_class(name):
-    methods = [DoseMadsen2018, DoseHanscheid2017, DoseHanscheid2018,
-               DoseMadsen2018DoseRate, DoseHanscheid2018DoseRate, DoseHanscheid2017DoseRate]
-    for d in methods:
+    for d in dose_computation_methods:
         if d.name.lower() == name.lower():
             return d
     fatal(f'Dose computation method "{name}" not found. '
-          f'List of available methods: {[m.name for m in methods]}')
+          f'List of available methods: {[m.name for m in dose_computation_methods]}')
+
+
+class DoseSession:
+    """
+    Compute the doses of several methods with the same inputs. The
+    resampling, the unit conversion, the densities and the ROI sums are
+    computed once for the spect and once for the dose rate, and shared by
+    all the methods.
+    """
+
+    def __init__(self, ct: MetaImageCT, spect: MetaImageSPECT = None, dose_rate=None):
+        self.ct = ct
+        self.spect = spect
+        self.dose_rate = dose_rate
+        # common options
+        self.resample_like = "ct"
+        self.radionuclide = 'lu177'
+        self.gaussian_sigma = None
+        # specific options (only used by some methods)
+        self.phantom = None
+        self.scaling = 1.0
+        # shared preprocessing: input -> (image, sums, counts, masses, volumes)
+        self._rois_sums = {}
+
+    def get_methods(self, methods="all"):
+        """
+        List of the method classes. 'all' means all the methods that can be
+        computed with the given inputs (spect and/or dose rate).
+        """
+        if isinstance(methods, str):
+            methods = [methods]
+        if "all" in methods:
+            methods = [m for m in dose_computation_methods
+                       if self.get_method_input(m, check=False) is not None]
+            if len(methods) == 0:
+                fatal(f'DoseSession: a spect or a dose rate image is needed')
+            return methods
+        return [get_dose_computation_class(m) for m in methods]
+
+    def get_method_input(self, method, check=True):
+        if issubclass(method, DoseComputationWithDoseRate):
+            image, input_name = self.dose_rate, "dose_rate"
+        else:
+            image, input_name = self.spect, "spect"
+        if image is None and check:
+            fatal(f'DoseSession: method {method.name} needs a {input_name} image')
+        return image
+
+    def create_method(self, method):
+        d = method(self.ct, self.get_method_input(method))
+        d.resample_like = self.resample_like
+        d.radionuclide = self.radionuclide
+        d.gaussian_sigma = self.gaussian_sigma
+        d.phantom = self.phantom
+        d.scaling = self.scaling
+        return d
+
+    def get_rois_sums(self, d, rois):
+        # preprocessing is done once per input image
+        key = id(d.spect)
+        if key not in self._rois_sums:
+            ct, image, like = d.init_resampling()
+            density_ct = ct.compute_densities()
+            self._rois_sums[key] = (image, *d.compute_rois_sums(rois, like, image, density_ct))
+        return self._rois_sums[key]
+
+    def run(self, rois: list[MetaImageROI], methods="all"):
+        """
+        Compute the doses of all ROIs with all the given methods. Return a
+        dict with the results of each method.
+        """
+        self._rois_sums = {}
+        methods = self.get_methods(methods)
+        results = {}
+        for method in methods:
+            d = self.create_method(method)
+            d.check_options()
+            image, sums, counts, masses, volumes = self.get_rois_sums(d, rois)
+            results[d.name] = d.compute_doses(rois, image, sums, counts, masses, volumes)
+        return Box(results)
@@ -11,7 +11,10 @@ import json
 from box import BoxList, Box
 import datetime
 import shutil
+import hashlib
+import struct
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 
 def read_metaimage(file_path, reading_mode="image"):
@@ -203,6 +206,97 @@ def read_list_of_rois(filename, folder=None):
     return rois
 
 
+# precision ("float32" or "float64") of the floating point images computed
+# by the unit conversions, the densities and the resampling. Images already
+# stored in float64 are never downcast. Reductions (sums, means) are always
+# accumulated in float64.
+pixel_precisions = {"float32": sitk.sitkFloat32, "float64": sitk.sitkFloat64}
+pixel_precision = os.environ.get("RPT_DOSI_PIXEL_PRECISION", "float32")
+
+
+def set_pixel_precision(precision):
+    global pixel_precision
+    if precision not in pixel_precisions:
+        fatal(
+            f"Pixel precision {precision} not recognized, "
+            f"should be one of {list(pixel_precisions)}"
+        )
+    pixel_precision = precision
+
+
+def float_pixel_type(img):
+    """
+    The sitk float pixel type of the image computed from img, according to
+    the pixel precision.
+    """
+    if pixel_precision not in pixel_precisions:
+        fatal(
+            f"Pixel precision {pixel_precision} not recognized, "
+            f"should be one of {list(pixel_precisions)}"
+        )
+    if img.GetPixelID() == sitk.sitkFloat64:
+        return sitk.sitkFloat64
+    return pixel_precisions[pixel_precision]
+
+
+def float_pixel_dtype(img):
+    if float_pixel_type(img) == sitk.sitkFloat64:
+        return np.float64
+    return np.float32
+
+
+def float_array_dtype(a):
+    # same as float_pixel_dtype for a numpy array
+    if a.dtype == np.float64 or pixel_precision == "float64":
+        return np.float64
+    return np.float32
+
+
+def cast_to_pixel_precision(img):
+    t = float_pixel_type(img)
+    if img.GetPixelID() != t:
+        img = sitk.Cast(img, t)
+    return img
+
+
+def divide_image(img, value):
+    # sitk in place division does nothing for float32 images and the
+    # division operator always computes float64 images. Not in place, the
+    # image may be shared with a copy of the MetaImage.
+    img = cast_to_pixel_precision(img)
+    if img.GetPixelID() == sitk.sitkFloat64:
+        return img / value
+    return img * (1.0 / value)
+
+
+def scale_image(img, multiplier, divisor):
+    """
+    Multiply then divide the pixels (in the pixel precision), not in place.
+    """
+    img = cast_to_pixel_precision(img)
+    if multiplier != 1:
+        img = img * multiplier
+    if divisor != 1:
+        img = divide_image(img, divisor)
+    return img
+
+
+def scale_array(a, multiplier, divisor):
+    # same operations as scale_image, on a numpy array
+    if multiplier == 1 and divisor == 1:
+        return a
+    dtype = float_array_dtype(a)
+    a = a.astype(dtype, copy=False)
+    if multiplier != 1:
+        a = a * multiplier
+    if divisor != 1:
+        if dtype == np.float64:
+            a = a / divisor
+        else:
+            a = a * (1.0 / divisor)
+    return a
+
+
 class MetaImageBase(rmd.ClassWithMetaData):
     authorized_units = []
     unit_default_values = {}
@@ -223,7 +317,10 @@ class MetaImageBase(rmd.ClassWithMetaData):
     def __init__(self, image_path, reading_mode, create=False, **kwargs):
         super().__init__()
         # init
-        self.image = None
+        self._image = None
+        self._image_mmap = None
+        # pending unit conversion (multiplier, divisor) of the pixels
+        self._pending_scale = (1.0, 1.0)
         # metadata infos
         self.description = ""
         self._acquisition_datetime = None
@@ -242,10 +339,10 @@ class MetaImageBase(rmd.ClassWithMetaData):
         if not os.path.exists(self.metadata_file_path) and create:
             self._init_required_metadata(**kwargs)
         # read metadata
-        if reading_mode not in ["metadata_only", "image", "header_only"]:
+        if reading_mode not in ["metadata_only", "image", "header_only", "mmap"]:
             fatal(
                 f"Reading mode {reading_mode} not recognized, should be "
-                f'either "metadata_only" or "image" or "header_only"'
+                f'either "metadata_only" or "image" or "header_only" or "mmap"'
             )
         if reading_mode == "metadata_only":
             self.read_metadata()
@@ -254,28 +351,130 @@ class MetaImageBase(rmd.ClassWithMetaData):
             self.read_image_header()
         if reading_mode == "image":
             self.read()
+        if reading_mode == "mmap":
+            self.read_mmap()
         return
 
     def _init_required_metadata(self, **kwargs):
         # specific required metadata for this image type
         pass
 
+    @property
+    def image(self):
+        # a memory mapped image is loaded in sitk only when needed
+        if self._image is None and self._image_mmap is not None:
+            self._image = mmap_to_itk_image(self._image_mmap, self._image_header)
+            self._image_mmap = None
+        # the pending unit conversion is applied only when needed
+        if self._image is not None and self._pending_scale != (1.0, 1.0):
+            self._image = scale_image(self._image, *self._pending_scale)
+            self._pending_scale = (1.0, 1.0)
+        return self._image
+
+    @image.setter
+    def image(self, value):
+        self._image = value
+        self._image_mmap = None
+        self._pending_scale = (1.0, 1.0)
+
+    def scale_pixels(self, multiplier=1.0, divisor=1.0):
+        """
+        Record a scaling of the pixels (multiplier then divisor), used by the
+        unit conversions. It is applied only when the pixels are needed
+        (self.image, array_view) or folded in the reductions (see
+        raw_array_view, pixel_scale and scaled_values).
+        """
+        self.ensure_image_is_loaded()
+        m, d = self._pending_scale
+        m *= float(multiplier)
+        d *= float(divisor)
+        # a conversion back and forth is exactly the identity
+        if m == d:
+            m, d = 1.0, 1.0
+        self._pending_scale = (m, d)
+
+    @property
+    def pixel_scale(self):
+        m, d = self._pending_scale
+        return m / d
+
+    def scaled_values(self, values):
+        """
+        Apply the pending scaling to values of raw_array_view, the result is
+        the same as the values of array_view.
+        """
+        return scale_array(values, *self._pending_scale)
+
     def ensure_image_is_loaded(self):
-        if self.image is None:
+        if self._image_mmap is not None:
+            return True
+        if self._image is None:
             fatal(f"Image {self} has not been loaded")
-        if not isinstance(self.image, sitk.Image):
+        if not isinstance(self._image, sitk.Image):
             fatal(
                 f"Image {self} has not been correctly loaded, this is not a SITK image"
             )
         return True
 
     def image_is_loaded(self):
-        if self.image is None:
+        if self._image_mmap is not None:
+            return True
+        if self._image is None:
             return False
-        if not isinstance(self.image, sitk.Image):
+        if not isinstance(self._image, sitk.Image):
             return False
         return True
 
+    def image_is_mmap(self):
+        return self._image_mmap is not None
+
+    def array_view(self):
+        """
+        Read-only numpy view (z,y,x) of the pixels. For a memory mapped
+        image, the file is not loaded, only the accessed pages are read.
+        """
+        self.ensure_image_is_loaded()
+        if self._pending_scale != (1.0, 1.0):
+            return sitk.GetArrayViewFromImage(self.image)
+        return self.raw_array_view()
+
+    def raw_array_view(self):
+        """
+        Same as array_view but without the pending unit conversion, see
+        pixel_scale and scaled_values.
+        """
+        self.ensure_image_is_loaded()
+        if self._image_mmap is not None:
+            return self._image_mmap
+        return sitk.GetArrayViewFromImage(self._image)
+
+    def like_image(self):
+        """
+        The sitk image, or only its geometry (ImageGeometry) if the image is
+        memory mapped or has a pending unit conversion, to be used as
+        like_img by the resampling functions.
+        """
+        if self._image_mmap is not None or self._pending_scale != (1.0, 1.0):
+            return ImageGeometry(*self.get_geometry())
+        return self.image
+
+    def get_geometry(self):
+        """
+        Size, spacing, origin and direction, from the header if the image
+        is not loaded in sitk (see image_geometry)
+        """
+        if self._image is not None:
+            return image_geometry(self._image)
+        if self._image_header is None:
+            self.read_image_header()
+        h = self._image_header
+        return (
+            tuple(h.size),
+            tuple(h.spacing),
+            tuple(h.origin),
+            tuple(h.direction),
+        )
+
     @property
     def unit(self):
         return self._unit
@@ -354,7 +553,7 @@ class MetaImageBase(rmd.ClassWithMetaData):
     @property
     def voxel_volume_cc(self):
         self.ensure_image_is_loaded()
-        v = np.prod(self.image.GetSpacing()) / 1000
+        v = np.prod(self.get_geometry()[1]) / 1000
         return v
 
     @property
@@ -384,6 +583,29 @@ class MetaImageBase(rmd.ClassWithMetaData):
         self.image = sitk.ReadImage(self.image_file_path)
         self.read_metadata()
 
+    def read_mmap(self, file_path=None):
+        """
+        Memory map the pixels of an uncompressed mhd/raw or nii file. The
+        image is loaded in sitk only when needed (self.image), otherwise use
+        array_view. Fall back to a normal read if the file cannot be mapped.
+        """
+        if file_path is not None:
+            self.image_file_path = file_path
+        if not os.path.exists(self.image_file_path):
+            fatal(f"Image: the filename {self.image_file_path} does not exist.")
+        self.read_image_header()
+        a = read_image_mmap(self.image_file_path, self._image_header)
+        if a is None:
+            rhe.warning(
+                f"Cannot memory map {self.image_file_path} (compressed or "
+                f"unsupported format), the image is read"
+            )
+            self.read()
+            return
+        self.image = None
+        self._image_mmap = a
+        self.read_metadata()
+
     def write(self, file_path=None, writing_mode="image"):
         if file_path is None:
             file_path = self.image_file_path
@@ -395,7 +617,10 @@ class MetaImageBase(rmd.ClassWithMetaData):
         if writing_mode == "image":
             if not self.image_is_loaded():
                 self.read()
-            sitk.WriteImage(self.image, file_path)
+            # (get the image before the files are unlinked, it may be memory mapped)
+            img = self.image
+            unlink_linked_image_files(file_path)
+            sitk.WriteImage(img, file_path)
         else:
             if writing_mode != "metadata_only":
                 fatal(
@@ -437,6 +662,7 @@ class MetaImageBase(rmd.ClassWithMetaData):
         self._image_header.size = reader.GetSize()
         self._image_header.spacing = reader.GetSpacing()
         self._image_header.origin = reader.GetOrigin()
+        self._image_header.direction = reader.GetDirection()
         self._image_header.pixel_type = sitk.GetPixelIDValueAsString(
             reader.GetPixelID()
         )
@@ -460,7 +686,7 @@ class MetaImageBase(rmd.ClassWithMetaData):
             js = f'{"metadata":<{w}}: no metadata'
         s += f'{"Loaded?":<{w}}: {self.image_is_loaded()}\n'
         s = f"{js}\n{s}"
-        if self.image_is_loaded():
+        if self._image is not None:
             s += f'{"Size":<{w}}: {self.image.GetSize()}\n'
             s += f'{"Spacing":<{w}}: {self.image.GetSpacing()}\n'
             s += f'{"Origin":<{w}}: {self.image.GetOrigin()}\n'
@@ -505,10 +731,10 @@ class MetaImageCT(MetaImageBase):
             fatal(f"Unit {self.unit} is not HU, cannot compute density CT")
         density_ct = copy.copy(self)
         density_ct._unit = "g/cm3"
-        # Simple conversion from HU to g/cm^3
-        density_ct.image = self.image / 1000 + 1
+        # Simple conversion from HU to g/cm^3 (in the pixel precision)
+        a = sitk.GetArrayFromImage(self.image).astype(float_pixel_dtype(self.image))
+        a = a / 1000 + 1
         # the density of air is near 0, not negative
-        a = sitk.GetArrayFromImage(density_ct.image)
         a[a < 0] = 0
         density_ct.image = sitk.GetImageFromArray(a)
         density_ct.image.CopyInformation(self.image)
@@ -569,21 +795,21 @@ class MetaImageSPECT(MetaImageBase):
         return s
 
     def convert_to_bq(self):
+        # the conversions are only recorded, see scale_pixels
         self.ensure_image_is_loaded()
         if self.unit == "Bq/mL":
-            self.image *= self.voxel_volume_cc
+            self.scale_pixels(multiplier=self.voxel_volume_cc)
         if self.unit == "SUV":
-            self.image *= self.voxel_volume_cc * (
-                self.injection_activity_mbq / self.body_weight_kg
+            self.scale_pixels(
+                multiplier=self.voxel_volume_cc
+                * (self.injection_activity_mbq / self.body_weight_kg)
             )
         self._unit = "Bq"
 
     def convert_to_bqml(self):
         if self.unit == "Bq":
             self.ensure_image_is_loaded()
-            # need to cast when divide
-            self.image = sitk.Cast(self.image, sitk.sitkFloat64)
-            self.image /= self.voxel_volume_cc
+            self.scale_pixels(divisor=self.voxel_volume_cc)
         if self.unit == "SUV":
             self.convert_to_bq()
             self.convert_to_bqml()
@@ -600,25 +826,25 @@ class MetaImageSPECT(MetaImageBase):
             )
         # convert to Bq/mL first then SUV
         self.convert_to_bqml()
-        self.image /= self.injection_activity_mbq / self.body_weight_kg
+        self.scale_pixels(divisor=self.injection_activity_mbq / self.body_weight_kg)
         self._unit = "SUV"
 
     def compute_total_activity(self):
         self.ensure_image_is_loaded()
         if self.unit is None:
             fatal(f"Cannot compute total activity without unit, in image {self}")
-        if self.image is None:
+        if not self.image_is_loaded():
             fatal("Cannot compute total activity, the image data not loaded.")
         if self.unit == "Bq":
-            arr = sitk.GetArrayViewFromImage(self.image)
-            total_activity = np.sum(arr)
+            # the pending conversion is folded in the sum
+            arr = self.raw_array_view()
+            m, d = self._pending_scale
+            total_activity = np.sum(arr, dtype=np.float64) * m / d
             return total_activity
-        else:
-            u = self.unit
-            self.convert_to_bq()
-            t = self.compute_total_activity()
-            self.convert_to_unit(u)
-            return t
+        # the conversion is only recorded in a copy, no pixel is changed
+        o = copy.copy(self)
+        o.convert_to_bq()
+        return o.compute_total_activity()
 
     @property
     def time_from_injection_h(self):
@@ -695,10 +921,10 @@ class MetaImageROI(MetaImageBase):
     def update_mass_and_volume(self, density_ct):
         self.ensure_image_is_loaded()
         # compute mass
-        a = sitk.GetArrayViewFromImage(self.image)
-        da = sitk.GetArrayViewFromImage(density_ct.image)
+        a = self.array_view()
+        da = density_ct.array_view()
         d = da[a == 1]
-        self.mass_g = np.sum(d) * self.voxel_volume_cc
+        self.mass_g = np.sum(d, dtype=np.float64) * self.voxel_volume_cc
         self.volume_cc = len(d) * self.voxel_volume_cc
 
     def write_metadata(self):
@@ -746,6 +972,20 @@ def images_have_same_domain(image1, image2, tolerance=1e-5):
     return is_same
 
 
+def metaimages_have_same_domain(image1, image2, tolerance=1e-5):
+    # same as images_have_same_domain, but with the geometry of the
+    # MetaImages (a memory mapped image is not loaded)
+    size1, spacing1, origin1, _ = image1.get_geometry()
+    size2, spacing2, origin2, _ = image2.get_geometry()
+    is_same = (
+        len(size1) == len(size2)
+        and all(i == j for i, j in zip(size1, size2))
+        and all(math.isclose(i, j, rel_tol=tolerance) for i, j in zip(spacing1, spacing2))
+        and all(math.isclose(i, j, rel_tol=tolerance) for i, j in zip(origin1, origin2))
+    )
+    return is_same
+
+
 def validate_spacing(ctx, param, value):
     if len(value) == 1:
         # If only one value is provided, duplicate it three times
@@ -800,6 +1040,203 @@ def resample_itk_image_like(img, like_img, default_pixel_value, linear):
     return resampled_img
 
 
+def image_geometry(img):
+    """
+    Tuple (size, spacing, origin, direction) of a sitk image.
+    """
+    return (
+        tuple(img.GetSize()),
+        tuple(img.GetSpacing()),
+        tuple(img.GetOrigin()),
+        tuple(img.GetDirection()),
+    )
+
+
+class ImageGeometry:
+    """
+    Geometry of an image without the pixels, with the same accessors as a
+    sitk image (enough for the like_img of resample_itk_image_like).
+    """
+
+    def __init__(self, size, spacing, origin, direction):
+        self.size = tuple(size)
+        self.spacing = tuple(spacing)
+        self.origin = tuple(origin)
+        self.direction = tuple(direction)
+
+    def GetDimension(self):
+        return len(self.size)
+
+    def GetSize(self):
+        return self.size
+
+    def GetSpacing(self):
+        return self.spacing
+
+    def GetOrigin(self):
+        return self.origin
+
+    def GetDirection(self):
+        return self.direction
+
+
+class ResamplePlan:
+    """
+    Resampling of binary masks from one image geometry to another one.
+    Masks are resampled like in resample_itk_image_like (linear=False): sitk
+    default interpolator (linear) followed by the cast to the (integer) mask
+    pixel type, so a target voxel is 1 only if all the source voxels used by
+    the interpolation are 1.
+    For axis aligned images, the continuous indices computed by itk only
+    depend on the axis, so they are computed once per axis (by resampling one
+    line of voxel indices). Applying the plan to a mask is then a separable
+    numpy gather. The plan is checked once against sitk, if the result is
+    different (or for non binary masks) sitk is used.
+    """
+
+    def __init__(self, img, like_img):
+        self.source_geometry = image_geometry(img)
+        self.target_geometry = image_geometry(like_img)
+        self.is_valid = False
+        self.low_indices = []
+        self.high_indices = []
+        self.inside = []
+        dim = img.GetDimension()
+        identity = tuple(np.eye(dim).ravel())
+        if dim != 3 or img.GetDirection() != identity:
+            return
+        if like_img.GetDirection() != identity:
+            return
+        for axis in range(dim):
+            low, high, inside = self._axis_interpolation_indices(img, like_img, axis)
+            self.low_indices.append(low)
+            self.high_indices.append(high)
+            self.inside.append(inside)
+        # check with sitk on a random mask
+        a = np.random.default_rng(42).integers(0, 2, img.GetSize()[::-1], dtype=np.uint8)
+        mask = sitk.GetImageFromArray(a)
+        mask.CopyInformation(img)
+        ref = resample_itk_image_like(mask, like_img, 0, linear=False)
+        self.is_valid = True
+        o = self.apply(mask, 0)
+        self.is_valid = np.array_equal(
+            sitk.GetArrayViewFromImage(o), sitk.GetArrayViewFromImage(ref)
+        )
+
+    @staticmethod
+    def _axis_interpolation_indices(img, like_img, axis):
+        # resample (linear) a line of voxel indices along this axis,
+        # the result is the continuous index used by the itk interpolation
+        size = [1, 1, 1]
+        size[axis] = img.GetSize()[axis]
+        spacing = [1.0, 1.0, 1.0]
+        spacing[axis] = img.GetSpacing()[axis]
+        origin = [0.0, 0.0, 0.0]
+        origin[axis] = img.GetOrigin()[axis]
+        line = sitk.GetImageFromArray(
+            np.arange(size[axis], dtype=np.float64).reshape(size[::-1])
+        )
+        line.SetSpacing(spacing)
+        line.SetOrigin(origin)
+        size[axis] = like_img.GetSize()[axis]
+        spacing[axis] = like_img.GetSpacing()[axis]
+        origin[axis] = like_img.GetOrigin()[axis]
+        like_line = sitk.Image(size, sitk.sitkFloat64)
+        like_line.SetSpacing(spacing)
+        like_line.SetOrigin(origin)
+        ci = resample_itk_image_like(line, like_line, -1, linear=True)
+        ci = sitk.GetArrayFromImage(ci).ravel()
+        # voxels outside the source image
+        inside = ci >= 0
+        ci[~inside] = 0
+        low = np.floor(ci)
+        # the interpolation uses the next voxel only if the distance is not null
+        high = low + ((1.0 - (ci - low)) != 1.0)
+        return low.astype(np.int64), high.astype(np.int64), inside
+
+    def matches(self, img, like_img):
+        return (
+            image_geometry(img) == self.source_geometry
+            and image_geometry(like_img) == self.target_geometry
+        )
+
+    def apply(self, img, default_pixel_value=0):
+        if image_geometry(img) != self.source_geometry:
+            fatal(
+                f"Cannot apply the resample plan, the image geometry "
+                f"{image_geometry(img)} is not {self.source_geometry}"
+            )
+        a = sitk.GetArrayViewFromImage(img)
+        if not self.is_valid or not is_binary_array(a):
+            return resample_itk_image_like(
+                img, self._like_image(), default_pixel_value, linear=False
+            )
+        # separable gather, numpy axis are z,y,x (start with z, the fastest)
+        o = a
+        for axis in (2, 1, 0):
+            np_axis = 2 - axis
+            low = np.take(o, self.low_indices[axis], axis=np_axis)
+            high = np.take(o, self.high_indices[axis], axis=np_axis)
+            o = low & high
+        # voxels outside the source image
+        for axis in range(3):
+            outside = ~self.inside[axis]
+            if np.any(outside):
+                sl = [slice(None)] * 3
+                sl[2 - axis] = outside
+                o[tuple(sl)] = default_pixel_value
+        output = sitk.GetImageFromArray(o)
+        self._set_target_geometry(output)
+        return output
+
+    def _set_target_geometry(self, output):
+        _, spacing, origin, direction = self.target_geometry
+        output.SetSpacing(spacing)
+        output.SetOrigin(origin)
+        output.SetDirection(direction)
+
+    def _like_image(self):
+        like_img = sitk.Image(self.target_geometry[0], sitk.sitkUInt8)
+        self._set_target_geometry(like_img)
+        return like_img
+
+
+def is_binary_array(a):
+    if a.dtype == bool:
+        return True
+    if not np.issubdtype(a.dtype, np.integer):
+        return False
+    return a.min() >= 0 and a.max() <= 1
+
+
+# the most recently used resample plans (most ROIs share the same geometry)
+_resample_plans = []
+_resample_plans_max = 4
+
+
+def get_resample_plan(img, like_img):
+    for plan in _resample_plans:
+        if plan.matches(img, like_img):
+            # move it to the front
+            _resample_plans.remove(plan)
+            _resample_plans.insert(0, plan)
+            return plan
+    plan = ResamplePlan(img, like_img)
+    _resample_plans.insert(0, plan)
+    del _resample_plans[_resample_plans_max:]
+    return plan
+
+
+def resample_itk_mask_like(img, like_img, default_pixel_value=0):
+    """
+    Nearest neighbour resampling (like resample_itk_image_like with
+    linear=False), the resample plan is shared by all images with the same
+    geometry (for example all ROIs of a segmentation).
+    """
+    plan = get_resample_plan(img, like_img)
+    return plan.apply(img, default_pixel_value)
+
+
 def resample_itk_image_spacing(img, new_spacing, default_pixel_value, linear):
     # Create a resampler object
     resampler = sitk.ResampleImageFilter()
@@ -901,6 +1338,21 @@ def crop_to_bounding_box(img, lover_threshold=-1000):
     return cropped_img
 
 
+def crop_to_non_background(img, bg=0):
+    """
+    Crop the image to the bounding box of the voxels different from bg
+    (the image is not cropped if all voxels are bg)
+    """
+    a = sitk.GetArrayViewFromImage(img)
+    indices = np.nonzero(a != bg)
+    if len(indices[0]) == 0:
+        return img
+    # numpy order is z,y,x, itk order is x,y,z
+    start = [int(i.min()) for i in indices][::-1]
+    size = [int(i.max()) - s + 1 for i, s in zip(indices[::-1], start)]
+    return sitk.RegionOfInterest(img, size, start)
+
+
 def convert_ct_to_densities(ct):
     # Simple conversion from HU to g/cm^3
     densities = ct / 1000 + 1
@@ -920,24 +1372,142 @@ def apply_itk_gauss_smoothing(img, sigma):
     return gauss_filter.Execute(img)
 
 
+class ResampleCache:
+    """
+    Persistent on-disk cache of resampled images (disabled if folder is None).
+    The key is computed from the content and geometry of the source image,
+    the target geometry, the interpolator, the gaussian sigma and the unit.
+    The least recently used files are removed when the total size of the
+    cache is larger than max_size_mb.
+    """
+
+    def __init__(self, folder=None, max_size_mb=5000):
+        self.folder = folder
+        self.max_size_mb = max_size_mb
+        self.extension = ".mha"
+
+    @property
+    def enabled(self):
+        return self.folder is not None
+
+    def get_key(self, img, target, **params):
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(sitk.GetArrayViewFromImage(img)))
+        h.update(str(image_geometry(img)).encode())
+        h.update(img.GetPixelIDTypeAsString().encode())
+        h.update(str(target).encode())
+        for k in sorted(params):
+            h.update(f"{k}={params[k]}".encode())
+        return h.hexdigest()
+
+    def get_path(self, key):
+        return Path(self.folder) / f"{key}{self.extension}"
+
+    def get(self, key):
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            img = sitk.ReadImage(str(path))
+        except RuntimeError:
+            return None
+        # update the time to keep it in the cache
+        os.utime(path)
+        return img
+
+    def put(self, key, img):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.get_path(key)
+        # write in a temporary file first (other processes may read the cache)
+        tmp_path = Path(self.folder) / f"{key}.{os.getpid()}.tmp{self.extension}"
+        sitk.WriteImage(img, str(tmp_path))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        # the temporary files being written by put are ignored
+        files = []
+        for f in Path(self.folder).glob(f"*{self.extension}"):
+            if ".tmp" in f.name:
+                continue
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        total_size = sum([f[1] for f in files])
+        max_size = self.max_size_mb * 1024 * 1024
+        for _, size, f in sorted(files, key=lambda x: x[0]):
+            if total_size <= max_size:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        if not self.enabled or not os.path.exists(self.folder):
+            return
+        for f in Path(self.folder).glob(f"*{self.extension}"):
+            os.remove(f)
+
+
+# the cache folder can be set with the environment variable
+resample_cache = ResampleCache(os.environ.get("RPT_DOSI_RESAMPLE_CACHE", None))
+
+
+def resample_with_cache(img, target, resample_function, **params):
+    """
+    Call resample_function (that must return a sitk image) or read the
+    result in the resample cache if it has already been computed.
+    """
+    if not resample_cache.enabled:
+        return resample_function()
+    key = resample_cache.get_key(img, target, **params)
+    o = resample_cache.get(key)
+    if o is None:
+        o = resample_function()
+        resample_cache.put(key, o)
+    return o
+
+
 def resample_ct_like(ct: MetaImageCT, like: MetaImageBase, gaussian_sigma=None):
-    if images_have_same_domain(ct.image, like.image):
+    if metaimages_have_same_domain(ct, like):
         return ct
     o = copy.copy(ct)
-    o.image = apply_itk_gauss_smoothing(ct.image, gaussian_sigma)
-    o.image = resample_itk_image_like(
-        o.image, like.image, o.unit_default_value, linear=True
+
+    def resample():
+        img = apply_itk_gauss_smoothing(ct.image, gaussian_sigma)
+        return resample_itk_image_like(img, like.like_image(), o.unit_default_value, linear=True)
+
+    o.image = resample_with_cache(
+        ct.image,
+        like.get_geometry(),
+        resample,
+        interpolator="linear",
+        sigma=gaussian_sigma,
+        unit=ct.unit,
     )
     return o
 
 
 def resample_dose_like(dose: MetaImageDose, like: MetaImageBase, gaussian_sigma=None):
-    if images_have_same_domain(dose.image, like.image):
+    if metaimages_have_same_domain(dose, like):
         return dose
     o = copy.copy(dose)
-    o.image = apply_itk_gauss_smoothing(dose.image, gaussian_sigma)
-    o.image = resample_itk_image_like(
-        o.image, like.image, o.unit_default_value, linear=True
+
+    def resample():
+        img = apply_itk_gauss_smoothing(dose.image, gaussian_sigma)
+        return resample_itk_image_like(img, like.like_image(), o.unit_default_value, linear=True)
+
+    o.image = resample_with_cache(
+        dose.image,
+        like.get_geometry(),
+        resample,
+        interpolator="linear",
+        sigma=gaussian_sigma,
+        unit=dose.unit,
     )
     return o
 
@@ -946,27 +1516,54 @@ def resample_ct_spacing(ct: MetaImageCT, spacing, gaussian_sigma=None):
     if image_has_this_spacing(ct.image, spacing):
         return
     o = copy.copy(ct)
-    o.image = apply_itk_gauss_smoothing(ct.image, gaussian_sigma)
-    o.image = resample_itk_image_spacing(
-        o.image, spacing, o.unit_default_value, linear=True
+
+    def resample():
+        img = apply_itk_gauss_smoothing(ct.image, gaussian_sigma)
+        return resample_itk_image_spacing(img, spacing, o.unit_default_value, linear=True)
+
+    o.image = resample_with_cache(
+        ct.image,
+        ("spacing", tuple(spacing)),
+        resample,
+        interpolator="linear",
+        sigma=gaussian_sigma,
+        unit=ct.unit,
     )
     return o
 
 
+def spect_resample_cache_params(spect, gaussian_sigma):
+    params = {"interpolator": "linear", "sigma": gaussian_sigma, "unit": spect.unit}
+    if spect.unit == "SUV":
+        params["injection_activity_mbq"] = spect.injection_activity_mbq
+        params["body_weight_kg"] = spect.body_weight_kg
+    return params
+
+
 def resample_spect_like(
     spect: MetaImageSPECT, like: MetaImageBase, gaussian_sigma=None
 ):
-    if images_have_same_domain(spect.image, like.image):
+    if metaimages_have_same_domain(spect, like):
         return spect
     o = copy.copy(spect)
-    o.image = apply_itk_gauss_smoothing(spect.image, gaussian_sigma)
-    # convert to bqml and back to initial unit
-    initial_unit = o.unit
-    o.convert_to_bqml()
-    o.image = resample_itk_image_like(
-        o.image, like.image, o.unit_default_value, linear=True
+
+    def resample():
+        o.image = apply_itk_gauss_smoothing(spect.image, gaussian_sigma)
+        # convert to bqml and back to initial unit
+        initial_unit = o.unit
+        o.convert_to_bqml()
+        o.image = resample_itk_image_like(
+            o.image, like.like_image(), o.unit_default_value, linear=True
+        )
+        o.convert_to_unit(initial_unit)
+        return o.image
+
+    o.image = resample_with_cache(
+        spect.image,
+        like.get_geometry(),
+        resample,
+        **spect_resample_cache_params(spect, gaussian_sigma),
     )
-    o.convert_to_unit(initial_unit)
     return o
 
 
@@ -976,27 +1573,33 @@ def resample_spect_spacing(spect: MetaImageSPECT, spacing, gaussian_sigma=None):
     if not spect.image_is_loaded():
         spect.read()
     o = copy.copy(spect)
-    o.image = apply_itk_gauss_smoothing(spect.image, gaussian_sigma)
-    # convert to bqml and back to initial unit
-    initial_unit = o.unit
-    o.convert_to_bqml()
-    o.image = resample_itk_image_spacing(
-        o.image, spacing, o.unit_default_value, linear=True
+
+    def resample():
+        o.image = apply_itk_gauss_smoothing(spect.image, gaussian_sigma)
+        # convert to bqml and back to initial unit
+        initial_unit = o.unit
+        o.convert_to_bqml()
+        o.image = resample_itk_image_spacing(
+            o.image, spacing, o.unit_default_value, linear=True
+        )
+        o.convert_to_unit(initial_unit)
+        return o.image
+
+    o.image = resample_with_cache(
+        spect.image,
+        ("spacing", tuple(spacing)),
+        resample,
+        **spect_resample_cache_params(spect, gaussian_sigma),
     )
-    o.convert_to_unit(initial_unit)
     # take the volume into account if needed
     return o
 
 
 def resample_roi_like(roi: MetaImageROI, like: MetaImageBase):
-    if images_have_same_domain(roi.image, like.image) and images_have_same_spacing(
-        roi.image, like.image
-    ):
+    if metaimages_have_same_domain(roi, like):
         return roi
     o = copy.copy(roi)
-    o.image = resample_itk_image_like(
-        roi.image, like.image, o.unit_default_value, linear=False
-    )
+    o.image = resample_itk_mask_like(roi.image, like.like_image(), o.unit_default_value)
     return o
 
 
@@ -1085,21 +1688,21 @@ def image_roi_stats(roi, spect, ct=None, resample_like="spect"):
     spect = resample_spect_like(spect, resample_like)
     roi = resample_roi_like(roi, resample_like)
 
-    # convert to np
-    spect_a = sitk.GetArrayViewFromImage(spect.image)
-    roi_a = sitk.GetArrayViewFromImage(roi.image)
+    # convert to np (the pending unit conversion is only applied to the roi)
+    spect_a = spect.raw_array_view()
+    roi_a = roi.array_view()
 
     # select pixels
     d = roi_a == 1
-    p = spect_a[d]
+    p = spect.scaled_values(spect_a[d])
 
-    # compute stats
+    # compute stats (accumulated in float64 whatever the pixel type)
     res = {
-        "mean": float(np.mean(p)),
-        "std": float(np.std(p)),
+        "mean": float(np.mean(p, dtype=np.float64)),
+        "std": float(np.std(p, dtype=np.float64)),
         "min": float(np.min(p)),
         "max": float(np.max(p)),
-        "sum": float(np.sum(p)),
+        "sum": float(np.sum(p, dtype=np.float64)),
         "volume_cc": float(len(p) * roi.voxel_volume_cc),
     }
 
@@ -1115,6 +1718,135 @@ def image_roi_stats(roi, spect, ct=None, resample_like="spect"):
     return Box(res)
 
 
+def image_rois_sums(rois, spect):
+    """
+    Sum of the spect in each ROI (resampled like the spect), the spect must be
+    loaded. All ROIs are summed at once, in float64 (see rois_sums).
+    """
+    _, (sums,) = rois_sums(rois, spect, [spect])
+    return [float(s) for s in sums]
+
+
+def rois_voxel_indices(rois, like):
+    """
+    Resample all ROIs like the given image and gather the flat indices of
+    their voxels. All indices are concatenated, the labels array gives the
+    index of the ROI each voxel belongs to (overlapping ROIs are allowed).
+    """
+    indices = []
+    labels = []
+    for i, roi in enumerate(rois):
+        if not roi.image_is_loaded():
+            roi.read()
+        roi = resample_roi_like(roi, like)
+        roi_a = roi.array_view()
+        idx = np.flatnonzero(roi_a == 1)
+        indices.append(idx)
+        labels.append(np.full(len(idx), i, dtype=np.int64))
+    if len(indices) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(indices), np.concatenate(labels)
+
+
+def rois_sums(rois, like, images):
+    """
+    Number of voxels of each ROI and sum of each image in each ROI, for all
+    ROIs at once (one gather and one bincount per image, in float64). The
+    ROIs are resampled like the given image, the images must already be in
+    this geometry. The pending unit conversions of the images are applied.
+    """
+    n = len(rois)
+    indices, labels = rois_voxel_indices(rois, like)
+    counts = np.bincount(labels, minlength=n)
+    sums = []
+    for image in images:
+        a = image.raw_array_view().ravel()
+        values = image.scaled_values(a[indices]).astype(np.float64)
+        sums.append(np.bincount(labels, weights=values, minlength=n))
+    return counts, sums
+
+
+def labels_min_max(values, labels, n):
+    """
+    Per label min and max of the values. The values must be grouped by label
+    (as given by rois_voxel_indices). Empty labels are set to nan.
+    """
+    counts = np.bincount(labels, minlength=n)
+    v_min = np.full(n, np.nan)
+    v_max = np.full(n, np.nan)
+    non_empty = counts > 0
+    if np.any(non_empty):
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        v_min[non_empty] = np.minimum.reduceat(values, starts)
+        v_max[non_empty] = np.maximum.reduceat(values, starts)
+    return v_min, v_max
+
+
+def image_multi_roi_stats(rois, spect, ct=None, resample_like="spect"):
+    """
+    Same as image_roi_stats for a list of ROIs: the SPECT (and CT) is
+    resampled only once, and all statistics of all ROIs are computed in a
+    single pass over the gathered voxels (bincount reductions, in float64).
+    Return a dict of stats, one per ROI name.
+    """
+    m = {"spect": spect}
+    if ct is not None:
+        m["ct"] = ct
+    if resample_like not in m:
+        fatal(f"the option resample_like, must be {m}, while it is {resample_like}")
+    resample_like = m[resample_like]
+
+    if not spect.image_is_loaded():
+        spect.read()
+        spect.convert_to_bq()
+    spect = resample_spect_like(spect, resample_like)
+
+    # gather the voxels of all rois
+    n = len(rois)
+    indices, labels = rois_voxel_indices(rois, spect)
+    spect_a = spect.raw_array_view().ravel()
+    p = spect.scaled_values(spect_a[indices]).astype(np.float64)
+
+    # compute stats
+    counts = np.bincount(labels, minlength=n)
+    n_vox = np.maximum(counts, 1)
+    sums = np.bincount(labels, weights=p, minlength=n)
+    means = sums / n_vox
+    sq = np.bincount(labels, weights=np.square(p - means[labels]), minlength=n)
+    stds = np.sqrt(sq / n_vox)
+    v_min, v_max = labels_min_max(p, labels, n)
+    volumes = counts * spect.voxel_volume_cc
+
+    # for ct (densities)
+    masses = None
+    if ct is not None:
+        if not ct.image_is_loaded():
+            ct.read()
+        ct = resample_ct_like(ct, spect)
+        densities = ct.compute_densities()
+        da = densities.array_view().ravel()
+        masses = np.bincount(labels, weights=da[indices], minlength=n)
+        masses = masses * spect.voxel_volume_cc
+
+    res = {}
+    for i, roi in enumerate(rois):
+        r = {
+            "mean": float(means[i]),
+            "std": float(stds[i]),
+            "min": float(v_min[i]),
+            "max": float(v_max[i]),
+            "sum": float(sums[i]),
+            "volume_cc": float(volumes[i]),
+        }
+        if masses is not None:
+            roi.mass_g = float(masses[i])
+            roi.volume_cc = r["volume_cc"]
+            r["mass_g"] = roi.mass_g
+        res[roi.name] = r
+
+    return Box(res)
+
+
 def mhd_find_raw_file(mhd_file_path):
     with open(mhd_file_path, "r") as mhd_file:
         for line in mhd_file:
@@ -1122,6 +1854,137 @@ def mhd_find_raw_file(mhd_file_path):
                 return line.split("=")[1].strip()
 
 
+# MetaImage element types that can be memory mapped
+_mhd_element_types = {
+    "MET_CHAR": "i1",
+    "MET_UCHAR": "u1",
+    "MET_SHORT": "i2",
+    "MET_USHORT": "u2",
+    "MET_INT": "i4",
+    "MET_UINT": "u4",
+    "MET_LONG_LONG": "i8",
+    "MET_ULONG_LONG": "u8",
+    "MET_FLOAT": "f4",
+    "MET_DOUBLE": "f8",
+}
+
+# NIfTI datatype codes that can be memory mapped
+_nifti_datatypes = {
+    2: "u1",
+    4: "i2",
+    8: "i4",
+    16: "f4",
+    64: "f8",
+    256: "i1",
+    512: "u2",
+    768: "u4",
+    1024: "i8",
+    1280: "u8",
+}
+
+
+def mhd_read_header(mhd_file_path):
+    header = {}
+    with open(mhd_file_path, "r", errors="ignore") as mhd_file:
+        for line in mhd_file:
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            header[key.strip()] = value.strip()
+            # ElementDataFile is always the last field
+            if key.strip() == "ElementDataFile":
+                break
+    return header
+
+
+def mhd_mmap_layout(mhd_file_path):
+    """
+    Return (raw file path, dtype, offset) of an uncompressed mhd, or None
+    if the pixels cannot be memory mapped.
+    """
+    h = mhd_read_header(mhd_file_path)
+    if h.get("CompressedData", "False").lower() == "true":
+        return None
+    if h.get("ElementNumberOfChannels", "1") != "1":
+        return None
+    if h.get("ElementType") not in _mhd_element_types:
+        return None
+    raw = h.get("ElementDataFile")
+    if raw is None or raw in ("LOCAL", "LIST") or "%" in raw or " " in raw:
+        return None
+    raw_path = os.path.join(os.path.dirname(mhd_file_path), raw)
+    if not os.path.exists(raw_path):
+        return None
+    msb = h.get("BinaryDataByteOrderMSB", h.get("ElementByteOrderMSB", "False"))
+    order = ">" if msb.lower() == "true" else "<"
+    dtype = np.dtype(order + _mhd_element_types[h["ElementType"]])
+    offset = int(h.get("HeaderSize", 0))
+    return raw_path, dtype, offset
+
+
+def nifti_mmap_layout(nii_file_path):
+    """
+    Return (file path, dtype, offset) of an uncompressed 3D nii, or None if
+    the pixels cannot be memory mapped (scaled values, NIfTI-2, 4D, etc).
+    """
+    with open(nii_file_path, "rb") as f:
+        hdr = f.read(348)
+    if len(hdr) < 348:
+        return None
+    order = None
+    for o in ("<", ">"):
+        if struct.unpack(o + "i", hdr[0:4])[0] == 348:
+            order = o
+    if order is None:
+        return None
+    dim = struct.unpack(order + "8h", hdr[40:56])
+    datatype = struct.unpack(order + "h", hdr[70:72])[0]
+    vox_offset, scl_slope, scl_inter = struct.unpack(order + "3f", hdr[108:120])
+    if dim[0] != 3 or datatype not in _nifti_datatypes:
+        return None
+    # sitk rescales the values if needed
+    if scl_slope != 0 and (scl_slope != 1 or scl_inter != 0):
+        return None
+    dtype = np.dtype(order + _nifti_datatypes[datatype])
+    return nii_file_path, dtype, int(vox_offset)
+
+
+def read_image_mmap(file_path, header):
+    """
+    Read-only memory map (z,y,x) of the pixels of an uncompressed mhd/raw or
+    nii image, with the size of the header. Return None if not possible.
+    """
+    file_path = str(file_path)
+    if file_path.lower().endswith(".mhd"):
+        layout = mhd_mmap_layout(file_path)
+    elif file_path.lower().endswith(".nii"):
+        layout = nifti_mmap_layout(file_path)
+    else:
+        return None
+    if layout is None or len(header.size) != 3:
+        return None
+    path, dtype, offset = layout
+    shape = tuple(header.size[::-1])
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    file_size = os.path.getsize(path)
+    if offset < 0:
+        # HeaderSize = -1 means the pixels are at the end of the file
+        offset = file_size - nbytes
+    if offset < 0 or offset + nbytes > file_size:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def mmap_to_itk_image(a, header):
+    # sitk only handles native byte order
+    a = np.asarray(a, dtype=a.dtype.newbyteorder("="))
+    img = sitk.GetImageFromArray(a)
+    img.SetSpacing(header.spacing)
+    img.SetOrigin(header.origin)
+    img.SetDirection(header.direction)
+    return img
+
+
 def mhd_replace_raw(mhd_file_path, new_raw_filename):
     new_raw_filename = new_raw_filename.replace(".gz", "")
     with open(mhd_file_path, "r") as file:
@@ -1139,15 +2002,61 @@ def is_mhd_file(file_path):
     return extension.lower() == ".mhd"
 
 
+def image_data_file_paths(file_path):
+    """
+    All the files of an image: the file itself and, for a mhd, the raw file
+    (None if the mhd cannot be read or has no ElementDataFile)
+    """
+    paths = [Path(file_path)]
+    if not is_mhd_file(file_path):
+        return paths
+    try:
+        raw = mhd_find_raw_file(file_path)
+    except OSError:
+        raw = None
+    if raw is None:
+        return paths + [None]
+    raw_path = Path(os.path.dirname(file_path)) / raw
+    # special case if raw.gz (see mhd_copy_or_move)
+    if not os.path.exists(raw_path) and os.path.exists(str(raw_path) + ".gz"):
+        raw_path = Path(str(raw_path) + ".gz")
+    return paths + [raw_path]
+
+
+def image_fingerprint(image, metadata_keys=("unit", "injection_activity_mbq", "body_weight_kg")):
+    """
+    Fingerprint of an image without reading it: name, size and modification
+    time of its files, and the metadata that change the pixel values.
+    """
+    h = hashlib.sha1()
+    for path in image_data_file_paths(image.image_file_path):
+        if path is None:
+            fatal(f"Cannot find the raw file of {image.image_file_path}")
+        st = os.stat(path)
+        h.update(f"{path.name} {st.st_size} {st.st_mtime_ns}".encode())
+    for k in metadata_keys:
+        h.update(f"{k}={getattr(image, k, None)}".encode())
+    return h.hexdigest()
+
+
+def image_file_checksum(file_path, chunk_size=1 << 20):
+    """
+    sha256 of the content of all the files of the image (mhd and raw)
+    """
+    h = hashlib.sha256()
+    for path in image_data_file_paths(file_path):
+        if path is None:
+            fatal(f"Cannot find the raw file of {file_path}")
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
 def mhd_copy_or_move(mhd_path, new_mhd_path, mode="copy"):
     # get the raw file
     folder = Path(os.path.dirname(mhd_path))
     raw_path = folder / mhd_find_raw_file(mhd_path)
-    # do it
-    if mode == "copy":
-        shutil.copy(mhd_path, new_mhd_path)
-    if mode == "move":
-        shutil.move(mhd_path, new_mhd_path)
     # look for the correct raw path
     new_raw_path, _ = rhe.get_basename_and_extension(new_mhd_path)
     _, extension = rhe.get_basename_and_extension(raw_path)
@@ -1156,28 +2065,107 @@ def mhd_copy_or_move(mhd_path, new_mhd_path, mode="copy"):
     if not os.path.exists(raw_path):
         raw_path = Path(str(raw_path) + ".gz")
         new_raw_path = Path(str(new_raw_path) + ".gz")
-    # copy the raw file
+    if mode == "dry_run":
+        print(
+            f"Copy {mhd_path} + {os.path.basename(raw_path)} "
+            f"--->   {new_mhd_path} + {os.path.basename(new_raw_path)}"
+        )
+        return
+    # the mhd is modified (raw filename), so it is never linked
+    transfer_file(mhd_path, new_mhd_path, "move" if mode == "move" else "copy")
+    transfer_file(raw_path, new_raw_path, mode)
     # change the raw filename in the mhd file
-    new_raw_filename = os.path.basename(new_raw_path)
-    # do it
+    mhd_replace_raw(new_mhd_path, os.path.basename(new_raw_path))
+
+
+# modes to copy an image file (see transfer_file)
+image_transfer_modes = ["move", "copy", "link", "reflink", "symlink", "dry_run"]
+
+
+def reflink_file(source_path, dest_path):
+    """
+    Copy-on-write copy of the file (FICLONE, e.g. btrfs, xfs on linux).
+    Return False if the file system (or the os) does not support it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    ficlone = 0x40049409
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), ficlone, src.fileno())
+            ok = True
+        except OSError:
+            ok = False
+    if not ok:
+        os.remove(dest_path)
+        return False
+    shutil.copymode(source_path, dest_path)
+    return True
+
+
+def unlink_linked_image_files(file_path):
+    """
+    Remove the files of the image (and the raw of a mhd) that are symbolic
+    links or hard links (see transfer_file): writing the image then creates
+    new files and never modifies the linked source data.
+    """
+    if not os.path.lexists(file_path):
+        return
+    paths = [Path(file_path)]
+    if os.path.exists(file_path):
+        paths = image_data_file_paths(file_path)
+    for path in paths:
+        if path is None or not os.path.lexists(path):
+            continue
+        if os.path.islink(path) or os.stat(path).st_nlink > 1:
+            os.remove(path)
+
+
+def transfer_file(source_path, dest_path, mode):
+    """
+    Copy a file according to the mode:
+    - copy, move
+    - link: hard link (same file, no copy), copy if not possible
+    - reflink: copy-on-write copy, (streamed) copy if not supported
+    - symlink: symbolic link to the absolute source path, copy if not possible
+    With link and symlink, the source file must not be modified afterward.
+    The other way round, MetaImageBase.write never writes through a linked
+    file (see unlink_linked_image_files).
+    """
+    if os.path.lexists(dest_path):
+        if os.path.exists(dest_path) and os.path.samefile(source_path, dest_path):
+            return
+        # never write through an existing (linked) file
+        os.remove(dest_path)
     if mode == "copy":
-        shutil.copy(raw_path, new_raw_path)
-        mhd_replace_raw(new_mhd_path, new_raw_filename)
+        shutil.copy(source_path, dest_path)
         return
     if mode == "move":
-        shutil.move(raw_path, new_raw_path)
-        mhd_replace_raw(new_mhd_path, new_raw_filename)
+        shutil.move(source_path, dest_path)
         return
-    print(
-        f"Copy {mhd_path} + {os.path.basename(raw_path)} "
-        f"--->   {new_mhd_path} + {os.path.basename(new_raw_path)}"
-    )
+    if mode == "reflink":
+        if not reflink_file(source_path, dest_path):
+            shutil.copy(source_path, dest_path)
+        return
+    try:
+        if mode == "link":
+            os.link(source_path, dest_path)
+            return
+        if mode == "symlink":
+            os.symlink(os.path.abspath(source_path), dest_path)
+            return
+    except OSError as e:
+        rhe.warning(f"Cannot {mode} {source_path} ({e}), the file is copied")
+        shutil.copy(source_path, dest_path)
+        return
+    fatal(f'Unknown mode {mode}, available modes: {", ".join(image_transfer_modes)}')
 
 
 def copy_or_move_image(source_path, dest_path, mode):
-    modes = ["move", "copy", "dry_run"]
-    if mode not in modes:
-        fatal(f'Unknown mode {mode}, available modes: {", ".join(modes)}')
+    if mode not in image_transfer_modes:
+        fatal(f'Unknown mode {mode}, available modes: {", ".join(image_transfer_modes)}')
     src_ext = os.path.splitext(source_path)[1]
     dest_ext = os.path.splitext(dest_path)[1]
     if src_ext != dest_ext:
@@ -1186,14 +2174,20 @@ def copy_or_move_image(source_path, dest_path, mode):
         )
     if is_mhd_file(source_path):
         return mhd_copy_or_move(source_path, dest_path, mode)
-    if mode == "copy":
-        shutil.copy(source_path, dest_path)
-        # FIXME copy the json sidecar also ?
-        return
-    if mode == "move":
-        shutil.move(source_path, dest_path)
+    if mode == "dry_run":
+        print(f"(dry run) Copy {source_path}  --->   {dest_path}")
         return
-    print(f"(dry run) Copy {source_path}  --->   {dest_path}")
+    # FIXME copy the json sidecar also ?
+    transfer_file(source_path, dest_path, mode)
+
+
+def copy_or_move_images(source_paths, dest_paths, mode, max_workers=8):
+    """
+    copy_or_move_image for several images, in parallel (the files are
+    mostly copied by the os, the threads are not limited by the GIL)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda s, d: copy_or_move_image(s, d, mode), source_paths, dest_paths))
 
 
 def get_time_from_injection_h(injection_datetime, acquisition_datetime):
@@ -1,4 +1,5 @@
 import json
+import copy
 from rpt_dosi.utils import fatal, warning
 import rpt_dosi.utils as he
 from typing import Dict
@@ -9,6 +10,8 @@ class ClassWithMetaData:
     """
     Class to manage metadata, providing methods to convert to/from dict and JSON.
     The class fields that are considered as metadata are store in _metadata_fields.
+    The metadata values (and file) of the last read or write are kept to know
+    if the metadata have been modified since (see metadata_is_modified).
     """
 
     # List of attribute names to be considered as metadata
@@ -18,6 +21,8 @@ class ClassWithMetaData:
         self._debug_eq = False
         self._instance_metadata_fields: Dict[str, type] = {}
         self._info_width = 30
+        # (filepath, metadata) of the last read or write
+        self._saved_metadata = None
 
     def to_dict(self):
         """
@@ -48,12 +53,34 @@ class ClassWithMetaData:
     def save_to_json(self, filepath):
         """
         Save the metadata attributes to a JSON file.
+        The file is written atomically (temporary file then renamed).
         """
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
         try:
-            with open(filepath, 'w') as f:
+            with open(tmp_filepath, 'w') as f:
                 json.dump(self.to_dict(), f, indent=4)
+            os.replace(tmp_filepath, filepath)
         except Exception as e:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
             fatal(f"Unexpected Error while writing {filepath}: {e}")
+        self.set_metadata_saved(filepath)
+
+    def metadata_fields_dict(self):
+        # only the metadata fields (to_dict may also store other elements)
+        return ClassWithMetaData.to_dict(self)
+
+    def set_metadata_saved(self, filepath=None):
+        """
+        Consider the current metadata as the saved ones (in this file)
+        """
+        self._saved_metadata = (str(filepath), copy.deepcopy(self.metadata_fields_dict()))
+
+    def metadata_is_modified(self, filepath=None):
+        """
+        True if the metadata (or the file) are different from the last read or write
+        """
+        return self._saved_metadata != (str(filepath), self.metadata_fields_dict())
 
     def load_from_json(self, filepath):
         """
@@ -69,6 +96,7 @@ class ClassWithMetaData:
             fatal(f"Invalid JSON file: {filepath} {e}")
         except Exception as e:
             fatal(f"Unexpected Error while reading {filepath}: {e}")
+        self.set_metadata_saved(filepath)
 
     def add_metadata_field(self, key, mtype):
         all_fields = self._metadata_fields | self._instance_metadata_fields
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 from bs4 import BeautifulSoup
 import json
-from rpt_dosi.utils import find_closest_match, fatal
+from rpt_dosi.utils import NameMatcher, fatal
 from pathlib import Path
 import numpy as np
 from rpt_dosi.utils import get_data_folder
@@ -19,17 +19,38 @@ def guess_phantom_id(phantom_name):
 
 
 def guess_source_id(phantom_name, source_name):
-    sources_file = get_rpt_data_folder(phantom_name) / "opendose_sources.json"
-    with open(sources_file) as f:
-        sources = json.load(f)
-    return get_match_in_list(sources, source_name)
+    return get_opendose_list(phantom_name, "sources").match(source_name)
 
 
 def guess_isotope_id(phantom_name, isotope_name):
-    isotopes_file = get_rpt_data_folder(phantom_name) / "opendose_isotopes.json"
-    with open(isotopes_file) as f:
-        isotopes = json.load(f)
-    return get_match_in_list(isotopes, isotope_name)
+    return get_opendose_list(phantom_name, "isotopes").match(isotope_name)
+
+
+class OpendoseList:
+    """
+    List of opendose names and ids (sources or isotopes), with a NameMatcher
+    """
+
+    def __init__(self, names_list):
+        # reversed dict name -> id
+        self.ids = {list(d.values())[0]: list(d.keys())[0] for d in names_list}
+        self.matcher = NameMatcher(self.ids.keys())
+
+    def match(self, name):
+        name, _ = self.matcher.match(name)
+        return self.ids[name], name
+
+
+# opendose lists, read once per phantom
+opendose_lists = {}
+
+
+def get_opendose_list(phantom_name, list_name):
+    filename = get_rpt_data_folder(phantom_name) / f"opendose_{list_name}.json"
+    if filename not in opendose_lists:
+        with open(filename) as f:
+            opendose_lists[filename] = OpendoseList(json.load(f))
+    return opendose_lists[filename]
 
 
 def guess_phantom_and_isotope(phantom_name, isotope_name):
@@ -54,11 +75,15 @@ def get_svalue_data_filename(phantom_name, source_name, isotope_name):
     return output
 
 
+# lists given to get_match_in_list (list of {id: name}), indexed once
+matched_lists = {}
+
+
 def get_match_in_list(names_list, name):
-    rnames_list = {list(d.values())[0]: list(d.keys())[0] for d in names_list}
-    values = list(rnames_list.keys())
-    name, _ = find_closest_match(name, values)
-    return rnames_list[name], name
+    key = tuple(item for d in names_list for item in d.items())
+    if key not in matched_lists:
+        matched_lists[key] = OpendoseList(names_list)
+    return matched_lists[key].match(name)
 
 
 def web_svalues_get_driver():
@@ -185,18 +210,117 @@ def read_svalue_and_mass(phantom, roi, rad, target_roi):
     return float(svalues), float(mass)
 
 
+class SValueTable:
+    """
+    S-values (mGy/MBq/s) and masses (g) of all the regions of one phantom
+    and one isotope, read once from the opendose json files. The S-values
+    of the available sources are stored in a (n_sources, n_regions) array.
+    The regions are indexed by their lowercase names and the closest names
+    are found with the NameMatcher of the sources, so a lookup does not read
+    any file.
+    """
+
+    def __init__(self, phantom_name, isotope_name):
+        _, self.phantom_name = guess_phantom_id(phantom_name)
+        self.isotope_name = isotope_name
+        folder = get_rpt_data_folder(phantom_name)
+        with open(folder / "opendose_sources.json") as f:
+            sources = json.load(f)
+        self.region_ids = [list(d.keys())[0] for d in sources]
+        self.region_names = [list(d.values())[0] for d in sources]
+        self.region_index = {}
+        for i, name in enumerate(self.region_names):
+            self.region_index.setdefault(name.lower(), i)
+        self.masses = np.full(len(self.region_names), np.nan)
+        # source region index -> row in the svalues array
+        self.source_rows = {}
+        rows = []
+        for i, name in enumerate(self.region_names):
+            filename = get_svalue_data_filename(self.phantom_name, name, isotope_name)
+            if i in self.source_rows or not filename.exists():
+                continue
+            rows.append(self.read_source(filename))
+            self.source_rows[i] = len(rows) - 1
+        self.svalues = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.region_names))
+        # closest matches of the names (shared with guess_source_id)
+        self.sources = get_opendose_list(self.phantom_name, "sources")
+
+    def read_source(self, filename):
+        # S-value of all targets for this source, the masses are also stored
+        with open(filename, "r") as f:
+            data = json.load(f)
+        row = np.full(len(self.region_names), np.nan)
+        for d in data:
+            i = self.region_index.get(d[0].lower())
+            if i is None:
+                continue
+            # S-value (mGy/MBq/s)	Standard error	Mass (g)
+            row[i] = float(d[1])
+            self.masses[i] = float(d[3])
+        return row
+
+    def match(self, name):
+        """
+        Index of the region with the closest name (like guess_source_id)
+        """
+        _, n = self.sources.match(name)
+        return self.region_index[n.lower()]
+
+    def get_svalue_and_mass(self, roi_name, target_roi_name=None):
+        """
+        S-value of the source roi to the target roi (self-irradiation by
+        default) and mass of the target. Also return the name of the region.
+        """
+        i = self.match(roi_name)
+        j = i if target_roi_name is None else self.match(target_roi_name)
+        row = self.source_rows.get(i)
+        if row is None:
+            fatal(f"No S-value data for the source '{self.region_names[i]}' "
+                  f"({self.phantom_name}, {self.isotope_name})")
+        svalue = self.svalues[row, j]
+        if np.isnan(svalue):
+            fatal(f"Cannot find the region {self.region_names[j]} "
+                  f"for the source {self.region_names[i]}")
+        return float(svalue), float(self.masses[j]), self.region_names[i]
+
+    def get_svalues_and_masses(self, roi_names):
+        """
+        Self-irradiation S-values and masses of a list of rois, as arrays
+        """
+        values = [self.get_svalue_and_mass(name)[:2] for name in roi_names]
+        values = np.array(values, dtype=np.float64).reshape(len(roi_names), 2)
+        return values[:, 0], values[:, 1]
+
+
+# process-wide S-value tables, one per phantom and isotope
+svalue_tables = {}
+
+
+def get_svalue_table(phantom_name, isotope_name):
+    key = (phantom_name.lower(), isotope_name.lower())
+    if key not in svalue_tables:
+        svalue_tables[key] = SValueTable(phantom_name, isotope_name)
+    return svalue_tables[key]
+
+
+def get_svalue_and_mass(phantom, roi_name, rad_name, verbose=True):
+    # retrieve Svalue from the roi name
+    table = get_svalue_table(phantom, rad_name)
+    svalue, s_mass, roi_name = table.get_svalue_and_mass(roi_name)
+    if verbose:
+        print(f"Svalue of '{roi_name}' is {svalue} mGy/MBq/s and mass is {s_mass} g")
+    return svalue, s_mass
+
+
 def get_svalue_and_mass_scaling(
     phantom, roi_a, roi_name, rad_name, volume_voxel_mL, densities, verbose=True
 ):
     # retrieve Svalue from the roi name
-    _, roi_name = guess_source_id(phantom, roi_name)
-    svalue, s_mass = read_svalue_and_mass(phantom, roi_name, rad_name, roi_name)
-    if verbose:
-        print(f"Svalue of '{roi_name}' is {svalue} mGy/MBq/s and mass is {s_mass} g")
+    svalue, s_mass = get_svalue_and_mass(phantom, roi_name, rad_name, verbose)
 
     # compute mass of the current ROI
     d = densities[roi_a == 1]
-    roi_mass = np.sum(d) * volume_voxel_mL
+    roi_mass = np.sum(d, dtype=np.float64) * volume_voxel_mL
     roi_vol = len(d) * volume_voxel_mL
     if verbose:
         print(f"Mass of '{roi_name}' is {roi_mass} g")
@@ -25,7 +25,7 @@ def dilate_mask(itk_image, dilatation_mm):
 
 def tmtv_mask_cut_the_head(itk_image, mask, skull_filename, margin_mm):
     roi = sitk.ReadImage(skull_filename)
-    roi_img = rim.resample_itk_image_like(roi, itk_image, 0, linear=False)
+    roi_img = rim.resample_itk_mask_like(roi, itk_image, 0)
     roi_arr = sitk.GetArrayFromImage(roi_img)
     indices = np.argwhere(roi_arr == 1)
     most_inferior_pixel = indices[np.argmin(indices[:, 0])]
@@ -62,14 +62,14 @@ def tmtv_mask_remove_rois(itk_image, np_mask, roi_list, roi_folder="", verbose=F
         # dilate or resample first (dilatation is slow, so we apply on the smallest image)
         if roi_nb_pixels > nb_pixels:
             # check size and resample if needed
-            roi_img = rim.resample_itk_image_like(roi_img, itk_image, 0, linear=False)
+            roi_img = rim.resample_itk_mask_like(roi_img, itk_image, 0)
             # dilatation ?
             roi_img = dilate_mask(roi_img, roi["dilatation"])
         else:
             # dilatation ?
             roi_img = dilate_mask(roi_img, roi["dilatation"])
             # check size and resample if needed
-            roi_img = rim.resample_itk_image_like(roi_img, itk_image, 0, linear=False)
+            roi_img = rim.resample_itk_mask_like(roi_img, itk_image, 0)
         # update the masks
         roi_np = sitk.GetArrayViewFromImage(roi_img)
         np_mask[roi_np == 1] = 0
@@ -86,7 +86,7 @@ def tmtv_mask_keep_rois(itk_image, np_mask, roi_list, roi_folder="", verbose=Fal
             print(f"Keeping {f} (resample)")
         roi_img = sitk.ReadImage(f)
         # check size and resample if needed
-        roi_img = rim.resample_itk_image_like(roi_img, itk_image, 0, linear=False)
+        roi_img = rim.resample_itk_mask_like(roi_img, itk_image, 0)
         # update the masks
         roi_np = sitk.GetArrayViewFromImage(roi_img)
         np_mask[roi_np == 1] = 1
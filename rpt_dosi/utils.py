@@ -79,6 +79,75 @@ def find_closest_match(input_string, string_list):
     return closest_match, min_distance
 
 
+class NameMatcher:
+    """
+    Index of names to find the closest one to a query, with the same result
+    as find_closest_match (case insensitive Levenshtein distance, the first
+    name in the list for equal distances). Exact (lowercase) names are found
+    with a dict, the others with a BK-tree, and the last queries are kept in
+    a LRU cache.
+    """
+
+    def __init__(self, names, cache_size=1024):
+        self.names = list(names)
+        # lowercase name -> index of the first name
+        self._exact = {}
+        for i, name in enumerate(self.names):
+            self._exact.setdefault(name.lower(), i)
+        # BK-tree, node = (lowercase name, index, {distance: child node})
+        self._tree = None
+        for name, i in self._exact.items():
+            self._insert(name, i)
+        self._cache = collections.OrderedDict()
+        self.cache_size = cache_size
+
+    def _insert(self, name, index):
+        if self._tree is None:
+            self._tree = (name, index, {})
+            return
+        node = self._tree
+        while True:
+            d = Levenshtein.distance(name, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = (name, index, {})
+                return
+            node = child
+
+    def _search(self, name):
+        best_index, best_distance = None, float("inf")
+        nodes = [self._tree] if self._tree is not None else []
+        while nodes:
+            node = nodes.pop()
+            d = Levenshtein.distance(name, node[0])
+            if d < best_distance or (d == best_distance and node[1] < best_index):
+                best_index, best_distance = node[1], d
+            # triangle inequality: only the children in [d-best, d+best]
+            for cd, child in node[2].items():
+                if d - best_distance <= cd <= d + best_distance:
+                    nodes.append(child)
+        return best_index, best_distance
+
+    def match(self, name):
+        """
+        Return the closest name and its distance
+        """
+        q = name.lower()
+        if q in self._cache:
+            self._cache.move_to_end(q)
+            return self._cache[q]
+        i = self._exact.get(q)
+        if i is not None:
+            result = self.names[i], 0
+        else:
+            i, d = self._search(q)
+            result = (self.names[i] if i is not None else None), d
+        self._cache[q] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+
 def get_tests_folder():
     current_dir = Path(os.path.dirname(os.path.realpath(__file__)))
     folder = current_dir / ".." / "tests"
@@ -4,6 +4,7 @@
 import rpt_dosi.images as rim
 import rpt_dosi.utils as he
 import json
+import os
 
 if __name__ == "__main__":
     # folders
@@ -13,6 +14,10 @@ if __name__ == "__main__":
     print(f"Output data folder = {output_folder}")
     print()
 
+    # the exact references are compared in float64 (also in the command line)
+    rim.set_pixel_precision("float64")
+    os.environ["RPT_DOSI_PIXEL_PRECISION"] = "float64"
+
     # test
     print(f'set metadata Bq, SPECT and scaling')
     spect_input = data_folder / "spect_8.321mm.nii.gz"
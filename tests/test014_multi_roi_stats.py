@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import json
+import os
+import shutil
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test014")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    # input
+    spect_input = data_folder / "spect_8.321mm.nii.gz"
+    ct_input = data_folder / "ct_8mm.nii.gz"
+    roi_filenames = {"liver": data_folder / "rois" / "liver.nii.gz",
+                     "kidney_left": data_folder / "rois" / "kidney_left.nii.gz",
+                     "skull": data_folder / "rois" / "skull.nii.gz"}
+
+    # compare multi rois stats with one roi at a time
+    for like in ["spect", "ct"]:
+        start_test(f'multi roi stats vs single roi stats (resample like {like})')
+        ct = rim.read_ct(ct_input)
+        spect = rim.read_spect(spect_input, 'Bq')
+        rois = [rim.read_roi(f, name) for name, f in roi_filenames.items()]
+        res = rim.image_multi_roi_stats(rois, spect, ct, like)
+        ok = True
+        for name, f in roi_filenames.items():
+            spect = rim.read_spect(spect_input, 'Bq')
+            roi = rim.read_roi(f, name)
+            ref_res = rim.image_roi_stats(roi, spect, ct, like)
+            # both are accumulated in float64, only the summation order differs
+            tol = max(ref_res['max'], abs(ref_res['sum'])) * 1e-9
+            b = he.are_dicts_float_equal(ref_res, res[name], float_tolerance=tol)
+            print(f'{name}: {res[name]}')
+            ok = ok and b
+        stop_test(ok, f'Compare multi roi stats')
+
+    # cmd line with several rois
+    start_test('cmd line with several rois')
+    res_json = output_folder / "multi_roi_statistics.json"
+    rois_opt = " ".join([f"-r {f}" for f in roi_filenames.values()])
+    cmd = f"rpt_spect_roi_statistics -s {spect_input} {rois_opt} -u Bq -o {res_json}"
+    b = he.run_cmd(cmd, data_folder / "..")
+    with open(res_json, "r") as f:
+        res_cmd = json.load(f)
+    b = b and len(res_cmd) == len(roi_filenames)
+    stop_test(b, f'cmd line multi roi stats')
+
+    # the rois are named by their file basename, and are not resampled like one roi
+    start_test('cmd line with several rois, rejected options')
+    other_folder = output_folder / "other_rois"
+    os.makedirs(other_folder, exist_ok=True)
+    shutil.copy(roi_filenames["liver"], other_folder / "liver.nii.gz")
+    cmd = f"rpt_spect_roi_statistics -s {spect_input} {rois_opt} -r {other_folder / 'liver.nii.gz'} -u Bq"
+    b = not he.run_cmd(cmd, data_folder / "..")
+    cmd = f"rpt_spect_roi_statistics -s {spect_input} {rois_opt} -u Bq -l roi"
+    b = b and not he.run_cmd(cmd, data_folder / "..")
+    stop_test(b, f'duplicate roi names and --like roi are rejected')
+
+    # end
+    end_tests()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test015")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    # the rois are resampled like the spect
+    spect = sitk.ReadImage(data_folder / "spect_8.321mm.nii.gz")
+    roi_filenames = ["liver.nii.gz", "kidney_left.nii.gz", "skull.nii.gz"]
+
+    # resample plan vs sitk resampling
+    for f in roi_filenames:
+        start_test(f'resample plan vs sitk for {f}')
+        roi = sitk.ReadImage(data_folder / "rois" / f)
+        ref = rim.resample_itk_image_like(roi, spect, 0, linear=False)
+        o = rim.resample_itk_mask_like(roi, spect, 0)
+        b = rim.images_have_same_domain(ref, o)
+        b = b and np.array_equal(sitk.GetArrayViewFromImage(ref), sitk.GetArrayViewFromImage(o))
+        stop_test(b, f'Compare resampled roi {f}')
+
+    # the plan is shared by all rois with the same geometry
+    start_test(f'resample plan is reused')
+    roi = sitk.ReadImage(data_folder / "rois" / roi_filenames[0])
+    plan = rim.get_resample_plan(roi, spect)
+    b = plan is rim.get_resample_plan(roi, spect)
+    print(f'Plan is valid: {plan.is_valid}')
+    stop_test(b, f'Same plan')
+
+    # end
+    end_tests()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+import os
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test016")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    # read images
+    ct = rim.read_ct(data_folder / "ct_8mm.nii.gz")
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", 'Bq')
+
+    # reference, without cache
+    ref_spect = rim.resample_spect_like(spect, ct, 'auto')
+    ref_ct = rim.resample_ct_like(ct, spect, 'auto')
+
+    # set the cache
+    rim.resample_cache.folder = output_folder / "cache"
+    rim.resample_cache.clear()
+
+    # first time: computed and stored, second time: read in the cache
+    for i in range(2):
+        start_test(f'resample with cache (run {i})')
+        s = rim.resample_spect_like(spect, ct, 'auto')
+        c = rim.resample_ct_like(ct, spect, 'auto')
+        b = np.array_equal(sitk.GetArrayViewFromImage(s.image), sitk.GetArrayViewFromImage(ref_spect.image))
+        b = b and np.array_equal(sitk.GetArrayViewFromImage(c.image), sitk.GetArrayViewFromImage(ref_ct.image))
+        b = b and s.unit == ref_spect.unit
+        b = b and len(os.listdir(rim.resample_cache.folder)) == 2
+        stop_test(b, f'Compare with and without cache')
+
+    # another sigma is another key
+    start_test(f'resample cache key')
+    rim.resample_ct_like(ct, spect, None)
+    b = len(os.listdir(rim.resample_cache.folder)) == 3
+    stop_test(b, f'Number of cached images')
+
+    # eviction
+    start_test(f'resample cache eviction')
+    # a temporary file being written by another process is not removed
+    tmp_path = rim.resample_cache.folder / f"key.{os.getpid()}.tmp{rim.resample_cache.extension}"
+    sitk.WriteImage(ref_ct.image, str(tmp_path))
+    rim.resample_cache.max_size_mb = 0
+    rim.resample_cache.evict()
+    b = os.listdir(rim.resample_cache.folder) == [tmp_path.name]
+    os.remove(tmp_path)
+    stop_test(b, f'Cache is empty')
+
+    # end
+    end_tests()
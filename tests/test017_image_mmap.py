@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test017")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    # write uncompressed images
+    ct = rim.read_ct(data_folder / "ct_8mm.nii.gz")
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    ct.write(output_folder / "ct.mhd")
+    spect.write(output_folder / "spect.mhd")
+    spect.write(output_folder / "spect.nii")
+
+    # read with mmap, the image is not loaded in sitk
+    for f in ["ct.mhd", "spect.mhd", "spect.nii"]:
+        start_test(f"mmap reading of {f}")
+        im = rim.read_metaimage(output_folder / f, reading_mode="mmap")
+        ref = sitk.ReadImage(output_folder / f)
+        b = im.image_is_mmap() and im.image_is_loaded()
+        b = b and np.array_equal(im.array_view(), sitk.GetArrayViewFromImage(ref))
+        b = b and im.get_geometry() == rim.image_geometry(ref)
+        b = b and im.image_is_mmap()
+        stop_test(b, f"Compare mmap view and sitk image")
+
+        # load in sitk when needed
+        start_test(f"mmap image loaded in sitk {f}")
+        img = im.image
+        b = not im.image_is_mmap()
+        b = b and np.array_equal(sitk.GetArrayViewFromImage(img), sitk.GetArrayViewFromImage(ref))
+        b = b and rim.image_geometry(img) == rim.image_geometry(ref)
+        b = b and img.GetPixelID() == ref.GetPixelID()
+        stop_test(b, f"Compare loaded and sitk image")
+
+    # compressed images cannot be memory mapped, they are read
+    start_test(f"mmap reading of a compressed image")
+    im = rim.read_metaimage(data_folder / "spect_8.321mm.nii.gz", reading_mode="mmap")
+    b = not im.image_is_mmap() and im.image_is_loaded()
+    stop_test(b, f"Compressed image is read")
+
+    # roi statistics, the spect stays memory mapped
+    start_test(f"roi statistics with a mmap spect")
+    roi = rim.read_roi(data_folder / "rois" / "liver.nii.gz", "liver")
+    spect_mmap = rim.read_metaimage(output_folder / "spect.mhd", reading_mode="mmap")
+    ref_stats = rim.image_roi_stats(roi, spect)
+    stats = rim.image_roi_stats(roi, spect_mmap)
+    b = stats == ref_stats
+    print(stats)
+    multi_stats = rim.image_multi_roi_stats([roi], spect_mmap)
+    ref_multi_stats = rim.image_multi_roi_stats([roi], spect)
+    b = b and multi_stats == ref_multi_stats
+    b = b and spect_mmap.image_is_mmap()
+    b = b and spect_mmap.compute_total_activity() == spect.compute_total_activity()
+    stop_test(b, f"Compare roi statistics")
+
+    # end
+    end_tests()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import math
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test018")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    spect_input = data_folder / "spect_8.321mm.nii.gz"
+    ct_input = data_folder / "ct_8mm.nii.gz"
+
+    resampled_activities = {}
+    for precision, pixel_type in rim.pixel_precisions.items():
+        rim.set_pixel_precision(precision)
+
+        # unit conversions
+        start_test(f"convert units with {precision} pixels")
+        spect = rim.read_spect(spect_input, "Bq")
+        t1 = spect.compute_total_activity()
+        spect.convert_to_bqml()
+        b = spect.image.GetPixelID() == pixel_type
+        spect.convert_to_bq()
+        b = b and spect.image.GetPixelID() == pixel_type
+        t2 = spect.compute_total_activity()
+        b = b and math.isclose(t1, t2, rel_tol=1e-6)
+        stop_test(b, f"Pixel type {spect.image.GetPixelIDTypeAsString()}, total activity {t1} vs {t2}")
+
+        # resampling
+        start_test(f"resample with {precision} pixels")
+        ct = rim.read_ct(ct_input)
+        spect = rim.read_spect(spect_input, "Bq")
+        s = rim.resample_spect_like(spect, ct)
+        b = s.image.GetPixelID() == pixel_type
+        resampled_activities[precision] = s.compute_total_activity()
+        stop_test(b, f"Pixel type {s.image.GetPixelIDTypeAsString()}")
+
+        # densities
+        start_test(f"densities with {precision} pixels")
+        d = ct.compute_densities()
+        b = d.image.GetPixelID() == pixel_type
+        a = sitk.GetArrayViewFromImage(d.image)
+        b = b and a.min() >= 0
+        stop_test(b, f"Pixel type {d.image.GetPixelIDTypeAsString()}")
+
+    # float32 vs float64
+    start_test(f"resample float32 vs float64")
+    t1 = resampled_activities["float32"]
+    t2 = resampled_activities["float64"]
+    b = math.isclose(t1, t2, rel_tol=1e-6)
+    stop_test(b, f"Total activity {t1} vs {t2}")
+
+    # float64 images are not downcast
+    start_test(f"float64 images are not downcast")
+    rim.set_pixel_precision("float32")
+    spect = rim.read_spect(spect_input, "Bq")
+    spect.image = sitk.Cast(spect.image, sitk.sitkFloat64)
+    spect.convert_to_bqml()
+    b = spect.image.GetPixelID() == sitk.sitkFloat64
+    stop_test(b, f"Pixel type {spect.image.GetPixelIDTypeAsString()}")
+
+    # end
+    end_tests()
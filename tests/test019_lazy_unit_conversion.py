@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.images as rim
+import rpt_dosi.utils as he
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+import math
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test019")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+    print()
+
+    spect_input = data_folder / "spect_8.321mm.nii.gz"
+    roi_input = data_folder / "rois" / "liver.nii.gz"
+
+    # the conversion is only recorded
+    start_test("lazy conversion to Bq/mL")
+    spect = rim.read_spect(spect_input, "Bq")
+    raw = sitk.GetArrayFromImage(spect.image)
+    t1 = spect.compute_total_activity()
+    spect.convert_to_bqml()
+    b = np.array_equal(spect.raw_array_view(), raw)
+    b = b and math.isclose(spect.pixel_scale, 1 / spect.voxel_volume_cc)
+    b = b and spect.unit == "Bq/mL"
+    stop_test(b, f"Pixel scale is {spect.pixel_scale}")
+
+    # reductions with the pending conversion
+    start_test("total activity with a pending conversion")
+    t2 = spect.compute_total_activity()
+    b = t1 == t2 and spect.unit == "Bq/mL" and spect.pixel_scale != 1
+    stop_test(b, f"Total activity {t1} vs {t2}")
+
+    # back and forth is exactly the identity
+    start_test("convert back to Bq")
+    spect.convert_to_bq()
+    b = spect.pixel_scale == 1 and np.array_equal(spect.array_view(), raw)
+    stop_test(b, f"Pixel scale is {spect.pixel_scale}")
+
+    # the pixels are scaled when needed
+    start_test("pixels are scaled when needed")
+    spect.body_weight_kg = 70
+    spect.injection_activity_mbq = 7000
+    spect.convert_to_suv()
+    a = sitk.GetArrayViewFromImage(spect.image)
+    ref = raw / spect.voxel_volume_cc / (7000 / 70)
+    b = spect.pixel_scale == 1 and np.allclose(a, ref, rtol=1e-6)
+    t3 = spect.compute_total_activity()
+    b = b and math.isclose(t1, t3, rel_tol=1e-6)
+    stop_test(b, f"Total activity {t1} vs {t3}")
+
+    # roi statistics with the pending conversion are the same
+    start_test("roi statistics with a pending conversion")
+    roi = rim.read_roi(roi_input, "liver")
+    spect1 = rim.read_spect(spect_input, "Bq")
+    spect1.convert_to_bqml()
+    spect2 = rim.read_spect(spect_input, "Bq")
+    spect2.convert_to_bqml()
+    spect2.image = spect2.image
+    stats1 = rim.image_roi_stats(roi, spect1)
+    stats2 = rim.image_roi_stats(roi, spect2)
+    print(stats1)
+    b = stats1 == stats2 and spect1.pixel_scale != 1
+    stop_test(b, f"Compare roi statistics")
+
+    # end
+    end_tests()
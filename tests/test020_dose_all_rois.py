@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.dosimetry as rd
+import rpt_dosi.images as rim
+import rpt_dosi.opendose as rod
+import math
+import os
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def per_roi_doses(d, rois):
+    # the dose of each roi, one at a time with the voxel functions
+    ct, spect, like = d.init_resampling()
+    density_ct = ct.compute_densities()
+    spect_a = spect.array_view()
+    doses = {}
+    for roi in rois:
+        roi = rim.resample_roi_like(roi, like)
+        roi_a = roi.array_view()
+        roi.update_mass_and_volume(density_ct)
+        t = spect.time_from_injection_h
+        if d.name == "hanscheid2017":
+            dose = rd.dose_hanscheid2017(spect_a, roi_a, t, spect.voxel_volume_cc, roi.effective_time_h)
+        else:
+            svalue, mass_scaling, _, _ = rod.get_svalue_and_mass_scaling(
+                d.icrp_phantom_name, roi_a, roi.name, d.icrp_radionuclide,
+                spect.voxel_volume_cc, density_ct.array_view(), verbose=False)
+            if d.name == "madsen2018":
+                dose = rd.dose_madsen2018(spect_a, roi_a, t, svalue, mass_scaling, roi.effective_time_h)
+            else:
+                dose = rd.dose_hanscheid2018(spect_a, roi_a, t, svalue, mass_scaling)
+        doses[roi.name] = {"dose_Gy": dose, "mass_g": roi.mass_g, "volume_ml": roi.volume_cc}
+    return doses
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test020")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    spect_input = data_folder / "spect_8.321mm.nii.gz"
+    ct_input = data_folder / "ct_8mm.nii.gz"
+    oar_json = data_folder / "oar_teff.json"
+
+    # all rois at once vs one roi at a time
+    for method in ["madsen2018", "hanscheid2017", "hanscheid2018"]:
+        for like in ["spect", "ct"]:
+            start_test(f"{method} all rois at once vs one at a time (like {like})")
+            ct = rim.read_ct(ct_input)
+            spect = rim.read_spect(spect_input, "Bq")
+            spect.time_from_injection_h = 24.0
+            rois = rim.read_list_of_rois(oar_json, os.path.join(data_folder, "../"))
+            d = rd.get_dose_computation_class(method)(ct, spect)
+            d.resample_like = like
+            d.phantom = "ICRP 110 AM"
+            doses = d.run(rois)
+            ref_doses = per_roi_doses(d, rois)
+            b = True
+            for roi in rois:
+                for k in ref_doses[roi.name]:
+                    v1 = doses[roi.name][k]
+                    v2 = ref_doses[roi.name][k]
+                    ok = math.isclose(v1, v2, rel_tol=1e-6)
+                    print(f"{roi.name:<15} {k:<10} {v1:12.6f} vs {v2:12.6f} {ok}")
+                    b = b and ok
+            stop_test(b, f"Compare doses")
+
+    # end
+    end_tests()
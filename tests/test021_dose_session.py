@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.dosimetry as rd
+import rpt_dosi.images as rim
+import math
+import os
+import json
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def compare_doses(doses, ref_doses, rois):
+    b = True
+    for roi in rois:
+        for k in ref_doses[roi.name]:
+            v1 = doses[roi.name][k]
+            v2 = ref_doses[roi.name][k]
+            ok = math.isclose(v1, v2, rel_tol=1e-9)
+            print(f"{roi.name:<15} {k:<10} {v1:12.6f} vs {v2:12.6f} {ok}")
+            b = b and ok
+    return b
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test021")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    spect_input = data_folder / "spect_8.321mm.nii.gz"
+    ct_input = data_folder / "ct_8mm.nii.gz"
+    oar_json = data_folder / "oar_teff.json"
+
+    # one session for all the spect methods
+    ct = rim.read_ct(ct_input)
+    spect = rim.read_spect(spect_input, "Bq")
+    spect.time_from_injection_h = 24.0
+    rois = rim.read_list_of_rois(oar_json, os.path.join(data_folder, "../"))
+    session = rd.DoseSession(ct, spect)
+    session.resample_like = "spect"
+    session.gaussian_sigma = "auto"
+    session.phantom = "ICRP 110 AM"
+    all_doses = session.run(rois, "all")
+    with open(output_folder / "doses.json", "w") as f:
+        json.dump(all_doses, f, indent=4)
+
+    # compare with each method computed alone
+    start_test(f"all spect methods in the session")
+    b = sorted(all_doses.keys()) == sorted(["madsen2018", "hanscheid2017", "hanscheid2018"])
+    stop_test(b, f"Methods in the session: {list(all_doses.keys())}")
+    for method in all_doses:
+        start_test(f"{method} in the session vs alone")
+        ct = rim.read_ct(ct_input)
+        spect = rim.read_spect(spect_input, "Bq")
+        spect.time_from_injection_h = 24.0
+        d = rd.get_dose_computation_class(method)(ct, spect)
+        d.resample_like = "spect"
+        d.gaussian_sigma = "auto"
+        d.phantom = "ICRP 110 AM"
+        doses = d.run(rois)
+        b = compare_doses(all_doses[method], doses, rois)
+        b = b and all_doses[method].method == method
+        stop_test(b, f"Compare doses")
+
+    # subset of methods, with a dose rate
+    start_test(f"subset of the dose rate methods")
+    dose_rate = rim.read_dose(spect_input, "Gy/s")
+    dose_rate.time_from_injection_h = 24.0
+    session = rd.DoseSession(rim.read_ct(ct_input), dose_rate=dose_rate)
+    session.resample_like = "ct"
+    methods = ["hanscheid2017_dose_rate", "madsen2018_dose_rate"]
+    all_doses = session.run(rois, methods)
+    b = sorted(all_doses.keys()) == sorted(methods)
+    for method in methods:
+        d = rd.get_dose_computation_class(method)(rim.read_ct(ct_input), dose_rate)
+        d.resample_like = "ct"
+        doses = d.run(rois)
+        b = compare_doses(all_doses[method], doses, rois) and b
+    stop_test(b, f"Compare doses")
+
+    # end
+    end_tests()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.dosimetry as rd
+import rpt_dosi.images as rim
+import rpt_dosi.dvk as dvk
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+import math
+import os
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test022")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # kernel: symmetric, all the electron energy is in the kernel
+    start_test(f"lu177 dose voxel kernel")
+    spacing = (4.0, 4.0, 4.0)
+    k = dvk.dose_voxel_kernel(spacing, (10, 10, 10))
+    k2 = dvk.dose_voxel_kernel(spacing, (10, 10, 10))
+    emissions = dvk.read_dvk_emissions("lu177")
+    voxel_mass_kg = np.prod(spacing) * 1e-6
+    e = k.sum() * voxel_mass_kg / dvk.MeV_to_J
+    e_max = emissions.electrons.mean_energy_per_decay_MeV
+    e_max += sum(p.energy_MeV * p["yield"] * p.mu_en_cm / p.mu_cm for p in emissions.photons)
+    print(f"Energy in the kernel {e:.4f} MeV, electrons {emissions.electrons.mean_energy_per_decay_MeV} MeV, "
+          f"max {e_max:.4f} MeV")
+    b = emissions.electrons.mean_energy_per_decay_MeV < e < e_max
+    b = b and k is k2
+    b = b and np.argmax(k) == k.size // 2
+    b = b and math.isclose(k[10, 10, 11], k[10, 11, 10], rel_tol=0.02)
+    b = b and math.isclose(k[10, 10, 11], k[10, 10, 9], rel_tol=0.02)
+    stop_test(b, f"Kernel energy and symmetry")
+
+    # uniform activity: inside, the dose rate is the activity x the sum of the kernel
+    start_test(f"dose rate of a uniform activity")
+    a = np.ones((60, 60, 60), dtype=np.float32) * 1e6
+    img = sitk.GetImageFromArray(a)
+    img.SetSpacing(spacing)
+    sitk.WriteImage(img, output_folder / "uniform.nii.gz")
+    spect = rim.read_spect(output_folder / "uniform.nii.gz", "Bq")
+    d = dvk.DoseRateKernelConvolution(spect)
+    d.kernel_radius_mm = 40.0
+    dose_rate = d.run(output_folder / "uniform_dose_rate.nii.gz")
+    k = d.get_kernel(spacing, a.shape)
+    v = dose_rate.array_view()[30, 30, 30]
+    ref = 1e6 * k.sum()
+    print(f"Dose rate at the center {v} Gy/s, expected {ref} Gy/s")
+    b = math.isclose(v, ref, rel_tol=1e-5)
+    b = b and dose_rate.unit == "Gy/s" and dose_rate.image_type == "Dose"
+    b = b and rim.image_geometry(dose_rate.image)[1:] == rim.image_geometry(spect.image)[1:]
+    stop_test(b, f"Compare uniform dose rate")
+
+    # the dvk dose rate is an input of the dose rate methods
+    start_test(f"dose from the dvk dose rate")
+    ct = rim.read_ct(data_folder / "ct_8mm.nii.gz")
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    spect.time_from_injection_h = 24.0
+    rois = rim.read_list_of_rois(data_folder / "oar_teff.json", os.path.join(data_folder, "../"))
+    d = dvk.DoseRateKernelConvolution(spect, ct)
+    d.density_correction = True
+    dose_rate = d.run(output_folder / "dose_rate.nii.gz")
+    b = dose_rate.time_from_injection_h == 24.0
+    dm = rd.DoseMadsen2018DoseRate(ct, dose_rate)
+    dm.resample_like = "spect"
+    doses_dr = dm.run(rois)
+    dm = rd.DoseMadsen2018(ct, spect)
+    dm.resample_like = "spect"
+    dm.phantom = "ICRP 110 AM"
+    doses = dm.run(rois)
+    for roi in rois:
+        d1 = doses_dr[roi.name].dose_Gy
+        d2 = doses[roi.name].dose_Gy
+        print(f"{roi.name:<15} dvk dose rate {d1:.3f} Gy   svalue {d2:.3f} Gy")
+        # close to the s-value dose (10 to 17 % here), not only positive
+        b = b and d1 > 0 and math.isclose(d1, d2, rel_tol=0.25)
+    stop_test(b, f"Dose with the dvk dose rate")
+
+    # end
+    end_tests()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.dosimetry as dosi
+import rpt_dosi.images as rim
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import SimpleITK as sitk
+import numpy as np
+import math
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test023")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # decay
+    half_life_h = 159.528
+    decay_constant = np.log(2) / half_life_h
+
+    # series of spect: one spect with voxels washed-out at different rates
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    a = sitk.GetArrayFromImage(spect.image)
+    rng = np.random.default_rng(123)
+    teff = rng.uniform(20, 150, a.shape)
+    times = [4.0, 24.0, 96.0, 168.0]
+    spects = []
+    for t in times:
+        at = a * np.exp(-np.log(2) / teff * t) * rng.uniform(0.9, 1.1, a.shape)
+        img = sitk.GetImageFromArray(at.astype(np.float32))
+        img.CopyInformation(spect.image)
+        filename = output_folder / f"spect_{t}.nii.gz"
+        sitk.WriteImage(img, filename)
+        sp = rim.read_spect(filename, "Bq")
+        sp.time_from_injection_h = t
+        spects.append(sp)
+
+    # voxel fit
+    start_test(f"voxel tri-exponential fit")
+    tia, rmse = dosi.triexpo_fit_images(spects[::-1], decay_constant)
+    sitk.WriteImage(tia, output_folder / "tia.nii.gz")
+    sitk.WriteImage(rmse, output_folder / "rmse.nii.gz")
+    tia_a = sitk.GetArrayViewFromImage(tia)
+    rmse_a = sitk.GetArrayViewFromImage(rmse)
+    b = rim.image_geometry(tia) == rim.image_geometry(spect.image)
+
+    # compare with the scalar fit of some voxels
+    activities = np.stack([sp.array_view() for sp in spects], axis=-1).astype(np.float64)
+    voxels = np.argwhere(a > np.percentile(a, 90))[::50]
+    for v in voxels:
+        v = tuple(v)
+        ac = dosi.decay_corrected_tac(np.array(times), activities[v], decay_constant)
+        r = dosi.triexpo_fit(times, ac.copy())
+        p = dosi.triexpo_param_from_dict(r)
+        ref_tia = dosi.triexpo_integrate(decay_constant, *p)
+        ref_rmse = dosi.triexpo_rmse(np.array(times), ac, decay_constant, *p)
+        ok = math.isclose(tia_a[v], ref_tia, rel_tol=1e-5)
+        ok = ok and math.isclose(rmse_a[v], ref_rmse, rel_tol=1e-5)
+        b = b and ok
+    print(f"Compared {len(voxels)} voxels")
+    stop_test(b, f"Compare voxel fit and scalar fit")
+
+    # analytic integration
+    start_test(f"analytic integration of the tri-exponential")
+    x = np.linspace(0, 20000, 2000001)
+    y = dosi.triexpo_apply(x, decay_constant, *p)
+    num_tia = np.sum((y[1:] + y[:-1]) / 2 * np.diff(x))
+    print(f"TIA analytic {ref_tia:.2f} numerical {num_tia:.2f}")
+    b = math.isclose(ref_tia, num_tia, rel_tol=1e-4)
+    stop_test(b, f"Compare TIA")
+
+    # end
+    end_tests()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.dosimetry as dosi
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import numpy as np
+import time
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test024")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # decay
+    half_life_h = 159.528
+    decay_constant = np.log(2) / half_life_h
+
+    # simulated curves: half mono, half bi exponential
+    times = np.array([4.0, 24.0, 48.0, 96.0, 168.0])
+    rng = np.random.default_rng(42)
+    n = 20000
+    A = rng.uniform(1e5, 1e7, n)
+    k1 = -rng.uniform(0.005, 0.05, n)
+    k2 = -rng.uniform(0.2, 1.0, n)
+    mono = dosi.monoexpo_apply(times, decay_constant, A[:, np.newaxis], k1[:, np.newaxis])
+    bi = dosi.biexpo_apply(times, decay_constant, A[:, np.newaxis], k1[:, np.newaxis], k2[:, np.newaxis])
+    is_mono = np.arange(n) % 2 == 0
+    activities = np.where(is_mono[:, np.newaxis], mono, bi)
+    ref_tia = np.where(is_mono,
+                       dosi.monoexpo_integrate(decay_constant, A, k1),
+                       dosi.biexpo_integrate(decay_constant, A, k1, k2))
+
+    # exact curves: the parameters are found
+    start_test(f"fit of exact curves")
+    r = dosi.tac_fit_arrays(times, activities[:1000], decay_constant, models=["monoexpo", "biexpo"])
+    p = r.fits.monoexpo.params
+    b = np.allclose(p["A1"][is_mono[:1000]], A[:1000][is_mono[:1000]], rtol=1e-6)
+    b = b and np.allclose(p["k1"][is_mono[:1000]], k1[:1000][is_mono[:1000]], rtol=1e-6)
+    p = r.fits.biexpo.params
+    b = b and np.allclose(p["k1"][~is_mono[:1000]], k1[:1000][~is_mono[:1000]], rtol=1e-4)
+    b = b and np.allclose(p["k2"][~is_mono[:1000]], k2[:1000][~is_mono[:1000]], rtol=1e-4)
+    b = b and np.allclose(r.tia, ref_tia[:1000], rtol=1e-4)
+    stop_test(b, f"Compare parameters and time integrated activities")
+
+    # noisy curves: model selection
+    start_test(f"batched fit and model selection of {n} noisy curves")
+    noisy = activities * rng.normal(1, 0.02, activities.shape)
+    t1 = time.time()
+    r = dosi.tac_fit_arrays(times, noisy, decay_constant, criterion="aic")
+    t = time.time() - t1
+    selected = {m: int(np.sum(r.model == m)) for m in dosi.tac_models}
+    err = np.fabs(r.tia / ref_tia - 1)
+    print(f"Fit of {n} curves in {t:.2f} s, selected models {selected}")
+    print(f"Time integrated activity error: median {np.median(err) * 100:.2f} % ")
+    b = np.median(err) < 0.02
+    b = b and r.rmse.shape == (n,) and r.model.shape == (n,)
+    # not enough timepoints to select the (heuristic) tri exponential with the aic
+    b = b and selected["triexpo"] == 0
+    r2 = dosi.tac_fit_arrays(times, noisy, decay_constant, criterion="rmse")
+    stack = np.stack([r2.fits[m].rmse for m in dosi.tac_models])
+    b = b and np.allclose(r2.rmse, np.min(stack, axis=0))
+    stop_test(b, f"Model selection")
+
+    # batched fit = fit of each curve
+    start_test(f"batched fit vs one curve at a time")
+    b = True
+    for i in range(0, 100, 7):
+        ri = dosi.tac_fit_arrays(times, noisy[i], decay_constant)
+        b = b and ri.model[0] == r.model[i] and np.isclose(ri.tia[0], r.tia[i], rtol=1e-9)
+    # the tri exponential fit is the same as triexpo_fit
+    for i in range(0, 100, 7):
+        c = dosi.decay_corrected_tac(times, noisy[i], decay_constant)
+        p = dosi.triexpo_fit(times, c.copy())
+        for k in p:
+            b = b and np.isclose(p[k], r.fits.triexpo.params[k][i], rtol=1e-9)
+    stop_test(b, f"Compare batched and single fits")
+
+    # end
+    end_tests()
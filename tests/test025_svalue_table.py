@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.opendose as od
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import numpy as np
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test025")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    roi_names = ["liver", "Liver", "spleen", "left kidney", "right kidney", "Right kidney C+M+P"]
+    for phantom in ["ICRP 110 AM", "ICRP 110 AF"]:
+        phantom_name, rad_name = od.guess_phantom_and_isotope(phantom, "lu177")
+
+        # the table gives the same values as the json files
+        start_test(f"S-value table {phantom_name} {rad_name}")
+        table = od.get_svalue_table(phantom_name, rad_name)
+        b = table is od.get_svalue_table(phantom_name.upper(), rad_name)
+        for roi_name in roi_names:
+            _, source_name = od.guess_source_id(phantom_name, roi_name)
+            ref = od.read_svalue_and_mass(phantom_name, source_name, rad_name, source_name)
+            svalue, mass, name = table.get_svalue_and_mass(roi_name)
+            print(f"{roi_name:<15} {name:<20} {svalue} mGy/MBq/s {mass} g  (ref {ref})")
+            b = b and (svalue, mass) == ref and name == source_name
+        stop_test(b, f"Compare S-values and masses")
+
+        # cross irradiation and several rois at once
+        start_test(f"S-value table, cross irradiation and arrays {phantom_name}")
+        svalue, mass, name = table.get_svalue_and_mass("liver", "spleen")
+        ref = od.read_svalue_and_mass(phantom_name, "Liver", rad_name, "spleen")
+        b = (svalue, mass) == ref
+        svalues, masses = table.get_svalues_and_masses(roi_names)
+        b = b and svalues.shape == (len(roi_names),)
+        b = b and np.all(svalues == [table.get_svalue_and_mass(r)[0] for r in roi_names])
+        b = b and np.all(masses == [table.get_svalue_and_mass(r)[1] for r in roi_names])
+        stop_test(b, f"Compare S-values and masses")
+
+    # end
+    end_tests()
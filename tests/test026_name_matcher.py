@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import rpt_dosi.utils as he
+import rpt_dosi.opendose as od
+from rpt_dosi.utils import start_test, stop_test, end_tests
+import json
+import random
+import time
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test026")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    random.seed(26)
+    folder = he.get_data_folder() / "ICRP_110_AM"
+    for list_name in ["sources", "isotopes"]:
+        with open(folder / f"opendose_{list_name}.json") as f:
+            names = [list(d.values())[0] for d in json.load(f)]
+
+        # queries: names with random typos
+        queries = ["liver", "LIVER", "left kidney", "lu177", "", "zzzz"]
+        for i in range(1000):
+            q = list(random.choice(names))
+            for k in range(random.randint(0, 4)):
+                p = random.randrange(len(q) + 1)
+                r = random.random()
+                if r < 0.4:
+                    q.insert(p, random.choice("abekmr -,"))
+                elif len(q) > 0 and r < 0.7:
+                    del q[min(p, len(q) - 1)]
+                elif len(q) > 0:
+                    q[min(p, len(q) - 1)] = random.choice("xyzq")
+            queries.append("".join(q))
+
+        # same results as the linear scan
+        start_test(f"name matcher vs find_closest_match, opendose {list_name}")
+        t1 = time.time()
+        ref = [he.find_closest_match(q, names) for q in queries]
+        t1 = time.time() - t1
+        matcher = he.NameMatcher(names, cache_size=100)
+        t2 = time.time()
+        res = [matcher.match(q) for q in queries]
+        t2 = time.time() - t2
+        b = res == ref
+        # second time: from the lru cache for the last queries
+        b = b and [matcher.match(q) for q in queries[-100:]] == ref[-100:]
+        b = b and len(matcher._cache) == 100
+        print(f"{len(queries)} queries in {len(names)} names: linear {t1:.3f} s, matcher {t2:.3f} s")
+        stop_test(b, f"Compare matches")
+
+    # opendose guessers
+    start_test(f"opendose guessers")
+    b = od.guess_source_id("ICRP 110 AM", "liver") == ("264", "Liver")
+    b = b and od.guess_source_id("ICRP 110 AM", "left kidney") == ("324", "Left kidney C+M+P")
+    b = b and od.guess_isotope_id("ICRP 110 AM", "lu177")[1] == "Lu-177"
+    b = b and od.get_opendose_list("ICRP 110 AM", "sources") is od.get_opendose_list("ICRP 110 AM", "sources")
+    stop_test(b, f"Guess sources and isotopes")
+
+    # a list given by value is indexed once
+    start_test(f"opendose match in a list")
+    with open(folder / "opendose_sources.json") as f:
+        sources = json.load(f)
+    b = od.get_match_in_list(sources, "liver") == ("264", "Liver")
+    n = len(od.matched_lists)
+    matcher = od.matched_lists[tuple(item for d in sources for item in d.items())].matcher
+    b = b and od.get_match_in_list(list(sources), "left kidney") == ("324", "Left kidney C+M+P")
+    b = b and od.get_match_in_list(sources, "liver") == ("264", "Liver")
+    b = b and len(od.matched_lists) == n and "left kidney" in matcher._cache
+    stop_test(b, f"Same matcher for the same list")
+
+    # end
+    end_tests()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test027")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # create a db with several cycles and timepoints
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    db_filepath = db_folder / "db.json"
+    db = rdb.PatientTreatmentDatabase(db_filepath, create=True)
+    db.patient_id = "p27"
+    for c in range(3):
+        cycle = db.add_new_cycle(f"cycle{c}")
+        cycle.injection_datetime = "2022-08-09 10:00:00"
+        for t in range(4):
+            tp = cycle.add_new_timepoint(f"tp{t}")
+            tp.acquisition_datetime = f"2022-08-1{t} 10:00:00"
+            tp.add_image_from_file("ct", data_folder / "ct_8mm.nii.gz", image_type="CT",
+                                   filename="ct.nii.gz", mode="copy")
+            tp.add_image_from_file("spect", data_folder / "spect_8.321mm.nii.gz", image_type="SPECT",
+                                   filename="spect.nii.gz", mode="copy", unit="Bq")
+            tp.add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+    ref_dict = db.to_dict()
+
+    # open: the images and rois are not read
+    start_test(f"Open the db, images are not read")
+    db = rdb.PatientTreatmentDatabase(db_filepath)
+    tps = [tp for cycle in db.cycles.values() for tp in cycle.timepoints.values()]
+    b = all(not tp.images_are_read() for tp in tps)
+    b = b and db.number_of_images() == 24 and db.number_of_rois() == 12
+    print(db.info())
+    for tp in tps:
+        print(tp, tp.info())
+    b = b and all(not tp.images_are_read() for tp in tps)
+    b = b and db.check_files_exist()[0]
+    b = b and db.to_dict() == ref_dict
+    b = b and all(not tp.images_are_read() for tp in tps)
+    stop_test(b, f"The db is read without reading the images")
+
+    # access: the images of this timepoint only are read
+    start_test(f"Access to the images of one timepoint")
+    tp = db["cycle1"]["tp2"]
+    spect = tp.images["spect"]
+    roi = tp.get_roi("liver")
+    b = tp.images_are_read() and spect.unit == "Bq" and roi.name == "liver"
+    b = b and os.path.samefile(spect.image_file_path, db_folder / "cycle1" / "tp2" / "spect.nii.gz")
+    b = b and sum(t.images_are_read() for t in tps) == 1
+    b = b and db.to_dict() == ref_dict
+    stop_test(b, f"Images are read when accessed")
+
+    # write and read again
+    start_test(f"Write a partially read db")
+    tp.add_roi_from_file("spleen", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+    db2 = rdb.PatientTreatmentDatabase(db_filepath)
+    b = db2.number_of_rois() == 13
+    b = b and db2["cycle1"]["tp2"].get_roi("spleen").name == "spleen"
+    b = b and db2.to_dict() == db.to_dict()
+    stop_test(b, f"Compare written and read db")
+
+    # end
+    end_tests()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import glob
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def sidecars_mtimes(folder):
+    files = glob.glob(str(folder / "**" / "*.json"), recursive=True)
+    return {f: os.stat(f).st_mtime_ns for f in files}
+
+
+def changed_files(before, after):
+    return sorted(os.path.basename(os.path.dirname(f)) + "/" + os.path.basename(f)
+                  for f in after if before.get(f) != after[f])
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test028")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # create a db with several timepoints
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    db_filepath = db_folder / "db.json"
+    db = rdb.PatientTreatmentDatabase(db_filepath, create=True)
+    db.patient_id = "p28"
+    cycle = db.add_new_cycle("cycle1")
+    cycle.injection_datetime = "2022-08-09 10:00:00"
+    for t in range(5):
+        tp = cycle.add_new_timepoint(f"tp{t}")
+        tp.acquisition_datetime = f"2022-08-1{t} 10:00:00"
+        tp.add_image_from_file("spect", data_folder / "spect_8.321mm.nii.gz", image_type="SPECT",
+                               filename="spect.nii.gz", mode="copy", unit="Bq")
+        tp.add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+
+    # write without modification: only the db file is written
+    start_test(f"Write a db without modification")
+    db = rdb.PatientTreatmentDatabase(db_filepath)
+    b = not db.metadata_is_modified()
+    before = sidecars_mtimes(db_folder)
+    db.write()
+    after = sidecars_mtimes(db_folder)
+    changed = changed_files(before, after)
+    print(f"Written files: {changed}")
+    b = b and changed == ["db/db.json"]
+    stop_test(b, f"No sidecar is written")
+
+    # add one roi: only the new roi sidecar and the db are written
+    start_test(f"Add a roi and write")
+    tp = db["cycle1"]["tp3"]
+    tp.add_roi_from_file("spleen", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    before = sidecars_mtimes(db_folder)
+    db.write()
+    after = sidecars_mtimes(db_folder)
+    changed = changed_files(before, after)
+    print(f"Written files: {changed}")
+    b = changed == ["db/db.json"]
+    b = b and os.path.exists(db_folder / "cycle1" / "tp3" / "rois" / "spleen.nii.gz.json")
+    stop_test(b, f"Only the db (and the new roi) are written")
+
+    # modify one image: only this sidecar and the db are written
+    start_test(f"Modify an image and write")
+    db["cycle1"]["tp1"].images["spect"].description = "modified"
+    before = sidecars_mtimes(db_folder)
+    db.write()
+    after = sidecars_mtimes(db_folder)
+    changed = changed_files(before, after)
+    print(f"Written files: {changed}")
+    b = changed == ["db/db.json", "tp1/spect.nii.gz.json"]
+    with open(db_filepath) as f:
+        json.load(f)
+    b = b and not glob.glob(str(db_folder / "*.tmp"))
+    stop_test(b, f"Only the modified image and the db are written")
+
+    # modify a timepoint: its images are synced
+    start_test(f"Modify a timepoint and write")
+    db["cycle1"]["tp4"].acquisition_datetime = "2022-08-20 10:00:00"
+    before = sidecars_mtimes(db_folder)
+    db.write(sync_policy="db_to_image")
+    after = sidecars_mtimes(db_folder)
+    changed = changed_files(before, after)
+    print(f"Written files: {changed}")
+    b = changed == ["db/db.json", "tp4/spect.nii.gz.json"]
+    db2 = rdb.PatientTreatmentDatabase(db_filepath)
+    spect = db2["cycle1"]["tp4"].images["spect"]
+    b = b and spect.acquisition_datetime == "2022-08-20 10:00:00"
+    stop_test(b, f"The timepoint images are synced and written")
+
+    # modify the db: all images are synced
+    start_test(f"Modify the db and write")
+    db = rdb.PatientTreatmentDatabase(db_filepath)
+    db.body_weight_kg = 72.0
+    before = sidecars_mtimes(db_folder)
+    db.write()
+    after = sidecars_mtimes(db_folder)
+    changed = changed_files(before, after)
+    print(f"Written files: {changed}")
+    b = changed == ["db/db.json"] + [f"tp{t}/spect.nii.gz.json" for t in range(5)]
+    db2 = rdb.PatientTreatmentDatabase(db_filepath)
+    b = b and all(tp.images["spect"].body_weight_kg == 72.0 for tp in db2["cycle1"].timepoints.values())
+    b = b and db2["cycle1"]["tp1"].images["spect"].description == "modified"
+    b = b and db2.number_of_rois() == 6
+    b = b and db2.to_dict() == db.to_dict()
+    stop_test(b, f"All images are synced and written")
+
+    # end
+    end_tests()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import sqlite3
+import multiprocessing
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def update_timepoint(args):
+    # one worker: open the db, modify one timepoint and write
+    db_filepath, cycle_id, tp_id, i = args
+    db = rdb.PatientTreatmentDatabase(db_filepath)
+    tp = db[cycle_id][tp_id]
+    tp.acquisition_datetime = f"2022-09-{i + 1:02d} 10:00:00"
+    tp.add_metadata_field("worker", int)
+    tp.worker = i
+    db.write(sync_metadata_image=False)
+    return i
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test029")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # create a json db
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    json_filepath = db_folder / "db.json"
+    db = rdb.PatientTreatmentDatabase(json_filepath, create=True)
+    db.patient_id = "p29"
+    for c in range(2):
+        cycle = db.add_new_cycle(f"cycle{c}")
+        cycle.injection_datetime = "2022-08-09 10:00:00"
+        for t in range(6):
+            tp = cycle.add_new_timepoint(f"tp{t}")
+            tp.acquisition_datetime = f"2022-08-1{t} 10:00:00"
+            tp.add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+
+    # convert to sqlite and back to json
+    start_test(f"Convert json to sqlite and sqlite to json")
+    sqlite_filepath = db_folder / "db.sqlite"
+    db = rdb.PatientTreatmentDatabase(json_filepath)
+    db.write(sqlite_filepath)
+    db2 = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    b = db2.to_dict() == db.to_dict()
+    b = b and list(db2.cycles.keys()) == ["cycle0", "cycle1"]
+    b = b and list(db2["cycle1"].timepoints.keys()) == [f"tp{t}" for t in range(6)]
+    db2.write(db_folder / "db_export.json")
+    with open(json_filepath) as f:
+        ref = json.load(f)
+    with open(db_folder / "db_export.json") as f:
+        b = b and json.load(f) == ref
+    stop_test(b, f"Same db after conversions")
+
+    # partial update: only the modified timepoint row is written
+    start_test(f"Partial update of a timepoint")
+    db = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    db["cycle0"]["tp2"].add_roi_from_file("spleen", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+    con = sqlite3.connect(sqlite_filepath)
+    n = con.execute("SELECT COUNT(*) FROM timepoints").fetchone()[0]
+    con.close()
+    db2 = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    b = n == 12 and db2.number_of_rois() == 13 and db2.to_dict() == db.to_dict()
+    # another process has removed a timepoint: it is not written back
+    db3 = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    db3["cycle1"].timepoints.pop("tp5")
+    db3.write()
+    db["cycle0"]["tp3"].acquisition_datetime = "2022-08-30 10:00:00"
+    db.write()
+    db2 = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    b = b and "tp5" not in db2["cycle1"].timepoints
+    b = b and db2["cycle0"]["tp3"].acquisition_datetime == "2022-08-30 10:00:00"
+    stop_test(b, f"Partial updates")
+
+    # concurrent updates of different timepoints, no lost update
+    start_test(f"Concurrent updates of different timepoints")
+    tasks = [(sqlite_filepath, f"cycle{i % 2}", f"tp{i // 2}", i) for i in range(10)]
+    with multiprocessing.Pool(5) as pool:
+        r = pool.map(update_timepoint, tasks)
+    db = rdb.PatientTreatmentDatabase(sqlite_filepath)
+    b = r == list(range(10))
+    for _, cid, tid, i in tasks:
+        tp = db[cid][tid]
+        print(tp, tp.worker)
+        b = b and tp.worker == i and tp.acquisition_datetime == f"2022-09-{i + 1:02d} 10:00:00"
+    b = b and db.number_of_rois() == 12
+    stop_test(b, f"All updates are stored")
+
+    # end
+    end_tests()
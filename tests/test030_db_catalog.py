@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+import rpt_dosi.db_catalog as rdbc
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test030")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # create several patient dbs: a spect in all timepoints, liver roi in even timepoints
+    cohort_folder = output_folder / "cohort"
+    if os.path.exists(cohort_folder):
+        shutil.rmtree(cohort_folder)
+    for p in range(4):
+        db = rdb.PatientTreatmentDatabase(cohort_folder / f"p{p}" / "db.json", create=True)
+        db.patient_id = f"p{p}"
+        for c in range(2):
+            cycle = db.add_new_cycle(f"cycle{c + 1}")
+            cycle.injection_datetime = "2022-08-09 10:00:00"
+            for t in range(3):
+                tp = cycle.add_new_timepoint(f"tp{t}")
+                tp.acquisition_datetime = f"2022-08-1{t} 10:00:00"
+                tp.add_image_from_file("spect", data_folder / "spect_8.321mm.nii.gz", image_type="SPECT",
+                                       filename="spect.nii.gz", mode="copy", unit="Bq")
+                if t % 2 == 0:
+                    tp.add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy")
+        db.write()
+
+    # scan and query
+    start_test(f"Scan a cohort and query the timepoints")
+    catalog_file = output_folder / "catalog.sqlite"
+    if os.path.exists(catalog_file):
+        os.remove(catalog_file)
+    catalog = rdbc.CohortCatalog(catalog_file)
+    n = catalog.scan([cohort_folder])
+    b = n == 4 and catalog.number_of_dbs() == 4
+    tps = catalog.query_timepoints(["SPECT"], ["liver"], "cycle1")
+    print(f"Number of timepoints with SPECT and liver, cycle1: {len(tps)}")
+    b = b and len(tps) == 8
+    b = b and all(tp.cycle_id == "cycle1" and tp.timepoint_id in ["tp0", "tp2"] for tp in tps)
+    b = b and len(catalog.query_timepoints(["SPECT", "CT"])) == 0
+    b = b and len(catalog.query_timepoints(patient_id="p2")) == 6
+    images = catalog.query_images("SPECT", "Bq")
+    b = b and len(images) == 24 and all(os.path.exists(im.image_file_path) for im in images)
+    stop_test(b, f"Query the catalog")
+
+    # incremental scan
+    start_test(f"Incremental scan")
+    n = catalog.scan([cohort_folder])
+    b = n == 0
+    db = rdb.PatientTreatmentDatabase(cohort_folder / "p1" / "db.json")
+    db["cycle1"]["tp1"].add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy")
+    db.write()
+    shutil.rmtree(cohort_folder / "p3")
+    n = catalog.scan([cohort_folder])
+    b = b and n == 1 and catalog.number_of_dbs() == 3
+    tps = catalog.query_timepoints(["SPECT"], ["liver"], "cycle1")
+    b = b and len(tps) == 7
+    stop_test(b, f"Only the modified dbs are read again")
+
+    # a db that cannot be read is recorded, the other ones are indexed
+    start_test(f"Scan with a db file that cannot be read")
+    os.makedirs(cohort_folder / "p4", exist_ok=True)
+    with open(cohort_folder / "p4" / "db.json", "w") as f:
+        f.write("{ not a json db")
+    n = catalog.scan([cohort_folder])
+    errors = catalog.errors()
+    print(f"Errors: {errors}")
+    b = n == 1 and catalog.number_of_dbs() == 3 and len(errors) == 1
+    b = b and errors[0].db_path == os.path.abspath(cohort_folder / "p4" / "db.json")
+    b = b and len(catalog.query_timepoints(["SPECT"], ["liver"], "cycle1")) == 7
+    # not read again if not modified
+    b = b and catalog.scan([cohort_folder]) == 0
+    shutil.rmtree(cohort_folder / "p4")
+    b = b and catalog.scan([cohort_folder]) == 0 and len(catalog.errors()) == 0
+    stop_test(b, f"Scan with a db file that cannot be read")
+
+    # end
+    end_tests()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+import rpt_dosi.db_check as rdbck
+import rpt_dosi.images as rim
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test031")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # a db with mhd/raw images and checksums recorded at ingest
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    spect.write(output_folder / "spect.mhd")
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    cycle = db.add_new_cycle("cycle1")
+    for t in range(4):
+        tp = cycle.add_new_timepoint(f"tp{t}")
+        tp.add_image_from_file("spect", output_folder / "spect.mhd", image_type="SPECT",
+                               filename="spect.mhd", mode="copy", checksum=True)
+        tp.add_roi_from_file("liver", data_folder / "rois" / "liver.nii.gz", mode="copy", checksum=True)
+    db.write()
+
+    # check all files
+    start_test(f"Check all files with checksums")
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json")
+    report = rdbck.db_check_files(db, verify_checksums=True)
+    print(rdbck.db_check_report_str(report))
+    b = report.ok and report.number_of_files == 8 and report.number_of_checksums == 8
+    b = b and db.check_files_exist()[0]
+    stop_test(b, f"All files are ok")
+
+    # errors
+    start_test(f"Check missing raw, modified content, wrong sidecar")
+    tp_folder = db_folder / "cycle1"
+    os.remove(tp_folder / "tp1" / "spect.raw")
+    with open(tp_folder / "tp2" / "rois" / "liver.nii.gz", "ab") as f:
+        f.write(b"0")
+    with open(tp_folder / "tp3" / "spect.mhd.json", "w") as f:
+        f.write("{")
+    report = rdbck.db_check_files(db, verify_checksums=True, max_workers=4)
+    print(rdbck.db_check_report_str(report))
+    errors = {(e.timepoint_id, e.kind): e.errors for e in report.errors}
+    b = not report.ok and len(report.errors) == 3
+    b = b and "does not exist" in errors[("tp1", "image")][0]
+    b = b and "checksum" in errors[("tp2", "roi")][0]
+    b = b and "invalid json" in errors[("tp3", "image")][0]
+    b = b and not db.check_files_exist()[0]
+    # without checksums, the modified content is not detected
+    report = rdbck.db_check_files(db, check_sidecars=False)
+    b = b and len(report.errors) == 1 and report.number_of_checksums == 0
+    stop_test(b, f"All errors are reported")
+
+    # end
+    end_tests()
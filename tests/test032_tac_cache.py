@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+import rpt_dosi.images as rim
+import math
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def tacs_are_close(activities, ref_activities):
+    # the sums of all rois at once are accumulated in another order
+    return all(math.isclose(a, r, rel_tol=1e-9)
+               for roi_name in ref_activities
+               for a, r in zip(activities[roi_name], ref_activities[roi_name]))
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test032")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # a db with several timepoints (spect in Bq/mL to test the conversion)
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    roi_names = ["liver", "spleen", "kidney"]
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    cycle = db.add_new_cycle("cycle1")
+    cycle.injection_datetime = "2022-08-09 10:00:00"
+    for t in range(4):
+        tp = cycle.add_new_timepoint(f"tp{t}")
+        tp.acquisition_datetime = f"2022-08-1{t} 10:00:00"
+        spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+        spect.scale_pixels(divisor=t + 1)
+        spect.convert_to_bqml()
+        spect.write(output_folder / f"spect{t}.nii.gz")
+        tp.add_image_from_file("spect", output_folder / f"spect{t}.nii.gz", image_type="SPECT",
+                               filename="spect.nii.gz", mode="copy")
+        for roi_name in roi_names:
+            tp.add_roi_from_file(roi_name, data_folder / "rois" / f"{roi_name}.nii.gz", mode="copy")
+    db.write()
+
+    # reference: one image_roi_stats per roi
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json")
+    ref_times = {roi_name: [] for roi_name in roi_names}
+    ref_activities = {roi_name: [] for roi_name in roi_names}
+    for tp in db["cycle1"].timepoints.values():
+        spect = rim.read_spect(tp.images["spect"].image_file_path)
+        spect.convert_to_bq()
+        for roi_name in roi_names:
+            roi = rim.read_roi(tp.get_roi(roi_name).image_file_path, roi_name)
+            ref_times[roi_name].append(rim.get_time_from_injection_h(
+                "2022-08-09 10:00:00", tp.acquisition_datetime))
+            ref_activities[roi_name].append(rim.image_roi_stats(roi, spect)["sum"] / 1e6)
+
+    # compute the tac
+    start_test(f"Compute the tac in parallel")
+    t1 = time.time()
+    times, activities = rdb.compute_time_activity_curve(db["cycle1"], roi_names)
+    t1 = time.time() - t1
+    print(activities)
+    b = times == ref_times and tacs_are_close(activities, ref_activities)
+    b = b and all(tp.metadata_is_modified() for tp in db["cycle1"].timepoints.values())
+    db.write()
+    stop_test(b, f"Same tac as image_roi_stats in {t1:.3f} s")
+
+    # from the cache, the images are not read
+    start_test(f"Compute the tac from the cache")
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json")
+    t2 = time.time()
+    times, activities = rdb.compute_time_activity_curve(db["cycle1"], roi_names)
+    t2 = time.time() - t2
+    tps = list(db["cycle1"].timepoints.values())
+    b = times == ref_times and tacs_are_close(activities, ref_activities)
+    b = b and not any(tp.images["spect"].image_is_loaded() for tp in tps)
+    b = b and all(tp.images["spect"].unit == "Bq/mL" for tp in tps)
+    b = b and not any(tp.metadata_is_modified() for tp in tps)
+    stop_test(b, f"Same tac from the cache in {t2:.3f} s")
+
+    # a modified roi is computed again
+    start_test(f"Compute the tac with a modified roi")
+    tp = db["cycle1"]["tp2"]
+    shutil.copy(data_folder / "rois" / "liver.nii.gz", tp.get_roi("spleen").image_file_path)
+    times, activities = rdb.compute_time_activity_curve(db["cycle1"], roi_names)
+    b = activities["spleen"][2] == activities["liver"][2]
+    b = b and math.isclose(activities["spleen"][1], ref_activities["spleen"][1], rel_tol=1e-9)
+    spect = tp.images["spect"]
+    b = b and spect.unit == "Bq/mL" and not spect.metadata_is_modified(spect.metadata_file_path)
+    b = b and tp.metadata_is_modified() and not db["cycle1"]["tp1"].metadata_is_modified()
+    stop_test(b, f"Only the modified roi is computed again")
+
+    # end
+    end_tests()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import filecmp
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+import rpt_dosi.images as rim
+import SimpleITK as sitk
+import numpy as np
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def link_is_possible(mode, folder):
+    # hard or symbolic links may not be allowed (e.g. symlink on windows
+    # without privilege), the file is then copied (see rim.transfer_file)
+    src, dst = folder / "link_src.txt", folder / f"link_{mode}.txt"
+    with open(src, "w") as f:
+        f.write("link")
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst) if mode == "link" else os.symlink(os.path.abspath(src), dst)
+        os.remove(dst)
+        return True
+    except OSError:
+        return False
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test033")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # input images: nii.gz and mhd/raw
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    ct_input = output_folder / "ct.nii.gz"
+    shutil.copy(data_folder / "ct_8mm.nii.gz", ct_input)
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    spect.write(output_folder / "spect.mhd")
+    ref_a = sitk.GetArrayFromImage(sitk.ReadImage(output_folder / "spect.mhd"))
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    cycle = db.add_new_cycle("cycle1")
+
+    # all modes (but move)
+    for mode in ["copy", "link", "reflink", "symlink"]:
+        start_test(f"Add images with mode {mode}")
+        tp = cycle.add_new_timepoint(f"tp_{mode}")
+        tp.add_image_from_file("ct", ct_input, image_type="CT",
+                               filename="ct.nii.gz", mode=mode)
+        tp.add_image_from_file("spect", output_folder / "spect.mhd", image_type="SPECT",
+                               filename="spect.mhd", mode=mode, unit="Bq")
+        ct_path = tp.timepoint_path / "ct.nii.gz"
+        raw_path = tp.timepoint_path / "spect.raw"
+        b = filecmp.cmp(ct_path, ct_input, shallow=False)
+        b = b and filecmp.cmp(raw_path, output_folder / "spect.raw", shallow=False)
+        a = sitk.GetArrayFromImage(sitk.ReadImage(tp.timepoint_path / "spect.mhd"))
+        b = b and np.array_equal(a, ref_a)
+        # the mhd is always a new file, with the new raw filename
+        b = b and not os.path.islink(tp.timepoint_path / "spect.mhd")
+        b = b and rim.mhd_find_raw_file(tp.timepoint_path / "spect.mhd") == "spect.raw"
+        linked = os.path.samefile(raw_path, output_folder / "spect.raw")
+        linked = linked and os.path.samefile(ct_path, ct_input)
+        # with the copy fallback, the files are not linked
+        is_linked = mode in ["link", "symlink"] and link_is_possible(mode, output_folder)
+        b = b and linked == is_linked
+        b = b and os.path.islink(raw_path) == (mode == "symlink" and is_linked)
+        stop_test(b, f"Images added with mode {mode}")
+
+    # writing a linked image creates a new file, the source is not modified
+    start_test(f"Write the linked images")
+    ct_ref = sitk.GetArrayFromImage(sitk.ReadImage(ct_input))
+    b = True
+    for mode in ["link", "symlink"]:
+        tp = cycle[f"tp_{mode}"]
+        for name in ["ct", "spect"]:
+            im = tp.images[name]
+            im.read()
+            im.scale_pixels(multiplier=2.0)
+            im.write()
+        b = b and np.array_equal(sitk.GetArrayFromImage(sitk.ReadImage(ct_input)), ct_ref)
+        b = b and np.array_equal(sitk.GetArrayFromImage(sitk.ReadImage(output_folder / "spect.mhd")), ref_a)
+        a = sitk.GetArrayFromImage(sitk.ReadImage(tp.timepoint_path / "spect.mhd"))
+        b = b and np.allclose(a, ref_a * 2)
+        b = b and not os.path.islink(tp.timepoint_path / "spect.raw")
+        b = b and not os.path.samefile(tp.timepoint_path / "ct.nii.gz", ct_input)
+    stop_test(b, f"Write the linked images")
+
+    # move a mhd
+    start_test(f"Add images with mode move")
+    tp = cycle.add_new_timepoint(f"tp_move")
+    spect.write(output_folder / "spect_move.mhd")
+    tp.add_image_from_file("spect", output_folder / "spect_move.mhd", image_type="SPECT",
+                           filename="spect.mhd", mode="move", unit="Bq")
+    a = sitk.GetArrayFromImage(sitk.ReadImage(tp.timepoint_path / "spect.mhd"))
+    b = np.array_equal(a, ref_a) and not os.path.exists(output_folder / "spect_move.raw")
+    stop_test(b, f"Images added with mode move")
+
+    # several rois in parallel, the order is kept
+    start_test(f"Add rois in parallel")
+    tp = cycle["tp_link"]
+    roi_list = [{"roi_id": r, "filename": data_folder / "rois" / f"{r}.nii.gz"}
+                for r in ["liver", "spleen", "kidney", "skull"]]
+    tp.add_rois(roi_list, mode="link", checksum=True)
+    db.write()
+    db2 = rdb.PatientTreatmentDatabase(db_folder / "db.json")
+    tp = db2["cycle1"]["tp_link"]
+    b = tp.roi_names() == ["liver", "spleen", "kidney", "skull"]
+    b = b and all(os.path.samefile(p, data_folder / "rois" / f"{r}.nii.gz")
+                  for r, p in tp.roi_file_paths().items())
+    b = b and all(c is not None for c in tp.roi_checksums().values())
+    b = b and db2.check_files_exist()[0]
+    stop_test(b, f"Rois added in parallel")
+
+    # end
+    end_tests()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import random
+import rpt_dosi.utils as he
+import rpt_dosi.images as rim
+import rpt_dosi.dicom_series as rds
+import SimpleITK as sitk
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def write_ct_slices(img, folder, slopes):
+    # one dicom file per slice (stored as uint16 with slope/intercept), random names
+    a = sitk.GetArrayFromImage(img)
+    spacing = img.GetSpacing()
+    origin = img.GetOrigin()
+    study_uid, series_uid = generate_uid(), generate_uid()
+    names = list(range(a.shape[0]))
+    random.Random(34).shuffle(names)
+    for k, name in enumerate(names):
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        ds.StudyInstanceUID, ds.SeriesInstanceUID = study_uid, series_uid
+        ds.Modality = "CT"
+        ds.AcquisitionDate, ds.AcquisitionTime = "20231012", "101500.00"
+        ds.InstanceNumber = name
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [origin[0], origin[1], origin[2] + k * spacing[2]]
+        ds.PixelSpacing = [spacing[1], spacing[0]]
+        ds.SliceThickness = spacing[2]
+        ds.RescaleSlope, ds.RescaleIntercept = slopes[k], -1024
+        ds.Rows, ds.Columns = a.shape[1], a.shape[2]
+        ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+        ds.PixelRepresentation, ds.SamplesPerPixel = 0, 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        stored = np.round((a[k] + 1024) / slopes[k]).astype(np.uint16)
+        ds.PixelData = stored.tobytes()
+        pydicom.dcmwrite(os.path.join(folder, f"IM{name:04d}.dcm"), ds, write_like_original=False)
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test034")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # a dicom CT series from the test CT
+    dicom_folder = output_folder / "dicom"
+    if os.path.exists(dicom_folder):
+        shutil.rmtree(dicom_folder)
+    os.makedirs(dicom_folder)
+    ct = sitk.ReadImage(data_folder / "ct_8mm.nii.gz")
+    ct_a = np.clip(np.round(sitk.GetArrayFromImage(ct)), -1024, 3000)
+    # the slice with a slope of 2 has only even stored values
+    ct_a[3] = (ct_a[3] + 1024) // 2 * 2 - 1024
+    ct = sitk.GetImageFromArray(ct_a)
+    ct.SetSpacing((8.0, 8.0, 8.0))
+    ct.SetOrigin((-100.0, -150.0, 20.0))
+    slopes = [1] * ct_a.shape[0]
+    slopes[3] = 2
+    write_ct_slices(ct, dicom_folder, slopes)
+    files = [str(dicom_folder / f) for f in os.listdir(dicom_folder)]
+
+    # read the series
+    start_test(f"Read the dicom series (sorted slices, rescale, geometry)")
+    img = rds.read_dicom_series(files)
+    a = sitk.GetArrayFromImage(img)
+    b = a.dtype == np.float32 and np.array_equal(a, ct_a)
+    b = b and np.allclose(img.GetSpacing(), ct.GetSpacing())
+    b = b and np.allclose(img.GetOrigin(), ct.GetOrigin())
+    b = b and np.allclose(img.GetDirection(), ct.GetDirection())
+    stop_test(b, f"Read the dicom series")
+
+    # convert to a CT metaimage
+    start_test(f"Convert the dicom series to a CT metaimage")
+    output = output_folder / "ct.mhd"
+    rds.convert_dicom_series_to_metaimage(files, output, "CT")
+    ct2 = rim.read_metaimage(output)
+    b = isinstance(ct2, rim.MetaImageCT) and ct2.unit == "HU"
+    b = b and ct2.acquisition_datetime == "2023-10-12 10:15:00"
+    b = b and np.array_equal(ct2.array_view(), ct_a)
+    stop_test(b, f"Convert the dicom series to a CT metaimage")
+
+    # end
+    end_tests()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.images as rim
+import rpt_dosi.db as rdb
+import rpt_dosi.dicom_series as rds
+import SimpleITK as sitk
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def write_nm_dicom(img, filename, acquisition_time, slope):
+    # a reconstructed multi-frame NM dicom, in Bq/mL
+    a = sitk.GetArrayFromImage(img)
+    spacing = img.GetSpacing()
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.20"
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.StudyInstanceUID, ds.SeriesInstanceUID = generate_uid(), generate_uid()
+    ds.Modality = "NM"
+    ds.Units = "BQML"
+    ds.AcquisitionDate, ds.AcquisitionTime = "20231013", acquisition_time
+    detector = Dataset()
+    detector.ImagePositionPatient = list(img.GetOrigin())
+    detector.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.DetectorInformationSequence = Sequence([detector])
+    radiopharmaceutical = Dataset()
+    radiopharmaceutical.Radiopharmaceutical = "LU177"
+    radiopharmaceutical.RadionuclideTotalDose = "7257.5"
+    radiopharmaceutical.RadiopharmaceuticalStartDateTime = "20231012100400"
+    ds.RadiopharmaceuticalInformationSequence = Sequence([radiopharmaceutical])
+    ds.PixelSpacing = [spacing[1], spacing[0]]
+    ds.SpacingBetweenSlices = spacing[2]
+    ds.RescaleSlope, ds.RescaleIntercept = slope, 0
+    ds.NumberOfFrames = a.shape[0]
+    ds.Rows, ds.Columns = a.shape[1], a.shape[2]
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+    ds.PixelRepresentation, ds.SamplesPerPixel = 0, 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.PixelData = np.round(a / slope).astype(np.uint16).tobytes()
+    pydicom.dcmwrite(filename, ds, write_like_original=False)
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test035")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # two NM dicom from the test spect (in Bq/mL)
+    spect = rim.read_spect(data_folder / "spect_8.321mm.nii.gz", "Bq")
+    spect.convert_to_unit("Bq/mL")
+    slope = float(spect.array_view().max()) / 60000
+    a = np.round(spect.array_view() / slope) * slope
+    img = sitk.GetImageFromArray(a.astype(np.float32))
+    img.CopyInformation(spect.image)
+    acquisition_times = ["101500", "141500"]
+    jobs = []
+    for i, t in enumerate(acquisition_times):
+        write_nm_dicom(img, output_folder / f"nm_{i}.dcm", t, slope)
+        jobs.append(([str(output_folder / f"nm_{i}.dcm")], output_folder / f"spect_{i}.mhd"))
+
+    # convert in parallel
+    start_test(f"Convert NM dicom to SPECT with the metadata")
+    done = dict(rds.iter_convert_nm_dicoms_to_spects(jobs, max_workers=2))
+    b = sorted(done.keys()) == [0, 1]
+    for i, t in enumerate(acquisition_times):
+        s = rim.read_metaimage(output_folder / f"spect_{i}.mhd")
+        b = b and isinstance(s, rim.MetaImageSPECT) and s.unit == "Bq/mL"
+        b = b and s.injection_activity_mbq == 7257.5
+        b = b and s.injection_datetime == "2023-10-12 10:04:00"
+        b = b and s.acquisition_datetime == f"2023-10-13 {t[0:2]}:{t[2:4]}:{t[4:6]}"
+        b = b and np.allclose(s.array_view(), a, rtol=1e-5)
+        b = b and rim.images_have_same_domain(s.image, img)
+    stop_test(b, f"Convert NM dicom to SPECT")
+
+    # in a db
+    start_test(f"Add the SPECT to a db timepoint")
+    db_folder = output_folder / "db"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    tp = db.add_new_cycle("cycle1").add_new_timepoint("tp1")
+    tp.add_image_from_file("spect", output_folder / "spect_0.mhd", filename="spect.mhd",
+                           mode="move")
+    db.write()
+    tp = rdb.PatientTreatmentDatabase(db_folder / "db.json")["cycle1"]["tp1"]
+    b = tp.images["spect"].injection_activity_mbq == 7257.5
+    b = b and tp.images["spect"].acquisition_datetime == "2023-10-13 10:15:00"
+    stop_test(b, f"Add the SPECT to a db timepoint")
+
+    # end
+    end_tests()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import rpt_dosi.utils as he
+import rpt_dosi.db as rdb
+import SimpleITK as sitk
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def new_dataset(modality, series_uid, acquisition_time, a):
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.StudyInstanceUID, ds.SeriesInstanceUID = series_uid, series_uid
+    ds.Modality = modality
+    ds.AcquisitionDate, ds.AcquisitionTime = "20231013", acquisition_time
+    ds.PixelSpacing = [8.0, 8.0]
+    ds.Rows, ds.Columns = a.shape[-2], a.shape[-1]
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+    ds.PixelRepresentation, ds.SamplesPerPixel = 0, 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    return ds
+
+
+def write_ct(a, folder, prefix, acquisition_time):
+    series_uid = generate_uid()
+    for k in range(a.shape[0]):
+        ds = new_dataset("CT", series_uid, acquisition_time, a)
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [0, 0, k * 8.0]
+        ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+        ds.PixelData = (a[k] + 1024).astype(np.uint16).tobytes()
+        pydicom.dcmwrite(os.path.join(folder, f"{prefix}_{k:03d}.dcm"), ds, write_like_original=False)
+    return os.path.join(folder, f"{prefix}_000.dcm")
+
+
+def write_nm(a, folder, prefix, acquisition_time):
+    ds = new_dataset("NM", generate_uid(), acquisition_time, a)
+    ds.Units = "BQML"
+    detector = Dataset()
+    detector.ImagePositionPatient = [0, 0, 0]
+    detector.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.DetectorInformationSequence = Sequence([detector])
+    radiopharmaceutical = Dataset()
+    radiopharmaceutical.Radiopharmaceutical = "LU177"
+    radiopharmaceutical.RadionuclideTotalDose = "7400"
+    radiopharmaceutical.RadiopharmaceuticalStartDateTime = "20231012100400"
+    ds.RadiopharmaceuticalInformationSequence = Sequence([radiopharmaceutical])
+    ds.SpacingBetweenSlices = 8.0
+    ds.NumberOfFrames = a.shape[0]
+    ds.PixelData = a.astype(np.uint16).tobytes()
+    filepath = os.path.join(folder, f"{prefix}.dcm")
+    pydicom.dcmwrite(filepath, ds, write_like_original=False)
+    return filepath
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test036")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    # a flat dicom folder with one CT and one NM per timepoint (2 cycles, 2 timepoints)
+    dicom_folder = output_folder / "dicom"
+    db_folder = output_folder / "db"
+    for f in [dicom_folder, db_folder]:
+        if os.path.exists(f):
+            shutil.rmtree(f)
+    os.makedirs(dicom_folder)
+    ct_a = np.clip(np.round(sitk.GetArrayFromImage(sitk.ReadImage(data_folder / "ct_8mm.nii.gz"))),
+                   -1024, 3000)
+    spect_a = np.arange(ct_a.size).reshape(ct_a.shape) % 1000
+    selection = []
+    for c in ["cycle1", "cycle2"]:
+        for i, t in enumerate(["tp1", "tp2"]):
+            time = f"1{i}1500"
+            filepath = write_ct(ct_a, dicom_folder, f"{c}_{t}_ct", time)
+            selection.append({"cycle_id": c, "tp_id": t, "name": "ct", "modality": "CT",
+                              "filepath": filepath})
+            filepath = write_nm(spect_a, dicom_folder, f"{c}_{t}_nm", time)
+            selection.append({"cycle_id": c, "tp_id": t, "name": "spect", "modality": "NM",
+                              "filepath": filepath})
+    # a series that is not selected
+    filepath = write_nm(spect_a, dicom_folder, "other_nm", "170000")
+    selection.append({"cycle_id": "", "tp_id": "", "name": "", "modality": "NM",
+                      "filepath": filepath})
+    with open(output_folder / "selection.json", "w") as f:
+        json.dump(selection, f, indent=4)
+
+    # import with the command line
+    start_test(f"Import the selected dicom series in the db")
+    cmd = f"rpt_dicom_db -i {output_folder / 'selection.json'} --db {db_folder / 'db.json'} -j 4"
+    b = he.run_cmd(cmd, data_folder / "..")
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json")
+    b = b and list(db.cycles.keys()) == ["cycle1", "cycle2"] and db.number_of_images() == 8
+    for cycle in db.cycles.values():
+        b = b and cycle.injection_datetime == "2023-10-12 10:04:00"
+        b = b and list(cycle.timepoints.keys()) == ["tp1", "tp2"]
+        for i, tp in enumerate(cycle.timepoints.values()):
+            b = b and tp.acquisition_datetime == f"2023-10-13 1{i}:15:00"
+            b = b and sorted(tp.images.keys()) == ["ct", "spect"]
+            ct = tp.images["ct"]
+            ct.read()
+            b = b and ct.unit == "HU" and np.array_equal(ct.array_view(), ct_a)
+            spect = tp.images["spect"]
+            spect.read()
+            b = b and spect.unit == "Bq/mL" and spect.injection_activity_mbq == 7400
+            b = b and np.array_equal(spect.array_view(), spect_a)
+    b = b and db.check_files_exist()[0]
+    # no temporary files left
+    b = b and sorted(os.listdir(db_folder)) == ["cycle1", "cycle2", "db.json"]
+    stop_test(b, f"Import the selected dicom series in the db")
+
+    # a series that cannot be converted: the images already moved are removed
+    start_test(f"Failed import of dicom series, then import again")
+    filepath = write_nm(spect_a, dicom_folder, "truncated_nm", "170000")
+    ds = pydicom.dcmread(filepath)
+    ds.PixelData = ds.PixelData[:100]
+    pydicom.dcmwrite(filepath, ds, write_like_original=False)
+    db_folder = output_folder / "db2"
+    if os.path.exists(db_folder):
+        shutil.rmtree(db_folder)
+    good = [s for s in selection if s["cycle_id"] == "cycle1" and s["tp_id"] == "tp1"]
+    bad = good + [{"cycle_id": "cycle1", "tp_id": "tp2", "name": "spect", "modality": "NM",
+                   "filepath": filepath}]
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    try:
+        # one process: the good series are converted and moved before the failure
+        db.add_images_from_dicom(bad, max_workers=1)
+        b = False
+    except BaseException as e:
+        print(f"Expected failure: {e!r}")
+        b = True
+    files = [f for _, _, fs in os.walk(db_folder) for f in fs]
+    b = b and files == ["db.json"] and db.number_of_images() == 0
+    db = rdb.PatientTreatmentDatabase(db_folder / "db.json", create=True)
+    db.add_images_from_dicom(good, max_workers=1)
+    db.write()
+    b = b and db.number_of_images() == 2 and db.check_files_exist()[0]
+    stop_test(b, f"Failed import of dicom series, then import again")
+
+    # end
+    end_tests()
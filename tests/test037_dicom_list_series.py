@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import pydicom
+import rpt_dosi.utils as he
+import rpt_dosi.dicom_utils as rdicom
+import SimpleITK as sitk
+import numpy as np
+from collections import defaultdict
+from test034_dicom_series import write_ct_slices
+from test035_dicom_spect import write_nm_dicom
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def write_dicom_tree(data_folder, dicom_folder):
+    # two CT series, two NM (multi-frame) and a file that is not a dicom
+    if os.path.exists(dicom_folder):
+        shutil.rmtree(dicom_folder)
+    ct = sitk.ReadImage(data_folder / "ct_8mm.nii.gz")
+    ct = sitk.GetImageFromArray(np.clip(np.round(sitk.GetArrayFromImage(ct)), -1024, 3000))
+    ct.SetSpacing((8.0, 8.0, 8.0))
+    for i in range(2):
+        os.makedirs(dicom_folder / f"ct{i}")
+        write_ct_slices(ct, dicom_folder / f"ct{i}", [1] * ct.GetSize()[2])
+    spect = sitk.ReadImage(data_folder / "spect_8.321mm.nii.gz")
+    os.makedirs(dicom_folder / "nm")
+    for i, t in enumerate(["101500", "141500"]):
+        write_nm_dicom(spect, dicom_folder / "nm" / f"nm_{i}.dcm", t, 1.0)
+    with open(dicom_folder / "nm" / "not_a_dicom.dcm", "w") as f:
+        f.write("not a dicom file")
+
+
+def list_dicom_studies_and_series_full_read(directory):
+    # reference: read the whole file
+    studies = defaultdict(lambda: defaultdict(list))
+    for filepath in rdicom.list_dicom_files(directory):
+        try:
+            ds = pydicom.dcmread(filepath)
+        except Exception:
+            continue
+        info = rdicom.store_dicom_information(ds)
+        info["filepath"] = filepath
+        studies[ds.StudyInstanceUID][ds.SeriesInstanceUID].append(info)
+    return studies
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test037")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    dicom_folder = output_folder / "dicom"
+    write_dicom_tree(data_folder, dicom_folder)
+    ref = json.dumps(list_dicom_studies_and_series_full_read(dicom_folder))
+
+    # read only the header tags, in this process and with a pool of processes
+    for max_workers in [1, None]:
+        start_test(f"List the series, header only, max_workers={max_workers}")
+        studies = rdicom.list_dicom_studies_and_series(dicom_folder, max_workers)
+        b = json.dumps(studies) == ref
+        n_series = sum(len(series) for series in studies.values())
+        b = b and len(studies) == 4 and n_series == 4
+        nm = [s[0] for st in studies.values() for s in st.values() if s[0]["modality"] == "NM"]
+        b = b and len(nm) == 2
+        for info in nm:
+            b = b and info["injection"]["radionuclide"] == "LU177"
+            b = b and info["injection"]["activity_MBq"] == 7257.5
+            b = b and info["injection"]["datetime"] == "2023-10-12 10:04:00"
+        stop_test(b, f"List the series, header only, max_workers={max_workers}")
+
+    # end
+    end_tests()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import rpt_dosi.utils as he
+import rpt_dosi.dicom_utils as rdicom
+from test037_dicom_list_series import write_dicom_tree
+from rpt_dosi.utils import start_test, stop_test, end_tests
+
+
+def sorted_studies(studies):
+    # same structure, files sorted by path
+    return json.dumps({study_uid: {series_uid: sorted(files, key=lambda f: os.path.normpath(f["filepath"]))
+                                   for series_uid, files in sorted(series.items())}
+                       for study_uid, series in sorted(studies.items())})
+
+
+if __name__ == "__main__":
+    # folders
+    data_folder, ref_folder, output_folder = he.get_tests_folders("test038")
+    print(f"Input data folder = {data_folder}")
+    print(f"Ref data folder = {ref_folder}")
+    print(f"Output data folder = {output_folder}")
+
+    dicom_folder = output_folder / "dicom"
+    write_dicom_tree(data_folder, dicom_folder)
+    n_files = len(rdicom.list_dicom_files(dicom_folder))
+
+    # first update: all files are read (also the one that is not a dicom)
+    start_test(f"Create the dicom index")
+    index = rdicom.DicomIndex(dicom_folder, max_workers=2)
+    b = os.path.dirname(index.index_filename) == str(dicom_folder)
+    b = b and index.update() == (n_files, 0)
+    stop_test(b, f"Create the dicom index")
+
+    # second update: nothing to read
+    start_test(f"Update the dicom index, no modified file")
+    b = rdicom.DicomIndex(dicom_folder, max_workers=2).update() == (0, 0)
+    stop_test(b, f"Update the dicom index, no modified file")
+
+    # only the modified file is read
+    start_test(f"Update the dicom index, one modified file")
+    filepath = dicom_folder / "nm" / "nm_0.dcm"
+    st = os.stat(filepath)
+    os.utime(filepath, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+    b = index.update() == (1, 0)
+    b = b and index.update() == (0, 0)
+    stop_test(b, f"Update the dicom index, one modified file")
+
+    # the deleted file is removed from the index
+    start_test(f"Update the dicom index, one deleted file")
+    os.remove(dicom_folder / "ct0" / "IM0000.dcm")
+    b = index.update() == (0, 1)
+    n_ct0 = [len(files) for series in index.studies().values()
+             for files in series.values() if os.path.dirname(files[0]["filepath"]).endswith("ct0")]
+    b = b and len(n_ct0) == 1 and n_ct0[0] == len(os.listdir(dicom_folder / "ct0"))
+    stop_test(b, f"Update the dicom index, one deleted file")
+
+    # same studies as the scan without index
+    start_test(f"Compare the dicom index with the scan of the folder")
+    ref = rdicom.list_dicom_studies_and_series(dicom_folder, max_workers=1)
+    b = sorted_studies(index.studies()) == sorted_studies(ref)
+    b = b and sorted_studies(rdicom.dicom_index_studies(dicom_folder)) == sorted_studies(ref)
+    stop_test(b, f"Compare the dicom index with the scan of the folder")
+
+    # end
+    end_tests()